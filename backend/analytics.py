@@ -0,0 +1,242 @@
+import gc
+from datetime import date
+from typing import Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from archive import attendance_archive
+from holidays import holiday_calendar
+from models import Employee
+
+# SQLite julianday() of 0001-01-01 is 1721425.5, which is date.toordinal() == 1.
+JULIAN_ORDINAL_OFFSET = 1721424.5
+# date(1970, 1, 1).toordinal(), to turn ordinals into numpy datetime64[D].
+EPOCH_ORDINAL = 719163
+
+LATE_AFTER_MINUTES = 8 * 60 + 15
+STANDARD_DAY_HOURS = 8.0
+
+
+class AttendanceFrame:
+    """
+    Attendance rows for a date range held as parallel column arrays.
+    Row i belongs to employee emails[employee[i]].
+    """
+
+    __slots__ = (
+        "emails", "names", "departments", "start", "end",
+        "employee", "day", "minutes_in", "minutes_out", "hours", "present",
+        "holidays",
+    )
+
+    def __len__(self):
+        return len(self.employee)
+
+    @property
+    def employee_count(self) -> int:
+        return len(self.emails)
+
+
+def load_attendance(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> AttendanceFrame:
+    """
+    Load attendance between start and end (inclusive) in one query.
+    Every employee on the roster gets an index, including those with no rows.
+    """
+    sql = """
+        SELECT employee_email,
+               CAST(julianday(date) - ? AS INTEGER),
+               coalesce(minutes_in, -1),
+               coalesce(minutes_out, -1),
+               coalesce(total_hours, 0.0),
+               status = 'present'
+        FROM attendance
+        WHERE date >= ? AND date <= ?
+    """
+    params = (
+        JULIAN_ORDINAL_OFFSET,
+        start.isoformat() if start else "0000-00-00",
+        end.isoformat() if end else "9999-99-99",
+    )
+    # Plain DB-API tuples: wrapping a million rows in ORM/Row objects costs
+    # more than the query itself.
+    cursor = db.connection().connection.cursor()
+    try:
+        rows = cursor.execute(sql, params).fetchall()
+    finally:
+        cursor.close()
+
+    frame = AttendanceFrame()
+    frame.emails, frame.names, frame.departments = [], [], []
+    index = {}
+    for email, name, department in db.query(Employee.email, Employee.name, Employee.department):
+        index[email] = len(frame.emails)
+        frame.emails.append(email)
+        frame.names.append(name)
+        frame.departments.append(department or "Unknown")
+
+    gc.disable()
+    try:
+        columns = list(zip(*rows)) if rows else [()] * 6
+    finally:
+        gc.enable()
+    emails, days, minutes_in, minutes_out, hours, present = columns
+
+    employee = np.empty(len(rows), dtype=np.int32)
+    for i, email in enumerate(emails):
+        idx = index.get(email)
+        employee[i] = idx if idx is not None else _add_off_roster(frame, index, email)
+
+    frame.employee = employee
+    frame.day = np.array(days, dtype=np.int32)
+    frame.minutes_in = np.array(minutes_in, dtype=np.int16)
+    frame.minutes_out = np.array(minutes_out, dtype=np.int16)
+    frame.hours = np.array(hours, dtype=np.float64)
+    frame.present = np.array(present, dtype=bool)
+    for year in attendance_archive.years_between(start, end):
+        _append_archived(frame, index, attendance_archive.segment(year), start, end)
+    # An open-ended range stops at the first/last recorded day.
+    seen = frame.day if len(frame) else np.array([date.today().toordinal()])
+    frame.start = start.toordinal() if start else int(seen.min())
+    frame.end = max(end.toordinal() if end else int(seen.max()), frame.start)
+    frame.holidays = np.array(
+        [day for day, _ in holiday_calendar.between(db, date.fromordinal(frame.start), date.fromordinal(frame.end))],
+        dtype="datetime64[D]",
+    )
+    return frame
+
+
+def _add_off_roster(frame: AttendanceFrame, index: dict, email: str) -> int:
+    """Index for attendance belonging to someone no longer on the roster."""
+    idx = index[email] = len(frame.emails)
+    frame.emails.append(email)
+    frame.names.append(email.split("@")[0].replace(".", " ").title())
+    frame.departments.append("Unknown")
+    return idx
+
+
+def _append_archived(frame: AttendanceFrame, index: dict, segment, start: Optional[date], end: Optional[date]):
+    """Add a year's archived rows to the frame, except where the attendance table has the same employee and day."""
+    columns = segment.columns_between(start or date.min, end or date.max)
+    if not len(columns["id"]):
+        return
+    to_frame = np.empty(len(segment.emails), dtype=np.int32)
+    for i, email in enumerate(segment.emails):
+        idx = index.get(email)
+        to_frame[i] = idx if idx is not None else _add_off_roster(frame, index, email)
+    employee = to_frame[columns["employee"]]
+
+    def keys(employee, day):
+        return (employee.astype(np.int64) << 32) | day.astype(np.int64)
+
+    keep = ~np.isin(keys(employee, columns["day"]), keys(frame.employee, frame.day))
+    present = np.array([status == "present" for status in segment.statuses], dtype=bool)
+    frame.employee = np.concatenate([frame.employee, employee[keep]])
+    frame.day = np.concatenate([frame.day, columns["day"][keep]])
+    frame.minutes_in = np.concatenate([frame.minutes_in, columns["minutes_in"][keep]])
+    frame.minutes_out = np.concatenate([frame.minutes_out, columns["minutes_out"][keep]])
+    frame.hours = np.concatenate([frame.hours, np.nan_to_num(columns["total_hours"][keep])])
+    frame.present = np.concatenate([frame.present, present[columns["status"][keep]]])
+
+
+def _per_employee(frame: AttendanceFrame, weights=None) -> np.ndarray:
+    return np.bincount(frame.employee, weights=weights, minlength=frame.employee_count)
+
+
+def longest_absence_streaks(frame: AttendanceFrame) -> np.ndarray:
+    """Longest run of working days (weekdays that aren't public holidays) in the frame's range with no clock-in, per employee."""
+    streaks = np.zeros(frame.employee_count, dtype=np.int64)
+    start = np.datetime64(frame.start - EPOCH_ORDINAL, "D")
+    end = np.datetime64(frame.end - EPOCH_ORDINAL + 1, "D")
+    # Employees who never clocked in were absent for the whole range.
+    streaks[:] = np.busday_count(start, end, holidays=frame.holidays)
+
+    attended = frame.minutes_in >= 0
+    employee = frame.employee[attended]
+    if not len(employee):
+        return streaks
+    days = (frame.day[attended] - EPOCH_ORDINAL).astype("datetime64[D]")
+
+    order = np.lexsort((days, employee))
+    employee, days = employee[order], days[order]
+    first = np.ones(len(employee), dtype=bool)
+    first[1:] = employee[1:] != employee[:-1]
+    last = np.ones(len(employee), dtype=bool)
+    last[:-1] = first[1:]
+
+    # Working days strictly between consecutive attended days (or the range edges).
+    previous = np.where(first, start, np.roll(days, 1) + 1)
+    gaps = np.busday_count(previous, days, holidays=frame.holidays)
+    trailing = np.busday_count(days[last] + 1, end, holidays=frame.holidays)
+
+    streaks[np.unique(employee)] = 0
+    np.maximum.at(streaks, employee, gaps)
+    np.maximum.at(streaks, employee[last], trailing)
+    return streaks
+
+
+def employee_summary(frame: AttendanceFrame, late_after: int = LATE_AFTER_MINUTES,
+                     standard_hours: float = STANDARD_DAY_HOURS) -> dict:
+    """Per-employee aggregates as arrays indexed like frame.emails."""
+    attended = frame.minutes_in >= 0
+    return {
+        "total_hours": _per_employee(frame, frame.hours),
+        "attendance_days": _per_employee(frame, attended),
+        "present_days": _per_employee(frame, frame.present),
+        "late_arrivals": _per_employee(frame, frame.minutes_in > late_after),
+        "overtime_hours": _per_employee(frame, np.maximum(frame.hours - standard_hours, 0.0)),
+        "longest_absence": longest_absence_streaks(frame),
+    }
+
+
+def payable_hours(frame: AttendanceFrame, standard_hours: float = STANDARD_DAY_HOURS) -> tuple:
+    """
+    (regular, overtime) hours per employee from the rows with a clock-in,
+    as salary.calculate_salary counts them. A day's hours past
+    standard_hours are overtime.
+    """
+    hours = np.where(frame.minutes_in >= 0, frame.hours, 0.0)
+    overtime = np.maximum(hours - standard_hours, 0.0)
+    return _per_employee(frame, hours - overtime), _per_employee(frame, overtime)
+
+
+def department_summary(frame: AttendanceFrame, per_employee: Optional[dict] = None) -> list:
+    """Roll the per-employee aggregates up to departments."""
+    per_employee = per_employee or employee_summary(frame)
+    departments, dept_index = np.unique(np.array(frame.departments, dtype=object), return_inverse=True)
+
+    def per_department(values):
+        return np.bincount(dept_index, weights=values, minlength=len(departments))
+
+    headcount = np.bincount(dept_index, minlength=len(departments))
+    totals = {key: per_department(values) for key, values in per_employee.items() if key != "longest_absence"}
+    return [
+        {
+            "department": department,
+            "employees": int(headcount[i]),
+            "total_hours": round(float(totals["total_hours"][i]), 2),
+            "attendance_days": int(totals["attendance_days"][i]),
+            "late_arrivals": int(totals["late_arrivals"][i]),
+            "overtime_hours": round(float(totals["overtime_hours"][i]), 2),
+        }
+        for i, department in enumerate(departments)
+    ]
+
+
+def daily_summary(frame: AttendanceFrame) -> list:
+    """Per-day headcount and hours across everyone in the frame."""
+    if not len(frame):
+        return []
+    offset = frame.day - frame.day.min()
+    attended = frame.minutes_in >= 0
+    present = np.bincount(offset, weights=attended)
+    hours = np.bincount(offset, weights=frame.hours)
+    late = np.bincount(offset, weights=frame.minutes_in > LATE_AFTER_MINUTES)
+    first_day = int(frame.day.min())
+    return [
+        {
+            "date": date.fromordinal(first_day + i).isoformat(),
+            "present": int(present[i]),
+            "late_arrivals": int(late[i]),
+            "total_hours": round(float(hours[i]), 2),
+        }
+        for i in np.flatnonzero(present + hours)
+    ]
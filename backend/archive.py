@@ -0,0 +1,373 @@
+import json
+import os
+import shutil
+import threading
+from datetime import date, timedelta
+from typing import Optional
+import numpy as np
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+from dashboard import today_ea
+from models import Attendance
+from rows import ATTENDANCE_COLUMNS, AttendanceRow, fetch
+from tenancy import DEFAULT_TENANT, TenantLocal, tenant_path
+import settings
+
+FORMAT_VERSION = 1
+# Fixed-width columns, one .npy file each. NULL minutes are stored as -1 and
+# NULL hours as NaN; status is an index into the segment's status list.
+COLUMNS = {
+    "id": np.int64,
+    "day": np.int32,            # date.toordinal()
+    "minutes_in": np.int16,
+    "minutes_out": np.int16,
+    "total_hours": np.float64,
+    "status": np.uint8,
+}
+# SQLite julianday() of 0001-01-01 is 1721425.5, which is date.toordinal() == 1.
+JULIAN_ORDINAL_OFFSET = 1721424.5
+
+
+class Segment:
+    """
+    One archived year of attendance, memory-mapped read-only.
+    Rows are sorted by (employee, day), so employee e's rows are the slice
+    offsets[e]:offsets[e + 1] and a date range within it is two binary
+    searches away.
+    """
+
+    __slots__ = ("year", "path", "emails", "statuses", "columns", "offsets", "_index")
+
+    def __init__(self, path: str, year: int):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["format"] != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported segment format {meta['format']}")
+        self.year = year
+        self.path = path
+        self.emails = meta["emails"]
+        self.statuses = meta["statuses"]
+        self._index = {email: i for i, email in enumerate(self.emails)}
+        self.columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in COLUMNS
+        }
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def employee_rows(self, email: str, start: Optional[date] = None, end: Optional[date] = None) -> slice:
+        """Row slice for `email` between start and end inclusive."""
+        e = self._index.get(email)
+        if e is None:
+            return slice(0, 0)
+        lo, hi = int(self.offsets[e]), int(self.offsets[e + 1])
+        days = self.columns["day"][lo:hi]
+        first = int(np.searchsorted(days, start.toordinal(), "left")) if start else 0
+        last = int(np.searchsorted(days, end.toordinal(), "right")) if end else hi - lo
+        return slice(lo + first, lo + last)
+
+    def records(self, rows: slice) -> list:
+        columns = {name: column[rows].tolist() for name, column in self.columns.items()}
+        email = self.emails[int(np.searchsorted(self.offsets, rows.start, "right")) - 1] if columns["id"] else None
+        records = []
+        for i in range(len(columns["id"])):
+            minutes_in, minutes_out, hours = columns["minutes_in"][i], columns["minutes_out"][i], columns["total_hours"][i]
+            records.append(AttendanceRow(
+                columns["id"][i],
+                email,
+                date.fromordinal(columns["day"][i]),
+                minutes_in if minutes_in >= 0 else None,
+                minutes_out if minutes_out >= 0 else None,
+                None if hours != hours else hours,
+                self.statuses[columns["status"][i]],
+            ))
+        return records
+
+    def columns_between(self, start: date, end: date) -> dict:
+        """Every employee's rows between start and end inclusive, as in-memory arrays plus an `employee` column."""
+        employee = np.repeat(np.arange(len(self.emails), dtype=np.int32), np.diff(self.offsets))
+        day = self.columns["day"]
+        if start.toordinal() <= self.year_start and end.toordinal() >= self.year_end:
+            keep = slice(None)
+        else:
+            keep = (day >= start.toordinal()) & (day <= end.toordinal())
+        columns = {name: np.asarray(column[keep]) for name, column in self.columns.items()}
+        columns["employee"] = employee[keep]
+        return columns
+
+    @property
+    def year_start(self) -> int:
+        return date(self.year, 1, 1).toordinal()
+
+    @property
+    def year_end(self) -> int:
+        return date(self.year, 12, 31).toordinal()
+
+
+class AttendanceArchive:
+    """
+    Closed years of attendance moved out of the hot table, one immutable
+    segment directory per year under `root`. Segments are opened lazily and
+    shared by every request; a new or rewritten segment is noticed through
+    the root directory's mtime, which one stat() per query checks.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._years = {}    # year -> Segment, or None until first opened
+
+    def _catalog(self) -> dict:
+        try:
+            stamp = os.stat(self.root).st_mtime_ns
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._stamp:
+            return self._years
+        with self._lock:
+            years = {}
+            if stamp is not None:
+                for name in os.listdir(self.root):
+                    if name.isdigit() and os.path.exists(os.path.join(self.root, name, "meta.json")):
+                        years[int(name)] = None
+            self._years, self._stamp = years, stamp
+            return years
+
+    def years(self) -> list:
+        return sorted(self._catalog())
+
+    def years_between(self, start: Optional[date], end: Optional[date]) -> list:
+        return [
+            year for year in self.years()
+            if (start is None or year >= start.year) and (end is None or year <= end.year)
+        ]
+
+    def segment(self, year: int) -> Optional[Segment]:
+        years = self._catalog()
+        if year not in years:
+            return None
+        segment = years[year]
+        if segment is None:
+            with self._lock:
+                segment = years.get(year)
+                if segment is None:
+                    segment = years[year] = Segment(os.path.join(self.root, str(year)), year)
+        return segment
+
+    def write_segment(self, year: int, columns: dict, emails: list, statuses: list):
+        """
+        Write a segment for `year` next to the old one and swap it in with
+        renames, so readers see either the old or the new segment in full.
+        `columns` must already be sorted by (employee, day).
+        """
+        os.makedirs(self.root, exist_ok=True)
+        final = os.path.join(self.root, str(year))
+        staging = os.path.join(self.root, f".{year}.{os.getpid()}.new")
+        retired = os.path.join(self.root, f".{year}.{os.getpid()}.old")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        offsets = np.searchsorted(columns["employee"], np.arange(len(emails) + 1), "left").astype(np.int64)
+        for name, dtype in COLUMNS.items():
+            _save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(columns[name], dtype=dtype))
+        _save(os.path.join(staging, "offsets.npy"), offsets)
+        meta = {
+            "format": FORMAT_VERSION,
+            "year": year,
+            "rows": int(len(columns["id"])),
+            "emails": emails,
+            "statuses": statuses,
+        }
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if os.path.exists(final):
+            os.rename(final, retired)
+        os.rename(staging, final)
+        _fsync_dir(self.root)
+        shutil.rmtree(retired, ignore_errors=True)
+
+
+def _save(path: str, array: np.ndarray):
+    with open(path, "wb") as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+attendance_archive = TenantLocal(lambda tenant: AttendanceArchive(
+    settings.ARCHIVE_DIR if tenant == DEFAULT_TENANT else tenant_path(tenant, "attendance_archive")
+))
+
+
+def archive_year(db: Session, year: int, archive: AttendanceArchive = attendance_archive) -> dict:
+    """
+    Move `year`'s attendance rows from the attendance table into its
+    segment, merging with the segment already there. The segment is written
+    before the rows are deleted; if anything fails in between, the rows are
+    in both places and the hot copy wins on read. Rows changed while the
+    segment was being written keep a newer sync_seq and stay in the table.
+    Archived rows are not tombstoned for GET /sync: clients keep them.
+    """
+    if year >= today_ea().year:
+        raise ValueError("Only closed years can be archived")
+
+    sql = """
+        SELECT id, employee_email,
+               CAST(julianday(date) - ? AS INTEGER),
+               coalesce(minutes_in, -1),
+               coalesce(minutes_out, -1),
+               total_hours,
+               status,
+               coalesce(sync_seq, 0)
+        FROM attendance
+        WHERE date >= ? AND date <= ?
+    """
+    params = (JULIAN_ORDINAL_OFFSET, f"{year}-01-01", f"{year}-12-31")
+    cursor = db.connection().connection.cursor()
+    try:
+        rows = cursor.execute(sql, params).fetchall()
+    finally:
+        cursor.close()
+    if not rows:
+        return {"year": year, "archived": 0, "segment_rows": len(archive.segment(year) or ())}
+
+    ids, row_emails, days, minutes_in, minutes_out, hours, row_statuses, seqs = zip(*rows)
+    previous = archive.segment(year)
+    emails = sorted(set(row_emails) | set(previous.emails if previous else ()))
+    statuses = sorted(set(row_statuses) | set(previous.statuses if previous else ()), key=str)
+    email_index = {email: i for i, email in enumerate(emails)}
+    status_index = {status: i for i, status in enumerate(statuses)}
+
+    columns = {
+        "id": np.array(ids, dtype=np.int64),
+        "employee": np.array([email_index[e] for e in row_emails], dtype=np.int32),
+        "day": np.array(days, dtype=np.int32),
+        "minutes_in": np.array(minutes_in, dtype=np.int16),
+        "minutes_out": np.array(minutes_out, dtype=np.int16),
+        "total_hours": np.array(hours, dtype=np.float64),
+        "status": np.array([status_index[s] for s in row_statuses], dtype=np.uint8),
+    }
+    if previous is not None:
+        # Rows re-added to the table for an archived year replace the archived ones.
+        old = previous.columns_between(date(year, 1, 1), date(year, 12, 31))
+        old["employee"] = np.array([email_index[e] for e in previous.emails], dtype=np.int32)[old["employee"]]
+        old["status"] = np.array([status_index[s] for s in previous.statuses], dtype=np.uint8)[old["status"]]
+        keep = ~np.isin(_row_keys(old), _row_keys(columns))
+        columns = {name: np.concatenate([old[name][keep], columns[name]]) for name in columns}
+
+    order = np.lexsort((columns["day"], columns["employee"]))
+    archive.write_segment(year, {name: column[order] for name, column in columns.items()}, emails, statuses)
+
+    # The sync and outbox delete triggers would tombstone every archived row
+    # and record it as deleted; they skip deletes while archive_guard has a
+    # row (migrations.create_archive_guard). The row is removed before
+    # commit, or rolled back with everything else.
+    connection = db.connection()
+    try:
+        connection.execute(text("INSERT INTO archive_guard (year) VALUES (:year)"), {"year": year})
+        deleted = connection.execute(text("""
+            DELETE FROM attendance
+            WHERE date >= :start AND date <= :end AND coalesce(sync_seq, 0) <= :seq
+        """), {"start": f"{year}-01-01", "end": f"{year}-12-31", "seq": max(seqs)}).rowcount
+        connection.execute(text("DELETE FROM archive_guard"))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {"year": year, "archived": deleted, "segment_rows": int(len(order))}
+
+
+def _row_keys(columns: dict) -> np.ndarray:
+    return (columns["employee"].astype(np.int64) << 32) | columns["day"].astype(np.int64)
+
+
+# Query layer: hot rows from the attendance table unioned with archived
+# segments when the date range reaches an archived year. A hot row wins over
+# an archived one for the same employee and day.
+
+def attendance_records(db: Session, email: str, start: Optional[date] = None, end: Optional[date] = None) -> list:
+    """An employee's attendance between start and end inclusive, newest first."""
+    query = select(*ATTENDANCE_COLUMNS).where(Attendance.employee_email == email)
+    if start:
+        query = query.where(Attendance.date >= start)
+    if end:
+        query = query.where(Attendance.date <= end)
+    records = fetch(db, AttendanceRow, query.order_by(Attendance.date.desc()))
+
+    archived = []
+    for year in attendance_archive.years_between(start, end):
+        segment = attendance_archive.segment(year)
+        archived.extend(segment.records(segment.employee_rows(email, start, end)))
+    if not archived:
+        return records
+    hot_days = {record.date for record in records}
+    records.extend(record for record in archived if record.date not in hot_days)
+    records.sort(key=lambda record: record.date, reverse=True)
+    return records
+
+
+def attendance_record(db: Session, email: str, day: date):
+    """An employee's attendance row for `day`, or None."""
+    found = fetch(db, AttendanceRow, select(*ATTENDANCE_COLUMNS).where(
+        Attendance.employee_email == email,
+        Attendance.date == day,
+    ))
+    if found:
+        return found[0]
+    segment = attendance_archive.segment(day.year)
+    if segment is None:
+        return None
+    found = segment.records(segment.employee_rows(email, day, day))
+    return found[0] if found else None
+
+
+def attendance_totals(db: Session, email: str, start: Optional[date] = None, end: Optional[date] = None) -> tuple:
+    """(total hours, days with a clock-in) for an employee between start and end inclusive."""
+    def hot(query):
+        query = query.filter(Attendance.employee_email == email)
+        if start:
+            query = query.filter(Attendance.date >= start)
+        if end:
+            query = query.filter(Attendance.date <= end)
+        return query
+
+    total_hours, days = hot(db.query(
+        func.coalesce(func.sum(Attendance.total_hours), 0.0),
+        func.count(Attendance.minutes_in),
+    )).one()
+
+    years = attendance_archive.years_between(start, end)
+    if years:
+        # Archived days that also have a hot row are counted from the hot row.
+        overridden = np.array([
+            day.toordinal() for (day,) in hot(db.query(Attendance.date)).filter(
+                Attendance.date >= date(years[0], 1, 1),
+                Attendance.date <= date(years[-1], 12, 31),
+            )
+        ], dtype=np.int32)
+        for year in years:
+            segment = attendance_archive.segment(year)
+            rows = segment.employee_rows(email, start, end)
+            keep = ~np.isin(segment.columns["day"][rows], overridden)
+            total_hours += float(np.nansum(segment.columns["total_hours"][rows][keep]))
+            days += int(np.count_nonzero(segment.columns["minutes_in"][rows][keep] >= 0))
+    return total_hours, days
+
+
+def last_closed_year(grace_days: int) -> int:
+    """The latest year whose attendance may be archived, leaving grace_days into the new year for corrections."""
+    return (today_ea() - timedelta(days=grace_days)).year - 1
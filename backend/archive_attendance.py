@@ -0,0 +1,32 @@
+import sys
+from sqlalchemy import text
+from database import SessionLocal, engine
+from jobs import archive_attendance_year
+import migrations
+
+
+def archive_years(years: list, vacuum: bool = False):
+    db = SessionLocal()
+    try:
+        for year in years:
+            result = archive_attendance_year(db, year)
+            print(f"{year}: moved {result['archived']} rows, segment holds {result['segment_rows']}.")
+    except Exception as e:
+        print(f"Error: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+    if vacuum:
+        # Deleted pages are reused by new rows anyway; VACUUM gives them back to the OS.
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+        print("Vacuumed pesa_pay.db.")
+
+if __name__ == "__main__":
+    # python archive_attendance.py year [year ...] [--vacuum]
+    args = [a for a in sys.argv[1:] if a != "--vacuum"]
+    if not args:
+        sys.exit("usage: python archive_attendance.py year [year ...] [--vacuum]")
+    migrations.upgrade()
+    archive_years([int(a) for a in args], vacuum="--vacuum" in sys.argv)
@@ -0,0 +1,151 @@
+import json
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from time import monotonic
+from database import tenant_session
+from tenancy import DEFAULT_TENANT, current_tenant, tenant_path, use_tenant
+import settings
+
+
+class ClockQueue:
+    """
+    Write-behind queue for clock events.
+    Statements submitted by request handlers are executed by one background
+    thread in batched transactions, so a burst of taps shares one commit
+    instead of paying an fsync each.
+    A statement submitted as `acknowledged` (its client was already told it
+    succeeded) that fails is written to the tenant's dead-letter file
+    (CLOCK_DEAD_LETTER) with its parameters, so it can be replayed.
+    """
+
+    def __init__(self, session_factory, batch_size: int, flush_interval_ms: int):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue = queue.Queue()
+        self._stopping = threading.Event()
+        # submit() and stop() take it, so nothing is queued after the flusher's last drain.
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def is_running(self) -> bool:
+        """False once stop() has begun, so late requests write directly instead of queueing."""
+        return self._thread is not None and not self._stopping.is_set()
+
+    def start(self):
+        if self._thread:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="clock-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush everything still queued, then stop the flusher thread."""
+        with self._lock:
+            if not self._thread:
+                return
+            self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, stmt, acknowledged: bool = False) -> Future:
+        """Queue a statement; the future resolves to its first result row (or None)."""
+        with self._lock:
+            if not self._thread or self._stopping.is_set():
+                raise RuntimeError("Clock queue is not running")
+            future = Future()
+            self._queue.put((current_tenant(), stmt, future, acknowledged))
+        return future
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                # Each tenant's events are committed to its own database.
+                by_tenant = {}
+                for tenant, *item in batch:
+                    by_tenant.setdefault(tenant, []).append(item)
+                for tenant, items in by_tenant.items():
+                    with use_tenant(tenant):
+                        self._flush(items)
+            elif self._stopping.is_set() and self._queue.empty():
+                return
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        db = self.session_factory()
+        try:
+            rows = [db.execute(stmt).first() for stmt, _, _ in batch]
+            db.commit()
+        except Exception:
+            db.rollback()
+            rows = None
+        finally:
+            db.close()
+
+        if rows is None:
+            # One bad event must not fail its neighbours: replay them one by one.
+            for item in batch:
+                self._flush_one(item)
+            return
+
+        for (_, future, _), row in zip(batch, rows):
+            future.set_result(row)
+
+    def _flush_one(self, item):
+        stmt, future, acknowledged = item
+        db = self.session_factory()
+        try:
+            row = db.execute(stmt).first()
+            db.commit()
+            future.set_result(row)
+        except Exception as e:
+            db.rollback()
+            print(f"Clock event failed: {e}")
+            if acknowledged:
+                self._dead_letter(stmt, e)
+            future.set_exception(e)
+        finally:
+            db.close()
+
+    def _dead_letter(self, stmt, error: Exception):
+        tenant = current_tenant()
+        path = settings.CLOCK_DEAD_LETTER if tenant == DEFAULT_TENANT else tenant_path(tenant, "clock_dead_letter.ndjson")
+        compiled = stmt.compile()
+        entry = {
+            "failed_at": datetime.now(timezone.utc).isoformat(),
+            "tenant": tenant,
+            "error": str(error),
+            "sql": str(compiled),
+            "params": compiled.params,
+        }
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+        except OSError as e:
+            print(f"Could not dead-letter clock event ({e}): {entry}")
+
+
+clock_queue = ClockQueue(
+    tenant_session,
+    batch_size=settings.CLOCK_BATCH_SIZE,
+    flush_interval_ms=settings.CLOCK_FLUSH_INTERVAL_MS,
+)
@@ -0,0 +1,53 @@
+"""
+Attendance report aggregates (analytics.py) against the per-employee ORM
+loop they replaced. Defaults: 4,000 employees x 250 days (1M rows); the
+ORM loop is timed on 200 employees and extrapolated.
+"""
+import argparse
+import random
+from datetime import date, timedelta
+from common import add_attendance, scratch_database, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--employees", type=int, default=4000)
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument("--orm-sample", type=int, default=200)
+    args = parser.parse_args()
+
+    con = scratch_database()
+    random.seed(29)
+    emails = [f"e{i}@example.com" for i in range(args.employees)]
+    first = date(2024, 1, 1)
+    add_attendance(con, [
+        (email, (first + timedelta(days=d)).isoformat(), 480 + random.randint(-30, 60), 1020, 9.0)
+        for d in range(args.days) for email in emails
+    ])
+    print(f"{args.employees * args.days} attendance rows")
+
+    import analytics
+    from database import SessionLocal
+    from models import Attendance
+    db = SessionLocal()
+
+    frame = timed("analytics.load_attendance", lambda: analytics.load_attendance(db))
+
+    def aggregates():
+        summary = analytics.employee_summary(frame)
+        analytics.department_summary(frame, summary)
+        analytics.daily_summary(frame)
+    timed("employee + department + daily aggregates", aggregates, repeat=3)
+
+    def orm_loop():
+        for email in emails[:args.orm_sample]:
+            records = db.query(Attendance).filter(Attendance.employee_email == email).all()
+            sum(r.total_hours for r in records if r.total_hours)
+            len([r for r in records if r.minutes_in is not None])
+    sample = min(args.orm_sample, args.employees)
+    timed(f"ORM loop, {sample} of {args.employees} employees", orm_loop)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
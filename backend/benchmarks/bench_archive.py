@@ -0,0 +1,68 @@
+"""
+Per-employee attendance reads before and after closed years are moved
+into the column archive (archive.py). Defaults: 300 employees, every
+weekday from 2022 to October 2026.
+"""
+import argparse
+import os
+import random
+from datetime import date, timedelta
+from common import add_attendance, scratch_database, timed
+
+EMAIL = "e7@example.com"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--employees", type=int, default=300)
+    args = parser.parse_args()
+
+    con = scratch_database()
+    random.seed(41)
+    rows = []
+    day = date(2022, 1, 1)
+    while day <= date(2026, 10, 16):
+        if day.weekday() < 5:
+            for i in range(args.employees):
+                minutes_in = 480 + random.randint(-30, 60)
+                minutes_out = minutes_in + 480 + random.randint(-60, 120)
+                rows.append((f"e{i}@example.com", day.isoformat(), minutes_in, minutes_out,
+                             round((minutes_out - minutes_in) / 60, 2)))
+        day += timedelta(days=1)
+    add_attendance(con, rows)
+    con.execute("VACUUM")
+    con.close()
+    print(f"{len(rows)} attendance rows, database {os.path.getsize('pesa_pay.db') / 2**20:.1f} MiB")
+
+    import analytics
+    from archive import attendance_record, attendance_records, attendance_totals
+    from database import SessionLocal
+    from routers.salary import month_hours
+
+    def suite(tag: str):
+        db = SessionLocal()
+        timed(f"{tag}: current-month records", lambda: attendance_records(db, EMAIL, date(2026, 10, 1), date(2026, 10, 31)), 200)
+        timed(f"{tag}: full history records", lambda: attendance_records(db, EMAIL), 50)
+        timed(f"{tag}: all-time totals", lambda: attendance_totals(db, EMAIL), 50)
+        timed(f"{tag}: one day in 2023", lambda: attendance_record(db, EMAIL, date(2023, 5, 10)), 200)
+        timed(f"{tag}: month_hours 2024-03", lambda: month_hours(db, EMAIL, date(2024, 3, 1), date(2024, 4, 1)), 200)
+        timed(f"{tag}: report frame 2022-2026", lambda: analytics.load_attendance(db, date(2022, 1, 1), date(2026, 12, 31)), 5)
+        db.close()
+
+    suite("hot")
+    from archive_attendance import archive_years
+    from jobs import archive_closed_years
+    db = SessionLocal()
+    timed("archive closed years", lambda: archive_closed_years(db))
+    db.close()
+    archive_years([], vacuum=True)
+    archived = sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk("attendance_archive") for name in names
+    )
+    print(f"database {os.path.getsize('pesa_pay.db') / 2**20:.1f} MiB, archive {archived / 2**20:.1f} MiB")
+    suite("archived")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Thousands of employees clocking in at once against a real server:
+status counts and p50/p99 latency of POST /attendance/log, with and
+without group commit (PESA_PAY_CLOCK_BATCHING). Requests beyond the load
+shedder's queue are answered 503 by design and reported separately.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+import httpx
+from common import add_employees, percentile, scratch_database, start_server
+
+
+async def tap_all(url: str, first: int, employees: int) -> tuple:
+    latencies, codes = [], Counter()
+    limits = httpx.Limits(max_connections=employees, max_keepalive_connections=employees)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=None) as client:
+        async def tap(i: int):
+            started = time.perf_counter()
+            response = await client.post("/api/v1/attendance/log", json={
+                "employee_email": f"e{i}@example.com", "time_in": "08:00", "idempotency_key": f"tap-{i}",
+            })
+            codes[response.status_code] += 1
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        await asyncio.gather(*(tap(i) for i in range(first, first + employees)))
+        return codes, latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--employees", type=int, default=2000)
+    parser.add_argument("--max-queued", type=int, default=4096, help="PESA_PAY_MAX_QUEUED_REQUESTS for the server")
+    args = parser.parse_args()
+
+    con = scratch_database()
+    # A fresh set of employees per run, so every tap is a first clock-in.
+    add_employees(con, 2 * args.employees)
+    con.close()
+    for run, batching in enumerate(("off", "on")):
+        process, url = start_server({
+            "PESA_PAY_CLOCK_BATCHING": batching,
+            "PESA_PAY_MAX_QUEUED_REQUESTS": str(args.max_queued),
+            "PESA_PAY_QUEUE_TIMEOUT_SECONDS": "60",
+        })
+        try:
+            codes, latencies, elapsed = asyncio.run(tap_all(url, run * args.employees, args.employees))
+        finally:
+            process.terminate()
+            process.wait()
+        print(
+            f"batching {batching:3}: {dict(codes)} in {elapsed:.2f} s, "
+            f"p50 {percentile(latencies, 50) * 1000:.0f} ms, p99 {percentile(latencies, 99) * 1000:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
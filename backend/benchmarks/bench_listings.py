@@ -0,0 +1,39 @@
+"""
+Time and peak Python memory of the large listing endpoints, which read
+slotted rows (rows.py) instead of ORM entities. Defaults: 100,000
+employees and one employee with 100,000 days of attendance.
+"""
+import argparse
+import gc
+import tracemalloc
+from datetime import date, timedelta
+from common import add_attendance, add_employees, app_client, scratch_database, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--employees", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=100_000)
+    args = parser.parse_args()
+
+    con = scratch_database()
+    add_employees(con, args.employees, departments=20)
+    first = date(1800, 1, 1)
+    add_attendance(con, [
+        ("e1@example.com", (first + timedelta(days=d)).isoformat(), 480, 960, 8.0) for d in range(args.days)
+    ])
+    client = app_client()
+
+    for path in ("/api/v1/attendance/records/e1@example.com", "/api/v1/employees", "/api/v1/admin/employees"):
+        response = timed(path, lambda: client.get(path), repeat=3)
+        assert response.status_code == 200, response.text[:200]
+        gc.collect()
+        tracemalloc.start()
+        client.get(path)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{'':<48} {len(response.json()):10d} rows, peak {peak / 2**20:.1f} MiB, {len(response.content)} bytes")
+
+
+if __name__ == "__main__":
+    main()
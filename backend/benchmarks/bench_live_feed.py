@@ -0,0 +1,76 @@
+"""
+Fan-out of the admin live feed: --subscribers SSE clients on
+/admin/attendance/stream while --events clock-ins are posted one after
+another. Reports how long each event took from its clock-in request to
+every subscriber (p50/p99/max) and how many deliveries went missing.
+"""
+import argparse
+import asyncio
+import json
+import time
+import httpx
+from common import add_employees, percentile, scratch_database, start_server
+
+
+async def subscribe(client: httpx.AsyncClient, connected: list, received: dict):
+    async with client.stream("GET", "/api/v1/admin/attendance/stream") as response:
+        connected.append(response.status_code)
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                event = json.loads(line[6:])
+                received.setdefault(event["employee_email"], []).append(time.perf_counter())
+
+
+async def run(url: str, subscribers: int, events: int) -> tuple:
+    connected, received, sent = [], {}, {}
+    limits = httpx.Limits(max_connections=subscribers + 1, max_keepalive_connections=subscribers + 1)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=None) as client:
+        started = time.perf_counter()
+        streams = [asyncio.create_task(subscribe(client, connected, received)) for _ in range(subscribers)]
+        while len(connected) < subscribers:
+            await asyncio.sleep(0.05)
+        connect_s = time.perf_counter() - started
+        # Headers go out just before the stream registers with the broker.
+        await asyncio.sleep(1)
+
+        for i in range(events):
+            email = f"e{i}@example.com"
+            sent[email] = time.perf_counter()
+            response = await client.post("/api/v1/attendance/log", json={"employee_email": email, "time_in": "08:00"})
+            response.raise_for_status()
+        deadline = time.perf_counter() + 30
+        while sum(map(len, received.values())) < subscribers * events and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+        for stream in streams:
+            stream.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
+
+    latencies = [at - sent[email] for email, times in received.items() for at in times]
+    return connect_s, latencies, subscribers * events - len(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=50)
+    args = parser.parse_args()
+
+    con = scratch_database()
+    add_employees(con, args.events)
+    con.close()
+    process, url = start_server()
+    try:
+        connect_s, latencies, missing = asyncio.run(run(url, args.subscribers, args.events))
+    finally:
+        process.terminate()
+        process.wait()
+    print(f"{args.subscribers} subscribers connected in {connect_s:.2f} s")
+    print(
+        f"{len(latencies)} deliveries, {missing} missing: p50 {percentile(latencies, 50) * 1000:.0f} ms, "
+        f"p99 {percentile(latencies, 99) * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+POST /salary/simulate: 100 payroll scenarios over one month, vectorized
+in payroll.simulate(). Defaults: 10,000 employees, 90% attendance on
+every weekday of September 2026.
+"""
+import argparse
+import random
+from datetime import date, timedelta
+from common import add_attendance, add_employees, app_client, scratch_database, timed
+
+MONTH = "2026-09"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--employees", type=int, default=10_000)
+    parser.add_argument("--scenarios", type=int, default=100)
+    args = parser.parse_args()
+
+    con = scratch_database()
+    random.seed(47)
+    add_employees(con, args.employees)
+    rows = []
+    day = date(2026, 9, 1)
+    while day < date(2026, 10, 1):
+        if day.weekday() < 5:
+            for i in range(args.employees):
+                if random.random() < 0.9:
+                    hours = round(random.uniform(6, 11), 2)
+                    rows.append((f"e{i}@example.com", day.isoformat(), 480, 480 + int(hours * 60), hours))
+        day += timedelta(days=1)
+    add_attendance(con, rows)
+    print(f"{len(rows)} attendance rows")
+
+    import payroll
+    from database import SessionLocal
+    from routers.salary import PayrollScenario
+    scenarios = [
+        {
+            "name": f"s{k}",
+            "hourly_rate": 400 + 5 * k,
+            "department_rates": {"D3": 700, "D7": 350 + k},
+            "overtime_multiplier": 1 + (k % 4) * 0.25,
+            "deduction_brackets": [
+                {"up_to": 24000, "rate": 0.1}, {"up_to": 40000 + 100 * k, "rate": 0.25}, {"rate": 0.3 + k / 1000},
+            ],
+        }
+        for k in range(args.scenarios - 1)
+    ] + [{"name": "today"}]
+
+    db = SessionLocal()
+    hours = timed("payroll.load_payroll_hours", lambda: payroll.load_payroll_hours(db, date(2026, 9, 1), date(2026, 10, 1)))
+    models = [PayrollScenario(**s) for s in scenarios]
+    timed(f"payroll.simulate, {len(models)} x {len(hours.emails)}", lambda: payroll.simulate(hours, models), repeat=3)
+    db.close()
+
+    client = app_client()
+    response = timed("POST /salary/simulate", lambda: client.post(
+        "/api/v1/salary/simulate", json={"month": MONTH, "scenarios": scenarios},
+    ))
+    assert response.status_code == 200, response.text[:200]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Serialization cost of the large list payloads: CPU time and size of
+rendering /admin/employees and the attendance report with the stdlib
+JSONResponse and with FastJSONResponse (orjson), each raw and gzipped at
+GZIP_LEVEL like GZipMiddleware, then the same endpoints end to end with
+and without Accept-Encoding: gzip. Defaults: 20,000 employees with 30
+days each.
+"""
+import argparse
+import gzip
+import time
+from datetime import date, timedelta
+from common import add_attendance, add_employees, app_client, scratch_database, timed
+
+
+def cpu_ms(func, repeat: int) -> tuple:
+    """Best process CPU time of `repeat` runs in ms, and the last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        result = func()
+        best = min(best, time.process_time() - started)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--employees", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    con = scratch_database()
+    add_employees(con, args.employees, departments=20)
+    first = date.today() - timedelta(days=30)
+    add_attendance(con, [
+        (f"e{i}@example.com", (first + timedelta(days=d)).isoformat(), 480, 960, 8.0)
+        for i in range(args.employees) for d in range(30)
+    ])
+    client = app_client()
+    from fastapi.responses import JSONResponse
+    from responses import FastJSONResponse
+    import settings
+
+    paths = ("/api/v1/admin/employees", "/api/v1/admin/attendance/report")
+    for path in paths:
+        content = client.get(path).json()
+        print(path)
+        for name, response_class in (("stdlib JSONResponse", JSONResponse), ("FastJSONResponse", FastJSONResponse)):
+            render_ms, body = cpu_ms(lambda: response_class(content).body, args.repeat)
+            gzip_ms, packed = cpu_ms(lambda: gzip.compress(body, compresslevel=settings.GZIP_LEVEL), args.repeat)
+            print(
+                f"  {name:<22} render {render_ms:8.1f} ms cpu {len(body):>10} bytes | "
+                f"+gzip {gzip_ms:8.1f} ms cpu {len(packed):>10} bytes"
+            )
+        for encoding in ("identity", "gzip"):
+            response = timed(f"  GET, Accept-Encoding: {encoding}", lambda: client.get(path, headers={"Accept-Encoding": encoding}), args.repeat)
+            assert response.status_code == 200, response.text[:200]
+            print(f"  {'':<46} {response.num_bytes_downloaded:10d} bytes on the wire")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Write scaling across tenant databases: the same number of concurrent
+clock-ins spread over 1, 2, 4 and 8 tenants (PESA_PAY_MULTI_TENANT) on
+one server. Each tenant has its own SQLite file and write lock, so
+throughput should grow with the tenant count until the CPU is the limit.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+import httpx
+from common import percentile, scratch_database, start_server
+
+TENANT_COUNTS = (1, 2, 4, 8)
+
+
+async def clock_ins(url: str, run: int, tenants: int, writes: int, concurrency: int) -> tuple:
+    latencies, codes = [], Counter()
+    slots = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=None) as client:
+        # Open (and migrate) every tenant database before timing.
+        for t in range(tenants):
+            await client.get("/api/v1/holidays", headers={"X-Tenant": f"t{t}"})
+
+        async def tap(i: int):
+            async with slots:
+                started = time.perf_counter()
+                response = await client.post(
+                    "/api/v1/attendance/log",
+                    json={"employee_email": f"r{run}e{i}@example.com", "time_in": "08:00"},
+                    headers={"X-Tenant": f"t{i % tenants}"},
+                )
+                codes[response.status_code] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(tap(i) for i in range(writes)))
+        return codes, latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    scratch_database().close()
+    process, url = start_server({
+        "PESA_PAY_MULTI_TENANT": "on",
+        "PESA_PAY_TENANTS": ",".join(f"t{t}" for t in range(max(TENANT_COUNTS))),
+    })
+    try:
+        for run, tenants in enumerate(TENANT_COUNTS):
+            codes, latencies, elapsed = asyncio.run(clock_ins(url, run, tenants, args.writes, args.concurrency))
+            print(
+                f"{tenants} tenant(s): {dict(codes)} {args.writes / elapsed:8.0f} writes/s, "
+                f"p50 {percentile(latencies, 50) * 1000:.0f} ms, p99 {percentile(latencies, 99) * 1000:.0f} ms"
+            )
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Shared setup for the benchmarks: each run gets a scratch database and
+working directory, so backend/pesa_pay.db is never touched.
+Run from anywhere, e.g. `python backend/benchmarks/bench_analytics.py`.
+"""
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+
+def scratch_database() -> sqlite3.Connection:
+    """Migrate an empty database in a new temporary directory and return a raw connection to it for bulk loading."""
+    os.chdir(tempfile.mkdtemp(prefix="pesa_pay_bench_"))
+    # database.engine resolves ./pesa_pay.db when it is imported.
+    import migrations
+    migrations.upgrade()
+    return sqlite3.connect("pesa_pay.db")
+
+
+def app_client():
+    """TestClient on the app; main.py mounts ./static, so it is imported from backend/."""
+    data_dir = os.getcwd()
+    os.chdir(BACKEND)
+    from fastapi.testclient import TestClient
+    import main
+    import settings
+    os.chdir(data_dir)
+    # Measure the endpoints, not the rate limiter.
+    settings.RATE_LIMIT = False
+    return TestClient(main.app)
+
+
+def add_employees(con: sqlite3.Connection, count: int, departments: int = 12):
+    con.executemany(
+        "INSERT INTO employees (name, email, phone, gender, department, salary, bank_name, account_number, password, is_admin) "
+        "VALUES (?, ?, '0712345678', 'Female', ?, 50000.0, 'Equity', ?, 'x', 0)",
+        [(f"Employee {i:06d}", f"e{i}@example.com", f"D{i % departments}", str(i)) for i in range(count)],
+    )
+    con.commit()
+
+
+def add_attendance(con: sqlite3.Connection, rows: list):
+    """rows of (employee_email, date, minutes_in, minutes_out, total_hours)."""
+    con.executemany(
+        "INSERT INTO attendance (employee_email, date, minutes_in, minutes_out, total_hours, status) "
+        "VALUES (?, ?, ?, ?, ?, 'present')",
+        rows,
+    )
+    con.commit()
+
+
+def timed(label: str, func, repeat: int = 1):
+    """Run func `repeat` times, print the best time and return the last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<48} {best * 1000:10.1f} ms")
+    return result
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def start_server(env: dict = None) -> tuple:
+    """
+    uvicorn serving the app on the current scratch database in a child
+    process (so the load generator doesn't share its GIL); returns
+    (process, base URL). Scheduler and rate limiting are off unless `env`
+    turns them on.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    child_env = {**os.environ, "PESA_PAY_SCHEDULER": "off", "PESA_PAY_RATE_LIMIT": "off", **(env or {})}
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "serve", os.getcwd(), str(port)],
+        env=child_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url + "/docs", timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("server did not start")
+
+
+def _serve(data_dir: str, port: int):
+    os.chdir(data_dir)
+    import database  # noqa: F401  (binds ./pesa_pay.db in data_dir)
+    os.chdir(BACKEND)
+    import uvicorn
+    import main
+    os.chdir(data_dir)
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["serve"]:
+    _serve(sys.argv[2], int(sys.argv[3]))
@@ -1,7 +1,13 @@
-from sqlalchemy.orm import Session
+from typing import Optional, Sequence
+import re
+from sqlalchemy import and_, func, or_, select, text
+from sqlalchemy.orm import Session, load_only
 from models import Employee
+from rows import EMPLOYEE_COLUMNS, EmployeeRow, fetch
 from schemas import EmployeeCreate
 from argon2 import PasswordHasher
+from dashboard import department_counters
+from http_cache import change_versions
 
 ph = PasswordHasher()
 
@@ -33,6 +39,100 @@ def get_all_employees(db: Session):
     return db.query(Employee).all()
 
 
+def get_employee_rows(db: Session, order_by_name: bool = False) -> list:
+    """All employees as read-only EmployeeRows (see rows.py), for listing endpoints."""
+    query = select(*EMPLOYEE_COLUMNS)
+    if order_by_name:
+        query = query.order_by(Employee.name, Employee.id)
+    return fetch(db, EmployeeRow, query)
+
+
+DIRECTORY_FIELDS = (
+    "id", "name", "email", "phone", "gender", "department",
+    "salary", "bank_name", "account_number", "is_admin",
+)
+
+
+def _prefix_range(column, prefix: str):
+    """Case-insensitive prefix match that can use an index on lower(column)."""
+    prefix = prefix.lower()
+    return and_(func.lower(column) >= prefix, func.lower(column) < prefix + "\uffff")
+
+
+def get_employee_directory_page(
+    db: Session,
+    fields: Sequence[str],
+    limit: int,
+    after: Optional[tuple] = None,
+    department: Optional[str] = None,
+    gender: Optional[str] = None,
+    prefix: Optional[str] = None,
+):
+    """
+    One page of the employee directory ordered by (name, id).
+    - `after` is the (name, id) of the last row of the previous page (keyset)
+    - only the requested columns are loaded
+    Returns up to limit + 1 rows so the caller can tell if another page exists.
+    """
+    columns = [getattr(Employee, f) for f in dict.fromkeys(("id", "name", *fields))]
+    query = db.query(Employee).options(load_only(*columns))
+
+    if department:
+        query = query.filter(Employee.department == department)
+    if gender:
+        query = query.filter(Employee.gender == gender)
+    if prefix:
+        query = query.filter(or_(_prefix_range(Employee.name, prefix), _prefix_range(Employee.email, prefix)))
+    if after:
+        name, employee_id = after
+        query = query.filter(or_(
+            Employee.name > name,
+            and_(Employee.name == name, Employee.id > employee_id),
+        ))
+
+    return query.order_by(Employee.name, Employee.id).limit(limit + 1).all()
+
+
+# bm25 column weights for employee_search: name, email, department, phone
+SEARCH_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+
+def search_employees(db: Session, q: str, limit: int = 10):
+    """
+    Typeahead search over the employee_search FTS5 index.
+    Every word typed must prefix-match some word of the name, email,
+    department or phone; results come back best match first.
+    """
+    terms = re.findall(r"\w+", q.lower())
+    if not terms:
+        return []
+    match = " ".join(f'"{term}"*' for term in terms)
+
+    # Rank inside the FTS query so only the best `limit` hits are joined to
+    # employees; capping the hits before ranking would drop better matches.
+    return db.execute(text("""
+        SELECT e.id, e.name, e.email, e.department, e.phone
+        FROM (
+            SELECT rowid AS id,
+                   bm25(employee_search, :w_name, :w_email, :w_department, :w_phone) AS score
+            FROM employee_search
+            WHERE employee_search MATCH :match
+            ORDER BY score
+            LIMIT :limit
+        ) AS hits
+        JOIN employees e ON e.id = hits.id
+        ORDER BY hits.score
+        LIMIT :limit
+    """), {
+        "match": match,
+        "limit": limit,
+        "w_name": SEARCH_WEIGHTS[0],
+        "w_email": SEARCH_WEIGHTS[1],
+        "w_department": SEARCH_WEIGHTS[2],
+        "w_phone": SEARCH_WEIGHTS[3],
+    }).mappings().all()
+
+
 def create_employee(db: Session, employee: EmployeeCreate):
     """
     Create a new employee in the database.
@@ -58,6 +158,7 @@ def create_employee(db: Session, employee: EmployeeCreate):
     db.add(db_employee)
     db.commit()
     db.refresh(db_employee)
+    department_counters.employee_added(db_employee.email, db_employee.department)
     return db_employee
 
 
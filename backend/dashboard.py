@@ -0,0 +1,246 @@
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from time import monotonic
+from typing import Optional
+import pytz
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database import tenant_session
+from models import Attendance, Employee
+from tenancy import TenantLocal, use_tenant
+import settings
+
+ea_tz = pytz.timezone("Africa/Nairobi")
+
+
+def today_ea() -> date:
+    return datetime.now(ea_tz).date()
+
+
+class DepartmentState:
+    __slots__ = ("employees", "clocked_in", "present", "month_hours", "version")
+
+    def __init__(self):
+        self.employees = 0
+        self.clocked_in = set()   # clocked in today, not yet out
+        self.present = set()      # clocked in and out today
+        self.month_hours = 0.0
+        self.version = 0
+
+    def as_dict(self, name: str) -> dict:
+        return {
+            "department": name,
+            "employees": self.employees,
+            "present": len(self.present),
+            "clocked_in": len(self.clocked_in),
+            "absent": max(self.employees - len(self.present) - len(self.clocked_in), 0),
+            "month_hours": round(self.month_hours, 2),
+        }
+
+
+class DepartmentCounters:
+    """
+    Per-department attendance counters for the admin dashboard.
+    Built from the database once per day and then kept current by the
+    clock-in/clock-out handlers, so reading them costs no queries.
+    Every change bumps a cursor; readers pass the last cursor they saw
+    and get back only the departments that changed since.
+    The daily rebuild runs off to the side and is swapped in whole: the
+    dashboard waits for it, but a clock event on a new day only starts it
+    in a background thread. Events that arrive while it runs are replayed
+    on top of it.
+    Clock-ins look an employee's department up by email (indexed) and keep
+    it for DEPARTMENT_CACHE_SECONDS, so employees added or moved by another
+    worker are seen within that time.
+    """
+
+    def __init__(self, tenant: str):
+        self.tenant = tenant
+        self._lock = threading.Lock()
+        self._rebuilding = threading.Lock()
+        self._day: Optional[date] = None
+        self._departments = {}
+        self._pending = None      # clock events seen while a rebuild runs
+        self._version = 0
+        self._directory = OrderedDict()   # email -> (department, looked up at)
+
+    def invalidate(self):
+        """Force a rebuild on the next read (e.g. after a manual attendance edit)."""
+        with self._lock:
+            self._day = None
+
+    def _touch(self, department: str) -> DepartmentState:
+        state = self._departments.get(department)
+        if state is None:
+            state = self._departments[department] = DepartmentState()
+        self._version += 1
+        state.version = self._version
+        return state
+
+    def _build(self, db: Session, today: date) -> tuple:
+        departments = {}
+        employee_department = {}
+
+        def state_of(department: str) -> DepartmentState:
+            state = departments.get(department)
+            if state is None:
+                state = departments[department] = DepartmentState()
+            return state
+
+        for email, department in db.query(Employee.email, Employee.department):
+            department = department or "Unknown"
+            employee_department[email] = department
+            state_of(department).employees += 1
+
+        rows = db.query(Attendance.employee_email, Attendance.minutes_out).filter(
+            Attendance.date == today,
+            Attendance.minutes_in != None,
+        )
+        for email, minutes_out in rows:
+            state = state_of(employee_department.get(email, "Unknown"))
+            (state.present if minutes_out is not None else state.clocked_in).add(email)
+
+        month_start = date(today.year, today.month, 1)
+        rows = db.query(
+            Attendance.employee_email, func.sum(Attendance.total_hours)
+        ).filter(
+            Attendance.date >= month_start,
+            Attendance.date <= today,
+        ).group_by(Attendance.employee_email)
+        for email, hours in rows:
+            state_of(employee_department.get(email, "Unknown")).month_hours += hours or 0.0
+        return departments, employee_department.keys()
+
+    def _rebuild(self, db: Session, today: date):
+        with self._rebuilding:
+            with self._lock:
+                if self._day == today:
+                    return
+                self._pending = []
+            try:
+                departments, employees = self._build(db, today)
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                pending, self._pending = self._pending, None
+                self._departments, self._day = departments, today
+                # Every department counts as changed for readers of the old day.
+                for state in departments.values():
+                    self._version += 1
+                    state.version = self._version
+                for apply, args in pending:
+                    # The clock events dedupe themselves; a signup the build already counted must not count twice.
+                    if apply == self._employee_added and args[0] in employees:
+                        continue
+                    apply(*args)
+
+    def _rebuild_in_background(self, today: date):
+        try:
+            with use_tenant(self.tenant):
+                db = tenant_session()
+                try:
+                    self._rebuild(db, today)
+                finally:
+                    db.close()
+        except Exception as e:
+            print(f"Department counters rebuild failed: {e}")
+
+    def _stale(self, day: date) -> bool:
+        """Whether a clock event for `day` finds the counters on another day; called under the lock."""
+        if self._day == day:
+            return False
+        if self._pending is not None:
+            return True
+        if day == today_ea() and not self._rebuilding.locked():
+            threading.Thread(
+                target=self._rebuild_in_background, args=(day,), name="department-counters", daemon=True
+            ).start()
+        return True
+
+    def snapshot(self, db: Session, since: Optional[int] = None) -> dict:
+        today = today_ea()
+        if self._day != today:
+            self._rebuild(db, today)
+        with self._lock:
+            changed = [
+                state.as_dict(name)
+                for name, state in sorted(self._departments.items())
+                if since is None or state.version > since
+            ]
+            return {
+                "date": today.isoformat(),
+                "cursor": self._version,
+                "departments": changed,
+            }
+
+    def _remember(self, email: str, department: str):
+        self._directory[email] = (department, monotonic())
+        self._directory.move_to_end(email)
+        while len(self._directory) > settings.DEPARTMENT_CACHE_SIZE:
+            self._directory.popitem(last=False)
+
+    def department_of(self, db: Session, email: str) -> str:
+        with self._lock:
+            cached = self._directory.get(email)
+            if cached is not None and monotonic() - cached[1] < settings.DEPARTMENT_CACHE_SECONDS:
+                self._directory.move_to_end(email)
+                return cached[0]
+        row = db.query(Employee.department).filter(Employee.email == email).first()
+        if row is None:
+            # Not cached: someone signing up on another worker is found on their next try.
+            return "Unknown"
+        department = row.department or "Unknown"
+        with self._lock:
+            self._remember(email, department)
+        return department
+
+    def employee_added(self, email: str, department: Optional[str]):
+        department = department or "Unknown"
+        with self._lock:
+            self._remember(email, department)
+            if self._pending is not None:
+                self._pending.append((self._employee_added, (email, department)))
+            if self._day is not None:
+                self._employee_added(email, department)
+
+    def _employee_added(self, email: str, department: str):
+        self._touch(department).employees += 1
+
+    def clock_in(self, email: str, department: str, day: date):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self._clock_in, (email, department, day)))
+            if not self._stale(day):
+                self._clock_in(email, department, day)
+
+    def _clock_in(self, email: str, department: str, day: date):
+        if self._day != day:
+            return
+        state = self._departments.get(department)
+        if state and (email in state.clocked_in or email in state.present):
+            return
+        self._touch(department).clocked_in.add(email)
+
+    def clock_out(self, email: str, department: str, day: date, hours: float):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self._clock_out, (email, department, day, hours)))
+            if not self._stale(day):
+                self._clock_out(email, department, day, hours)
+
+    def _clock_out(self, email: str, department: str, day: date, hours: float):
+        if self._day != day:
+            return
+        state = self._departments.get(department)
+        if state and email in state.present:
+            return
+        state = self._touch(department)
+        state.clocked_in.discard(email)
+        state.present.add(email)
+        state.month_hours += hours or 0.0
+
+
+department_counters = TenantLocal(DepartmentCounters)
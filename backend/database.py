@@ -1,11 +1,18 @@
+import os
+import threading
+from collections import OrderedDict
+from fastapi import Request
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from tenancy import DEFAULT_TENANT, current_tenant, tenant_path
+from replicas import last_write, replicas
+import settings
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./pesa_pay.db"
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
+    SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False}
 )
 
@@ -13,9 +20,90 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+# Set by POST /batch so every sub-request reuses the batch's session.
+SHARED_SESSION_KEY = "pesa_pay.db"
+
+
+class TenantEngines:
+    """
+    One SQLite file per tenant, so counties don't queue behind each other's
+    write lock. Engines are opened on first use and kept in an LRU of at
+    most `max_open`; the least recently used one is disposed when another
+    is needed. A tenant's database is migrated the first time this process
+    opens it. The default tenant is the module-level `engine` and is never
+    evicted.
+    """
+
+    def __init__(self, max_open: int):
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._open = OrderedDict()      # tenant -> sessionmaker
+        self._migrated = set()
+
+    def _connect(self, tenant: str):
+        path = tenant_path(tenant, "pesa_pay.db")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tenant_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        if tenant not in self._migrated:
+            import migrations  # migrations imports this module
+            migrations.upgrade(tenant_engine)
+            self._migrated.add(tenant)
+        return sessionmaker(autocommit=False, autoflush=False, bind=tenant_engine)
+
+    def sessionmaker(self, tenant: str) -> sessionmaker:
+        if tenant == DEFAULT_TENANT:
+            return SessionLocal
+        with self._lock:
+            factory = self._open.get(tenant)
+            if factory is not None:
+                self._open.move_to_end(tenant)
+                return factory
+            factory = self._open[tenant] = self._connect(tenant)
+            if len(self._open) > self.max_open:
+                _, evicted = self._open.popitem(last=False)
+                # Sessions still using it keep their connection until they close.
+                evicted.kw["bind"].dispose()
+            return factory
+
+    def engine(self, tenant: str):
+        return self.sessionmaker(tenant).kw["bind"]
+
+    def open_tenants(self) -> list:
+        return [DEFAULT_TENANT] + list(self._open)
+
+
+tenant_engines = TenantEngines(settings.MAX_OPEN_TENANTS)
+
+
+def tenant_session() -> Session:
+    """A new session on the current tenant's database."""
+    return tenant_engines.sessionmaker(current_tenant())()
+
+
+def get_db(request: Request):
+    shared = request.scope.get(SHARED_SESSION_KEY)
+    if shared is not None:
+        yield shared
+        return
+    db = tenant_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request):
+    """
+    Session for read-only endpoints: a replica when one is up to date with
+    this client's last write, otherwise the primary.
+    """
+    shared = request.scope.get(SHARED_SESSION_KEY)
+    if shared is not None:
+        yield shared
+        return
+    factory = replicas.pick(last_write(request.headers)) if settings.READ_REPLICAS else None
+    db = factory() if factory is not None else tenant_session()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,190 @@
+import json
+import math
+import threading
+from itertools import chain
+from time import monotonic
+from typing import Optional
+from sqlalchemy.orm import Session
+from database import tenant_session
+from models import WorkSite
+from tenancy import TenantLocal, use_tenant
+import settings
+
+# Metres per degree of latitude, and of longitude at the equator. Sites are
+# a few hundred metres across, so distances are measured on a flat
+# projection around each site (error well under a metre).
+METRES_PER_DEGREE_LAT = 110_574.0
+METRES_PER_DEGREE_LON = 111_320.0
+# A site covering more grid cells than this is checked for every point
+# instead of being put in each cell (e.g. a county-wide "field work" site).
+MAX_CELLS_PER_SITE = 1024
+
+
+def parse_polygon(points) -> tuple:
+    """((lat, lon), ...) from [[lat, lon], ...]; raises ValueError with a message fit for a 400."""
+    try:
+        polygon = tuple((float(lat), float(lon)) for lat, lon in points)
+    except (TypeError, ValueError):
+        raise ValueError("polygon must be a list of [latitude, longitude] pairs")
+    if len(polygon) < 3:
+        raise ValueError("polygon needs at least 3 points")
+    if any(not -90 <= lat <= 90 or not -180 <= lon <= 180 for lat, lon in polygon):
+        raise ValueError("polygon points must be valid latitudes and longitudes")
+    return polygon
+
+
+class Site:
+    __slots__ = ("id", "name", "department", "latitude", "longitude", "radius_m", "polygon", "bbox", "metres_per_lon")
+
+    def __init__(self, row: WorkSite):
+        self.id = row.id
+        self.name = row.name
+        self.department = row.department
+        self.latitude = row.latitude
+        self.longitude = row.longitude
+        self.radius_m = row.radius_m
+        self.polygon = parse_polygon(json.loads(row.polygon)) if row.polygon else None
+        self.metres_per_lon = METRES_PER_DEGREE_LON * math.cos(math.radians(self.latitude))
+        if self.polygon:
+            lats = [lat for lat, _ in self.polygon]
+            lons = [lon for _, lon in self.polygon]
+            self.bbox = (min(lats), min(lons), max(lats), max(lons))
+        else:
+            dlat = self.radius_m / METRES_PER_DEGREE_LAT
+            dlon = self.radius_m / max(self.metres_per_lon, 1.0)
+            self.bbox = (self.latitude - dlat, self.longitude - dlon, self.latitude + dlat, self.longitude + dlon)
+
+    def distance_m(self, lat: float, lon: float) -> float:
+        """Distance from the site's centre."""
+        return math.hypot(
+            (lat - self.latitude) * METRES_PER_DEGREE_LAT,
+            (lon - self.longitude) * self.metres_per_lon,
+        )
+
+    def contains(self, lat: float, lon: float) -> bool:
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+            return False
+        if self.polygon is None:
+            return self.distance_m(lat, lon) <= self.radius_m
+        # Ray casting: count the edges a ray eastwards from the point crosses.
+        inside = False
+        points = self.polygon
+        j = len(points) - 1
+        for i in range(len(points)):
+            lat_i, lon_i = points[i]
+            lat_j, lon_j = points[j]
+            if (lat_i > lat) != (lat_j > lat) and lon < lon_i + (lat - lat_i) * (lon_j - lon_i) / (lat_j - lat_i):
+                inside = not inside
+            j = i
+        return inside
+
+
+class _Grid:
+    __slots__ = ("cells", "wide", "fenced", "shared")
+
+    def __init__(self, cells: dict, wide: list, fenced: set, shared: bool):
+        self.cells = cells
+        self.wide = wide
+        self.fenced = fenced    # departments with a site of their own
+        self.shared = shared    # whether any site applies to every department
+
+
+class SiteIndex:
+    """
+    Active work sites of one database in a uniform grid of
+    GEOFENCE_CELL_DEGREES cells: each site is listed in every cell its
+    bounding box touches, so a lookup tests only the few sites in the
+    point's cell instead of all of them.
+    The grid is built off to the side and swapped in whole, so lookups
+    never wait for a rebuild: the first lookup builds it, reload() rebuilds
+    it after site changes in this process, and once it is older than
+    GEOFENCE_REFRESH_SECONDS (changes made by other workers) a background
+    thread rebuilds it while lookups keep using the current one.
+    """
+
+    def __init__(self, tenant: str, cell_degrees: float):
+        self.tenant = tenant
+        self.cell = cell_degrees
+        self._grid = None
+        self._loaded_at = None
+        self._first_load = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    def _key(self, lat: float, lon: float) -> tuple:
+        return math.floor(lat / self.cell), math.floor(lon / self.cell)
+
+    def _build(self, db: Session) -> _Grid:
+        cells, wide, fenced, shared = {}, [], set(), False
+        for row in db.query(WorkSite).filter(WorkSite.is_active == True):
+            site = Site(row)
+            if site.department is None:
+                shared = True
+            else:
+                fenced.add(site.department)
+            (lat_lo, lon_lo), (lat_hi, lon_hi) = self._key(*site.bbox[:2]), self._key(*site.bbox[2:])
+            if (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1) > MAX_CELLS_PER_SITE:
+                wide.append(site)
+                continue
+            for i in range(lat_lo, lat_hi + 1):
+                for j in range(lon_lo, lon_hi + 1):
+                    cells.setdefault((i, j), []).append(site)
+        return _Grid(cells, wide, fenced, shared)
+
+    def reload(self, db: Session):
+        """Rebuild now from `db` (after this process changed the sites) and swap the new grid in."""
+        loaded_at = monotonic()
+        grid = self._build(db)
+        # A background rebuild that started before this one must not replace it.
+        if self._loaded_at is None or loaded_at >= self._loaded_at:
+            self._grid, self._loaded_at = grid, loaded_at
+
+    def _refresh_in_background(self):
+        try:
+            with use_tenant(self.tenant):
+                db = tenant_session()
+                try:
+                    self.reload(db)
+                finally:
+                    db.close()
+        except Exception as e:
+            print(f"Work site index refresh failed: {e}")
+        finally:
+            self._refreshing.release()
+
+    def _current(self, db: Session) -> _Grid:
+        grid = self._grid
+        if grid is None:
+            with self._first_load:
+                if self._grid is None:
+                    self.reload(db)
+                return self._grid
+        if monotonic() - self._loaded_at > settings.GEOFENCE_REFRESH_SECONDS and self._refreshing.acquire(blocking=False):
+            threading.Thread(target=self._refresh_in_background, name="site-index-refresh", daemon=True).start()
+        return grid
+
+    def is_fenced(self, db: Session, department: str) -> bool:
+        """Whether any site applies to `department`; departments without one clock in from anywhere."""
+        grid = self._current(db)
+        return grid.shared or department in grid.fenced
+
+    def match(self, db: Session, department: str, lat: float, lon: float) -> Optional[Site]:
+        """
+        The site `department` may clock in at that contains the point,
+        preferring the department's own sites over shared ones, then the
+        nearest centre. None if there is none.
+        """
+        grid = self._current(db)
+        best, best_rank = None, None
+        for site in chain(grid.cells.get(self._key(lat, lon), ()), grid.wide):
+            if site.department is not None and site.department != department:
+                continue
+            if not site.contains(lat, lon):
+                continue
+            rank = (site.department is None, site.distance_m(lat, lon))
+            if best is None or rank < best_rank:
+                best, best_rank = site, rank
+        return best
+
+
+site_index = TenantLocal(lambda tenant: SiteIndex(tenant, settings.GEOFENCE_CELL_DEGREES))
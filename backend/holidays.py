@@ -0,0 +1,154 @@
+import threading
+from datetime import date, timedelta
+from functools import lru_cache
+from time import monotonic
+from typing import Optional
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from http_cache import change_versions
+from models import PublicHoliday
+from tenancy import TenantLocal
+
+# Kenyan public holidays that follow a rule. Holidays gazetted year by year
+# (Eid al-Fitr, one-off days) are added to public_holidays by hand and are
+# picked up by HolidayCalendar alongside these.
+FIXED_HOLIDAYS = [
+    ("New Year's Day", 1, 1),
+    ("Labour Day", 5, 1),
+    ("Madaraka Day", 6, 1),
+    ("Huduma Day", 10, 10),
+    ("Mashujaa Day", 10, 20),
+    ("Independence Day", 12, 12),
+    ("Christmas Day", 12, 25),
+    ("Boxing Day", 12, 26),
+]
+EASTER_HOLIDAYS = [
+    ("Good Friday", -2),
+    ("Easter Monday", 1),
+]
+SUNDAY = 6
+
+
+def easter_sunday(year: int) -> date:
+    """Gregorian Easter Sunday (anonymous Gregorian computus)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+@lru_cache(maxsize=None)
+def rule_holidays(year: int) -> tuple:
+    """
+    (date, name) pairs for `year`, sorted by date.
+    A holiday falling on a Sunday is also observed on the next day that is
+    neither a Sunday nor another holiday (Public Holidays Act, s. 3).
+    """
+    days = {date(year, month, day): name for name, month, day in FIXED_HOLIDAYS}
+    easter = easter_sunday(year)
+    for name, offset in EASTER_HOLIDAYS:
+        days[easter + timedelta(days=offset)] = name
+
+    observed = {}
+    for day, name in sorted(days.items()):
+        if day.weekday() != SUNDAY:
+            continue
+        substitute = day + timedelta(days=1)
+        while substitute in days or substitute in observed or substitute.weekday() == SUNDAY:
+            substitute += timedelta(days=1)
+        observed[substitute] = f"{name} (observed)"
+    days.update(observed)
+    return tuple(sorted(days.items()))
+
+
+def sync_holidays(db: Session, first_year: int, last_year: int) -> int:
+    """
+    Insert the rule-based holidays for first_year..last_year that are not
+    in public_holidays yet, in one statement. Returns the number added.
+    """
+    rows = [
+        {"date": day, "name": name}
+        for year in range(first_year, last_year + 1)
+        for day, name in rule_holidays(year)
+    ]
+    result = db.execute(
+        sqlite_insert(PublicHoliday).values(rows).on_conflict_do_nothing(
+            index_elements=[PublicHoliday.date, PublicHoliday.name]
+        )
+    )
+    db.commit()
+    if result.rowcount:
+        holiday_calendar.invalidate()
+    return result.rowcount
+
+
+class HolidayCalendar:
+    """
+    Memoized "is this a holiday?" lookups.
+    Each year is built once, from the rules plus any public_holidays rows,
+    into a dict; after that a lookup is a dict hit. Years are rebuilt once
+    public_holidays changes in any process (its change version is checked
+    at most every VERSION_CHECK_SECONDS, as payroll loops call this per day).
+    """
+
+    VERSION_CHECK_SECONDS = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._years = {}
+        self._version = None
+        self._checked_at = None
+
+    def invalidate(self):
+        """Re-check the change version on the next lookup."""
+        self._checked_at = None
+
+    def _year(self, db: Session, year: int) -> dict:
+        now = monotonic()
+        if self._checked_at is None or now - self._checked_at > self.VERSION_CHECK_SECONDS:
+            version = change_versions.version(("public_holidays",))
+            with self._lock:
+                if version != self._version:
+                    self._years = {}
+                    self._version = version
+                self._checked_at = now
+        with self._lock:
+            cached = self._years.get(year)
+            if cached:
+                return cached[1]
+
+        days = dict(rule_holidays(year))
+        rows = db.query(PublicHoliday.date, PublicHoliday.name).filter(
+            PublicHoliday.date >= date(year, 1, 1),
+            PublicHoliday.date <= date(year, 12, 31),
+        )
+        for day, name in rows:
+            days.setdefault(day, name)
+        with self._lock:
+            self._years[year] = (now, days)
+        return days
+
+    def name(self, db: Session, day: date) -> Optional[str]:
+        return self._year(db, day.year).get(day)
+
+    def is_holiday(self, db: Session, day: date) -> bool:
+        return day in self._year(db, day.year)
+
+    def between(self, db: Session, start: date, end: date) -> list:
+        """(date, name) pairs from start to end inclusive, sorted by date."""
+        return [
+            (day, name)
+            for year in range(start.year, end.year + 1)
+            for day, name in sorted(self._year(db, year).items())
+            if start <= day <= end
+        ]
+
+
+holiday_calendar = TenantLocal(lambda tenant: HolidayCalendar())
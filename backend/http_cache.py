@@ -0,0 +1,181 @@
+import hashlib
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from itertools import chain
+from time import monotonic
+from typing import Tuple
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from database import tenant_engines
+from migrations import VERSIONED_TABLES
+from tenancy import TenantLocal
+import settings
+
+SCOPE_KEY = "pesa_pay.cache_headers"
+
+
+class ChangeVersions:
+    """
+    Per-table change versions used to build ETags and Last-Modified, read
+    from the change_versions table that triggers keep up to date
+    (migrations.create_change_versions). They live in the database, so a
+    write committed by any worker changes what every worker answers.
+    Each worker keeps its last read for CHANGE_VERSION_CACHE_SECONDS
+    rather than querying on every conditional request; a commit in this
+    worker that writes a versioned table drops it at once (see
+    _note_versioned_writes), so only other workers' writes can take that
+    long to show.
+    """
+
+    def __init__(self, tenant: str):
+        self.tenant = tenant
+        self._lock = threading.Lock()
+        self._versions = None
+        self._read_at = None
+        self._generation = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._versions = None
+
+    def _read(self) -> dict:
+        with self._lock:
+            versions, read_at, generation = self._versions, self._read_at, self._generation
+        now = monotonic()
+        if versions is not None and now - read_at < settings.CHANGE_VERSION_CACHE_SECONDS:
+            return versions
+        connection = tenant_engines.engine(self.tenant).raw_connection()
+        try:
+            rows = connection.cursor().execute(
+                "SELECT table_name, version, modified_at FROM change_versions"
+            ).fetchall()
+        finally:
+            connection.close()
+        versions = {name: (version, modified_at) for name, version, modified_at in rows}
+        with self._lock:
+            # A commit that invalidated us meanwhile may not be in what was read.
+            if generation == self._generation:
+                self._versions, self._read_at = versions, now
+        return versions
+
+    def state(self, tables: Tuple[str, ...]) -> Tuple[str, int]:
+        """(version, last modified as a Unix time) of `tables` together."""
+        versions = self._read()
+        found = [versions.get(table, (0, 0)) for table in tables]
+        return ".".join(str(version) for version, _ in found), max([0] + [modified_at for _, modified_at in found])
+
+    def version(self, tables: Tuple[str, ...]) -> str:
+        return self.state(tables)[0]
+
+
+change_versions = TenantLocal(ChangeVersions)
+
+VERSIONED_WRITE = "pesa_pay.versioned_write"
+
+
+@event.listens_for(Session, "after_flush")
+def _note_versioned_writes(session, flush_context):
+    if any(obj.__tablename__ in VERSIONED_TABLES for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info[VERSIONED_WRITE] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _note_versioned_statements(orm_execute_state):
+    # Bulk insert/update/delete statements bypass the flush.
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if getattr(table, "name", None) in VERSIONED_TABLES:
+            orm_execute_state.session.info[VERSIONED_WRITE] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_cached_versions(session):
+    if session.info.pop(VERSIONED_WRITE, False):
+        change_versions.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_versioned_writes(session):
+    session.info.pop(VERSIONED_WRITE, None)
+
+
+def _not_modified_since(header: str, last_modified: int) -> bool:
+    try:
+        return parsedate_to_datetime(header).timestamp() >= last_modified
+    except (TypeError, ValueError):
+        return False
+
+
+def cache_policy(*tables: str, cache_control: str = "private, no-cache"):
+    """
+    Route dependency for read-mostly GET endpoints, e.g.
+    `@router.get("/holidays", dependencies=[cache_policy("public_holidays")])`.
+
+    The ETag changes whenever a row of one of `tables` is written (see
+    ChangeVersions); the modification time in it keeps ETags from a
+    recreated database from matching old ones.
+    Route-level dependencies run before the endpoint's own, so a matching
+    If-None-Match / If-Modified-Since is answered with 304 before a
+    database session is opened.
+    """
+    def check(request: Request):
+        scope = request.scope
+        # Compressed and identity bodies are different representations.
+        encoding = "gz" if "gzip" in request.headers.get("accept-encoding", "") else "id"
+        request_key = hashlib.blake2b(
+            scope["path"].encode() + b"?" + scope["query_string"], digest_size=8
+        ).hexdigest()
+        version, last_modified = change_versions.state(tables)
+        etag = f'"{last_modified}-{version}-{request_key}-{encoding}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(last_modified, usegmt=True),
+            "Cache-Control": cache_control,
+        }
+        if settings.MULTI_TENANT:
+            # Same URL, different county: shared caches must key on the tenant too.
+            headers["Vary"] = settings.TENANT_HEADER
+
+        # If-None-Match wins over If-Modified-Since when both are sent (RFC 9110).
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            fresh = if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]
+        else:
+            if_modified_since = request.headers.get("if-modified-since")
+            fresh = bool(if_modified_since) and _not_modified_since(if_modified_since, last_modified)
+        if fresh:
+            raise HTTPException(status_code=304, headers=headers)
+
+        carrier = scope.get(SCOPE_KEY)
+        if carrier is not None:
+            carrier.update(headers)
+
+    return Depends(check)
+
+
+class CacheHeadersMiddleware:
+    """
+    Copies the headers computed by cache_policy onto successful responses,
+    including endpoints that return a Response object directly.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+
+        carrier = scope[SCOPE_KEY] = {}
+
+        async def send_with_cache_headers(message):
+            if message["type"] == "http.response.start" and carrier and message["status"] == 200:
+                message["headers"] = list(message.get("headers", [])) + [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in carrier.items()
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache_headers)
@@ -0,0 +1,208 @@
+from datetime import date, timedelta
+from typing import Optional
+import numpy as np
+from sqlalchemy import case, func, insert, literal, select, text, update
+from sqlalchemy.orm import Session
+import analytics
+from analytics import LATE_AFTER_MINUTES, STANDARD_DAY_HOURS
+from archive import archive_year, attendance_archive, last_closed_year
+from backup import backups
+from dashboard import department_counters, today_ea
+from database import tenant_session
+from holidays import sync_holidays
+from models import Attendance, MonthlyAttendance
+from payroll import load_payroll_hours, month_payslips
+from payslips import payslip_renderer
+from scheduler import Daily, Hourly, Job, Monthly, Scheduler, utcnow
+from timekeeping import to_minutes, worked_hours_sql
+import settings
+
+AUTO_CLOSE_KEY = "auto-close"
+
+
+def month_key(day: date) -> str:
+    return f"{day.year}-{day.month:02d}"
+
+
+def month_bounds(day: date):
+    start = date(day.year, day.month, 1)
+    end = date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+    return start, end
+
+
+def auto_close_open_clock_ins(db: Session) -> dict:
+    """
+    Close clock-ins from before today that never got a clock-out, at
+    AUTO_CLOSE_AT (or at the clock-in time for shifts starting later,
+    i.e. 0 hours). They are marked with clock_out_key = "auto-close".
+    """
+    close_at = to_minutes(settings.AUTO_CLOSE_AT)
+    minutes_out = case((Attendance.minutes_in < close_at, close_at), else_=Attendance.minutes_in)
+    result = db.execute(
+        update(Attendance)
+        .where(
+            Attendance.date < today_ea(),
+            Attendance.minutes_in != None,
+            Attendance.minutes_out == None,
+        )
+        .values(
+            minutes_out=minutes_out,
+            total_hours=worked_hours_sql(Attendance.minutes_in, minutes_out),
+            # EAT is UTC+3 all year.
+            clock_out_at=func.datetime(Attendance.date, func.printf("+%d minutes", minutes_out), "-3 hours"),
+            clock_out_key=AUTO_CLOSE_KEY,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        department_counters.invalidate()
+    return {"closed": result.rowcount}
+
+
+def rollup_month(db: Session, day: date, email: Optional[str] = None) -> int:
+    """
+    Recompute attendance_monthly for the month containing `day`, for
+    everyone or just `email`. Uses the same definitions as analytics.py.
+    """
+    start, end = month_bounds(day)
+    key = month_key(day)
+
+    stale = db.query(MonthlyAttendance).filter(MonthlyAttendance.month == key)
+    if attendance_archive.segment(day.year) is not None:
+        if email:
+            stale = stale.filter(MonthlyAttendance.employee_email == email)
+        stale.delete(synchronize_session=False)
+        return _rollup_archived_month(db, start, end, key, email)
+
+    totals = select(
+        Attendance.employee_email,
+        literal(key),
+        func.coalesce(func.sum(Attendance.total_hours), 0.0),
+        func.count(Attendance.minutes_in),
+        func.sum(case((Attendance.minutes_in > LATE_AFTER_MINUTES, 1), else_=0)),
+        func.sum(case(
+            (Attendance.total_hours > STANDARD_DAY_HOURS, Attendance.total_hours - STANDARD_DAY_HOURS),
+            else_=0.0,
+        )),
+        literal(utcnow()),
+    ).where(Attendance.date >= start, Attendance.date < end).group_by(Attendance.employee_email)
+    if email:
+        stale = stale.filter(MonthlyAttendance.employee_email == email)
+        totals = totals.where(Attendance.employee_email == email)
+
+    stale.delete(synchronize_session=False)
+    result = db.execute(insert(MonthlyAttendance).from_select(
+        ["employee_email", "month", "total_hours", "attendance_days",
+         "late_arrivals", "overtime_hours", "computed_at"],
+        totals,
+    ))
+    return result.rowcount
+
+
+def _rollup_archived_month(db: Session, start: date, end: date, key: str, email: Optional[str]) -> int:
+    """rollup_month for a month of an archived year: the same totals, from the attendance table plus the segment."""
+    frame = analytics.load_attendance(db, start, end - timedelta(days=1))
+    summary = analytics.employee_summary(frame)
+    rows = np.bincount(frame.employee, minlength=frame.employee_count)
+    computed_at = utcnow()
+    values = [
+        {
+            "employee_email": frame.emails[i],
+            "month": key,
+            "total_hours": float(summary["total_hours"][i]),
+            "attendance_days": int(summary["attendance_days"][i]),
+            "late_arrivals": int(summary["late_arrivals"][i]),
+            "overtime_hours": float(summary["overtime_hours"][i]),
+            "computed_at": computed_at,
+        }
+        for i in np.flatnonzero(rows)
+        if email is None or frame.emails[i] == email
+    ]
+    if values:
+        db.execute(insert(MonthlyAttendance), values)
+    return len(values)
+
+
+def nightly_attendance_rollup(db: Session) -> dict:
+    today = today_ea()
+    return {"month": month_key(today), "employees": rollup_month(db, today)}
+
+
+def close_month_payroll(db: Session) -> dict:
+    """Final totals for the month that just ended; salary endpoints read closed months from here."""
+    closing = today_ea().replace(day=1) - timedelta(days=1)
+    employees = rollup_month(db, closing)
+    total_hours = db.query(func.coalesce(func.sum(MonthlyAttendance.total_hours), 0.0)).filter(
+        MonthlyAttendance.month == month_key(closing)
+    ).scalar()
+    return {"month": month_key(closing), "employees": employees, "total_hours": round(total_hours, 2)}
+
+
+def render_month_payslips(db: Session) -> dict:
+    """
+    Render the month that just ended's payslips into the cache, so
+    month-end downloads are served from disk, and drop cached months older
+    than PAYSLIP_KEEP_MONTHS.
+    """
+    closing = today_ea().replace(day=1) - timedelta(days=1)
+    month_start = closing.replace(day=1)
+    payslips = month_payslips(load_payroll_hours(db, month_start, closing + timedelta(days=1)))
+    rendered, cached = payslip_renderer.rendered, payslip_renderer.cached
+    for _ in payslip_renderer.render_all(payslips):
+        pass
+    year, month = divmod(closing.year * 12 + closing.month - settings.PAYSLIP_KEEP_MONTHS, 12)
+    return {
+        "month": month_key(closing),
+        "payslips": len(payslips),
+        "rendered": payslip_renderer.rendered - rendered,
+        "cached": payslip_renderer.cached - cached,
+        "evicted": payslip_renderer.evict(f"{year}-{month + 1:02d}"),
+    }
+
+
+def generate_holidays(db: Session) -> dict:
+    """Make sure this year's and next year's rule-based holidays are in public_holidays."""
+    year = today_ea().year
+    return {"years": [year, year + 1], "added": sync_holidays(db, year, year + 1)}
+
+
+def archive_attendance_year(db: Session, year: int) -> dict:
+    """Roll up every month of `year` while its rows are still hot, then move them to the archive."""
+    for month in range(1, 13):
+        rollup_month(db, date(year, month, 1))
+    db.commit()
+    return archive_year(db, year)
+
+
+def archive_closed_years(db: Session) -> dict:
+    """Archive every closed year that still has rows in the attendance table."""
+    last = last_closed_year(settings.ARCHIVE_GRACE_DAYS)
+    years = db.execute(
+        text("SELECT DISTINCT substr(date, 1, 4) FROM attendance WHERE date <= :end"),
+        {"end": f"{last}-12-31"},
+    ).scalars().all()
+    return {"years": [archive_attendance_year(db, int(year)) for year in sorted(years)]}
+
+
+def backup_database(db: Session) -> dict:
+    """Online, throttled snapshot of this tenant's database into its rotating backup set."""
+    manifest = backups.snapshot()
+    return {key: manifest[key] for key in ("file", "compressed_bytes", "copy_ms", "total_ms", "restarts", "removed")}
+
+
+def warm_department_dashboard(db: Session) -> dict:
+    """Rebuild this worker's dashboard counters before the first admin of the day asks."""
+    snapshot = department_counters.snapshot(db)
+    return {"departments": len(snapshot["departments"])}
+
+
+scheduler = Scheduler(tenant_session)
+scheduler.add(Job("auto_close_clock_ins", auto_close_open_clock_ins, Daily(0, 15)))
+scheduler.add(Job("attendance_rollup", nightly_attendance_rollup, Daily(0, 30)))
+scheduler.add(Job("month_end_payroll", close_month_payroll, Monthly(1, 1, 0)))
+scheduler.add(Job("month_end_payslips", render_month_payslips, Monthly(1, 1, 30), lease_seconds=3600))
+scheduler.add(Job("generate_holidays", generate_holidays, Daily(0, 5)))
+scheduler.add(Job("archive_closed_years", archive_closed_years, Monthly(1, 2, 0), lease_seconds=3600))
+scheduler.add(Job("warm_department_dashboard", warm_department_dashboard, Daily(0, 45), exclusive=False))
+if settings.BACKUPS:
+    scheduler.add(Job("backup_database", backup_database, Hourly(10)))
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from collections import deque
+from typing import Optional
+from tenancy import TenantLocal
+
+HISTORY_SIZE = 5000
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+
+
+class Subscriber:
+    __slots__ = ("queue", "department", "dropped")
+
+    def __init__(self, department: Optional[str]):
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.department = department
+        self.dropped = False
+
+    def wants(self, event: dict) -> bool:
+        return self.department is None or event.get("department") == self.department
+
+
+class AttendanceBroker:
+    """
+    In-process pub/sub for clock events.
+    publish() is called from the (threaded) request handlers; delivery
+    happens on the event loop. Every event gets an increasing id and the
+    last HISTORY_SIZE events are kept so reconnecting clients can replay
+    what they missed. A subscriber whose queue fills up is dropped rather
+    than slowing everyone else down.
+    """
+
+    # Shared by every tenant's broker: they all deliver on the server's loop.
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._next_id = 1
+        self._subscribers = set()
+        self.dropped_subscribers = 0
+
+    @classmethod
+    def bind(cls, loop: asyncio.AbstractEventLoop):
+        cls._loop = loop
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: dict):
+        with self._lock:
+            event_id = self._next_id
+            self._next_id += 1
+            self._history.append((event_id, event))
+        if self._loop and self._subscribers:
+            self._loop.call_soon_threadsafe(self._fan_out, event_id, event)
+
+    def _fan_out(self, event_id: int, event: dict):
+        for subscriber in list(self._subscribers):
+            if not subscriber.wants(event):
+                continue
+            try:
+                subscriber.queue.put_nowait((event_id, event))
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    def _drop(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        subscriber.dropped = True
+        self.dropped_subscribers += 1
+        # Make room for the end-of-stream marker; the client replays the gap on reconnect.
+        subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    async def subscribe(self, department: Optional[str] = None, last_event_id: Optional[int] = None):
+        """
+        Yield (event_id, event) pairs, or None every HEARTBEAT_SECONDS while idle.
+        Events after last_event_id still in the history are replayed first.
+        """
+        subscriber = Subscriber(department)
+        self._subscribers.add(subscriber)
+        try:
+            replayed = 0
+            if last_event_id is not None:
+                with self._lock:
+                    backlog = [item for item in self._history if item[0] > last_event_id]
+                for event_id, event in backlog:
+                    if subscriber.wants(event):
+                        yield event_id, event
+                    replayed = event_id
+
+            while True:
+                try:
+                    # Only pay for a timeout wrapper when there is nothing to deliver.
+                    item = subscriber.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    try:
+                        item = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield None
+                        continue
+                if item is None:
+                    return
+                if item[0] > replayed:
+                    yield item
+        finally:
+            self._subscribers.discard(subscriber)
+
+
+broker = TenantLocal(lambda tenant: AttendanceBroker())
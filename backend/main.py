@@ -1,14 +1,31 @@
+import asyncio
 import calendar
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from routers import calendar_routers
-from routers import auth, admin, salary, attendance
+from routers import auth, admin, salary, attendance, batch, sync
+import migrations
+import settings
+from batching import clock_queue
+from jobs import scheduler
+from live_feed import broker
+from responses import FastJSONResponse
+from http_cache import CacheHeadersMiddleware
+from traffic import LoadShedMiddleware, RateLimitMiddleware
+from tenancy import TenantMiddleware
+from replicas import WROTE_HEADER, ReadYourWritesMiddleware
+from payslips import payslip_renderer
+from outbox import outbox_relay
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    migrations.upgrade()
+    broker.bind(asyncio.get_running_loop())
+
     print("\n" + "="*50)
     print("PESA PAY BACKEND STARTING UP")
     print("="*50)
@@ -24,8 +41,23 @@ async def lifespan(app: FastAPI):
             print(f"  [ROUTE]     {route}")
     print("="*50)
 
+    if settings.CLOCK_BATCHING:
+        clock_queue.start()
+        print(f"Clock batching on ({settings.CLOCK_DURABILITY} durability)")
+    if settings.SCHEDULER:
+        scheduler.start()
+    if settings.OUTBOX:
+        outbox_relay.start()
+    if settings.MULTI_TENANT:
+        print(f"Multi-tenant mode: {', '.join(settings.TENANTS) or 'no extra tenants'}")
+
     yield
 
+    scheduler.stop()
+    clock_queue.stop()
+    # After the clock queue, so its last writes are relayed too.
+    outbox_relay.stop()
+    payslip_renderer.shutdown()
     print("PESA PAY BACKEND SHUTTING DOWN")
     print("="*50)
 
@@ -33,15 +65,33 @@ app = FastAPI(
     title="Pesa Pay API",
     description="Employee payroll and attendance system",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    **({"default_response_class": FastJSONResponse} if settings.FAST_JSON else {}),
 )
 
+app.add_middleware(CacheHeadersMiddleware)
+# Everything below routing (sessions, caches, the live feed) uses the tenant set here.
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(TenantMiddleware)
+# Rate limiting runs before load shedding so refused requests never queue;
+# both sit inside CORS so browsers can read the 429/503.
+app.add_middleware(LoadShedMiddleware)
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Flutter web must be able to read it to echo it back.
+    expose_headers=[WROTE_HEADER],
+)
+
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=settings.GZIP_MINIMUM_SIZE,
+    compresslevel=settings.GZIP_LEVEL,
 )
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -60,4 +110,6 @@ app.include_router(auth.router, prefix="/api/v1")
 app.include_router(admin.router, prefix="/api/v1")
 app.include_router(salary.router, prefix="/api/v1")
 app.include_router(attendance.router, prefix="/api/v1")
-app.include_router(calendar_routers.router, prefix="/api/v1")
\ No newline at end of file
+app.include_router(calendar_routers.router, prefix="/api/v1")
+app.include_router(batch.router, prefix="/api/v1")
+app.include_router(sync.router, prefix="/api/v1")
\ No newline at end of file
@@ -0,0 +1,514 @@
+import re
+from datetime import datetime
+from sqlalchemy import bindparam, inspect, text
+from database import engine, Base
+import models  # noqa: F401  (registers tables on Base.metadata)
+import settings
+from timekeeping import worked_hours
+
+
+def add_column_if_missing(conn, table: str, column: str, ddl: str):
+    """
+    Add a column to an existing table.
+    Base.metadata.create_all() never alters tables that already exist,
+    so new columns on old databases are added here.
+    """
+    columns = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        print(f"Migrated: added {table}.{column}")
+
+
+def _minutes_sql(column: str) -> str:
+    """SQL for "H:MM" / "HH:MM" (optionally ":SS") in `column` as minutes after midnight."""
+    value = f"trim({column})"
+    colon = f"instr({value}, ':')"
+    return (
+        f"CAST(substr({value}, 1, {colon} - 1) AS INTEGER) * 60"
+        f" + CAST(substr({value}, {colon} + 1, 2) AS INTEGER)"
+    )
+
+
+def _parse_clock_string(value):
+    """Minutes after midnight for a stored time string, None when blank; raises ValueError."""
+    if value is None or not value.strip():
+        return None
+    value = value.strip()
+    parsed = datetime.strptime(value, "%H:%M:%S" if value.count(":") == 2 else "%H:%M")
+    return parsed.hour * 60 + parsed.minute
+
+
+def verify_attendance_minutes(conn):
+    """
+    Check every converted row against its original string (parsed by
+    Python, not SQL) before the string columns are dropped; raises if
+    any differ, which rolls the whole upgrade back.
+    """
+    rows = conn.execute(text("""
+        SELECT a.id, b.time_in, b.time_out, a.minutes_in, a.minutes_out
+        FROM attendance_time_strings b JOIN attendance a ON a.id = b.id
+    """))
+    bad = []
+    for row_id, time_in, time_out, minutes_in, minutes_out in rows:
+        try:
+            if (_parse_clock_string(time_in), _parse_clock_string(time_out)) != (minutes_in, minutes_out):
+                bad.append(row_id)
+        except ValueError:
+            bad.append(row_id)
+    if bad:
+        raise RuntimeError(
+            f"attendance times did not convert cleanly for ids {bad[:20]}"
+            f"{' ...' if len(bad) > 20 else ''}; fix time_in/time_out on those rows and restart"
+        )
+
+
+def migrate_attendance_minutes(conn):
+    """
+    Convert attendance.time_in/time_out "HH:MM" strings into integer minutes,
+    backfill clock timestamps (EAT is UTC+3 all year) and total_hours, then
+    drop the string columns.
+    The original strings are copied to attendance_time_strings first and
+    kept there; the columns are dropped only once every converted value
+    has been checked against them.
+    """
+    for column in ("minutes_in", "minutes_out"):
+        add_column_if_missing(conn, "attendance", column, "INTEGER")
+    for column in ("clock_in_at", "clock_out_at"):
+        add_column_if_missing(conn, "attendance", column, "DATETIME")
+
+    columns = {c["name"] for c in inspect(conn).get_columns("attendance")}
+    if "time_in" not in columns:
+        return
+
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS attendance_time_strings (
+            id INTEGER PRIMARY KEY,
+            time_in VARCHAR,
+            time_out VARCHAR
+        )
+    """))
+    conn.execute(text("""
+        INSERT OR IGNORE INTO attendance_time_strings (id, time_in, time_out)
+        SELECT id, time_in, time_out FROM attendance
+    """))
+
+    conn.execute(text(f"""
+        UPDATE attendance SET minutes_in = {_minutes_sql("time_in")}
+        WHERE instr(time_in, ':') > 0 AND minutes_in IS NULL
+    """))
+    conn.execute(text(f"""
+        UPDATE attendance SET minutes_out = {_minutes_sql("time_out")}
+        WHERE instr(time_out, ':') > 0 AND minutes_out IS NULL
+    """))
+    conn.execute(text("""
+        UPDATE attendance SET
+            clock_in_at = datetime(date, '+' || minutes_in || ' minutes', '-3 hours')
+        WHERE minutes_in IS NOT NULL AND clock_in_at IS NULL
+    """))
+    conn.execute(text("""
+        UPDATE attendance SET
+            clock_out_at = datetime(
+                date,
+                '+' || (minutes_out + CASE WHEN minutes_out < minutes_in THEN 1440 ELSE 0 END) || ' minutes',
+                '-3 hours'
+            )
+        WHERE minutes_in IS NOT NULL AND minutes_out IS NOT NULL AND clock_out_at IS NULL
+    """))
+    conn.execute(text("""
+        UPDATE attendance SET
+            total_hours = round(
+                (minutes_out - minutes_in + CASE WHEN minutes_out < minutes_in THEN 1440 ELSE 0 END) / 60.0,
+                2
+            )
+        WHERE minutes_in IS NOT NULL AND minutes_out IS NOT NULL
+    """))
+
+    verify_attendance_minutes(conn)
+    conn.execute(text("ALTER TABLE attendance DROP COLUMN time_in"))
+    conn.execute(text("ALTER TABLE attendance DROP COLUMN time_out"))
+    print("Migrated: attendance times stored as minutes (originals kept in attendance_time_strings)")
+
+
+def create_employee_search_index(conn):
+    """
+    FTS5 index over employee name, email, department and phone.
+    It is an external-content table kept in sync with `employees` by
+    triggers, so every write path (ORM, seeds, manual SQL) updates it.
+    """
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'employee_search'"
+    )).first()
+    if exists:
+        return
+
+    conn.execute(text("""
+        CREATE VIRTUAL TABLE employee_search USING fts5(
+            name, email, department, phone,
+            content='employees', content_rowid='id',
+            tokenize='unicode61', prefix='1 2 3 4 5 6'
+        )
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER employee_search_insert AFTER INSERT ON employees BEGIN
+            INSERT INTO employee_search (rowid, name, email, department, phone)
+            VALUES (new.id, new.name, new.email, new.department, new.phone);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER employee_search_delete AFTER DELETE ON employees BEGIN
+            INSERT INTO employee_search (employee_search, rowid, name, email, department, phone)
+            VALUES ('delete', old.id, old.name, old.email, old.department, old.phone);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER employee_search_update AFTER UPDATE OF name, email, department, phone ON employees BEGIN
+            INSERT INTO employee_search (employee_search, rowid, name, email, department, phone)
+            VALUES ('delete', old.id, old.name, old.email, old.department, old.phone);
+            INSERT INTO employee_search (rowid, name, email, department, phone)
+            VALUES (new.id, new.name, new.email, new.department, new.phone);
+        END
+    """))
+    conn.execute(text("INSERT INTO employee_search (employee_search) VALUES ('rebuild')"))
+    print("Migrated: created employee_search index")
+
+
+SYNCED_TABLES = ("attendance", "shared_events", "calendar_events", "public_holidays")
+
+
+def _sync_stamp(table: str) -> str:
+    """Trigger body giving the row `new.id` of `table` the next sync sequence value."""
+    return f"""
+        UPDATE sync_sequence SET value = value + 1;
+        UPDATE {table} SET
+            sync_seq = (SELECT value FROM sync_sequence),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = new.id;
+    """
+
+
+def create_sync_tracking(conn):
+    """
+    Stamp every insert/update on the synced tables with the next value of a
+    global sequence, and record deletes as tombstones, for GET /sync.
+    Triggers rather than ORM hooks, so the raw clock-in upserts and the
+    seed scripts are tracked too. SQLite has a single writer, so sequence
+    values become visible in commit order.
+    """
+    for table in SYNCED_TABLES:
+        add_column_if_missing(conn, table, "sync_seq", "INTEGER")
+        add_column_if_missing(conn, table, "updated_at", "DATETIME")
+
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sync_sequence'"
+    )).first()
+    if exists:
+        return
+
+    conn.execute(text("CREATE TABLE sync_sequence (value INTEGER NOT NULL)"))
+    conn.execute(text("INSERT INTO sync_sequence (value) VALUES (0)"))
+    conn.execute(text("""
+        CREATE TABLE sync_tombstones (
+            seq INTEGER PRIMARY KEY,
+            table_name VARCHAR NOT NULL,
+            row_id INTEGER NOT NULL
+        )
+    """))
+
+    for table in SYNCED_TABLES:
+        # Existing rows get distinct sequence values in id order.
+        conn.execute(text(f"""
+            UPDATE {table} SET
+                sync_seq = (SELECT value FROM sync_sequence) + id,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE sync_seq IS NULL
+        """))
+        conn.execute(text(f"""
+            UPDATE sync_sequence SET value = value + coalesce((SELECT max(id) FROM {table}), 0)
+        """))
+
+        stamp = _sync_stamp(table)
+        conn.execute(text(f"CREATE TRIGGER {table}_sync_insert AFTER INSERT ON {table} BEGIN {stamp} END"))
+        # The WHEN clause keeps the trigger's own stamping update from re-firing it.
+        conn.execute(text(f"""
+            CREATE TRIGGER {table}_sync_update AFTER UPDATE ON {table}
+            WHEN new.sync_seq IS old.sync_seq BEGIN {stamp} END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER {table}_sync_delete AFTER DELETE ON {table} BEGIN
+                UPDATE sync_sequence SET value = value + 1;
+                INSERT INTO sync_tombstones (seq, table_name, row_id)
+                VALUES ((SELECT value FROM sync_sequence), '{table}', old.id);
+            END
+        """))
+    print("Migrated: created sync tracking")
+
+
+# The column GET /sync filters each table on (?email=, ?department=).
+SYNC_FILTER_COLUMNS = {"attendance": "employee_email", "shared_events": "target_department"}
+
+
+def create_sync_moves(conn):
+    """
+    A row whose SYNC_FILTER_COLUMNS value changes leaves the filtered view
+    of clients that synced it. Record a tombstone scoped to the old value
+    ('' for a global shared event) that GET /sync hands to those clients,
+    then stamp the row again so clients matching the new value get it after
+    the tombstone, whichever update trigger SQLite runs first.
+    """
+    add_column_if_missing(conn, "sync_tombstones", "scope", "VARCHAR")
+    existing = {name for (name,) in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+    for table, column in SYNC_FILTER_COLUMNS.items():
+        if f"{table}_sync_move" in existing:
+            continue
+        conn.execute(text(f"""
+            CREATE TRIGGER {table}_sync_move AFTER UPDATE OF {column} ON {table}
+            WHEN old.{column} IS NOT new.{column} BEGIN
+                UPDATE sync_sequence SET value = value + 1;
+                INSERT INTO sync_tombstones (seq, table_name, row_id, scope)
+                VALUES ((SELECT value FROM sync_sequence), '{table}', old.id, coalesce(old.{column}, ''));
+                {_sync_stamp(table)}
+            END
+        """))
+        print(f"Migrated: created {table}_sync_move trigger")
+
+
+# Tables behind cache_policy() ETags (http_cache.ChangeVersions).
+VERSIONED_TABLES = ("employees", "public_holidays", "calendar_events", "shared_events")
+
+
+def create_change_versions(conn):
+    """
+    Count writes to each VERSIONED_TABLES table in change_versions, with
+    the time of the last one. Triggers, so every worker process and every
+    writer (raw statements, seed scripts) moves the version.
+    """
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS change_versions (
+            table_name VARCHAR PRIMARY KEY,
+            version INTEGER NOT NULL,
+            modified_at INTEGER NOT NULL
+        )
+    """))
+    for table in VERSIONED_TABLES:
+        conn.execute(text(
+            "INSERT OR IGNORE INTO change_versions (table_name, version, modified_at) "
+            "VALUES (:table, 0, CAST(strftime('%s', 'now') AS INTEGER))"
+        ), {"table": table})
+        for op in ("insert", "update", "delete"):
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{op} AFTER {op.upper()} ON {table} BEGIN
+                    UPDATE change_versions
+                    SET version = version + 1, modified_at = CAST(strftime('%s', 'now') AS INTEGER)
+                    WHERE table_name = '{table}';
+                END
+            """))
+
+
+# Delete triggers that archive.archive_year() must not fire: moving a closed
+# year into its segment is not a deletion for sync clients or outbox
+# consumers. The archive transaction holds a row in archive_guard while it
+# deletes; the row never commits, so other connections' deletes are tracked.
+ARCHIVE_GUARDED_TRIGGERS = ("attendance_sync_delete", "attendance_outbox_delete")
+
+
+def create_archive_guard(conn):
+    """Add archive_guard and the WHEN clause that checks it to ARCHIVE_GUARDED_TRIGGERS."""
+    conn.execute(text("CREATE TABLE IF NOT EXISTS archive_guard (year INTEGER NOT NULL)"))
+    triggers = conn.execute(text(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN "
+        f"({', '.join(repr(name) for name in ARCHIVE_GUARDED_TRIGGERS)})"
+    )).all()
+    for name, sql in triggers:
+        if "archive_guard" in sql:
+            continue
+        conn.execute(text(f"DROP TRIGGER {name}"))
+        conn.execute(text(re.sub(
+            r"\sBEGIN\s", " WHEN NOT EXISTS (SELECT 1 FROM archive_guard) BEGIN ", sql, count=1
+        )))
+        print(f"Migrated: {name} skips archive deletes")
+
+
+# Columns each change record carries (never employees.password). Updates
+# are recorded only when one of them is set, so sync stamping and password
+# changes don't produce records.
+OUTBOX_COLUMNS = {
+    "attendance": (
+        "employee_email", "date", "minutes_in", "minutes_out", "clock_in_at", "clock_out_at",
+        "total_hours", "status",
+    ),
+    "employees": (
+        "name", "email", "phone", "gender", "department", "salary", "bank_name", "account_number", "is_admin",
+    ),
+    "calendar_events": ("title", "date", "type", "description", "recurrence", "recurrence_exceptions"),
+    "shared_events": (
+        "title", "description", "event_date", "event_type", "created_by", "is_active",
+        "target_department", "recurrence", "recurrence_exceptions",
+    ),
+}
+
+
+def create_outbox(conn, enabled: bool = True):
+    """
+    Record every insert, update and delete on the OUTBOX_COLUMNS tables as
+    a row in `outbox`, written by triggers in the same transaction as the
+    change, for the relay in outbox.py. Triggers for the same reason as
+    sync tracking: the raw clock-in upserts, jobs and seed scripts are
+    captured too. With PESA_PAY_OUTBOX off the triggers are dropped.
+    """
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name VARCHAR NOT NULL,
+            row_id INTEGER NOT NULL,
+            op VARCHAR NOT NULL,
+            payload TEXT NOT NULL,
+            created_at VARCHAR NOT NULL
+        )
+    """))
+    # How far each consumer of the segment files has confirmed reading.
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS outbox_consumers (
+            name VARCHAR PRIMARY KEY,
+            acked_seq INTEGER NOT NULL,
+            updated_at VARCHAR NOT NULL
+        )
+    """))
+    existing = {name for (name,) in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+
+    for table, columns in OUTBOX_COLUMNS.items():
+        names = {op: f"{table}_outbox_{op}" for op in ("insert", "update", "delete")}
+        if not enabled:
+            for name in names.values():
+                if name in existing:
+                    conn.execute(text(f"DROP TRIGGER {name}"))
+            continue
+        if names["insert"] in existing:
+            continue
+
+        def record(op, row):
+            payload = ", ".join(f"'{c}', {row}.{c}" for c in ("id",) + columns)
+            return f"""
+                INSERT INTO outbox (table_name, row_id, op, payload, created_at)
+                VALUES ('{table}', {row}.id, '{op}', json_object({payload}),
+                        strftime('%Y-%m-%dT%H:%M:%fZ', 'now'));
+            """
+
+        conn.execute(text(f"""
+            CREATE TRIGGER {names['insert']} AFTER INSERT ON {table} BEGIN {record('insert', 'new')} END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER {names['update']} AFTER UPDATE OF {', '.join(columns)} ON {table}
+            BEGIN {record('update', 'new')} END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER {names['delete']} AFTER DELETE ON {table} BEGIN {record('delete', 'old')} END
+        """))
+        print(f"Migrated: created outbox triggers on {table}")
+
+
+def dedupe_public_holidays(conn):
+    """Drop repeated (date, name) holidays so their unique index can be built."""
+    result = conn.execute(text("""
+        DELETE FROM public_holidays
+        WHERE id NOT IN (SELECT min(id) FROM public_holidays GROUP BY date, name)
+    """))
+    if result.rowcount:
+        print(f"Migrated: removed {result.rowcount} duplicate public holidays")
+
+
+def dedupe_attendance(conn):
+    """
+    Merge attendance rows that share (employee_email, date), left by
+    concurrent clock-ins before the upsert, so the unique index the upsert
+    relies on can be built. The merged row keeps the earliest clock-in and
+    the latest clock-out of the group.
+    """
+    duplicates = conn.execute(text("""
+        SELECT id, employee_email, date, minutes_in, minutes_out, clock_in_at, clock_out_at,
+               clock_in_key, clock_out_key, total_hours
+        FROM attendance
+        WHERE (employee_email, date) IN (
+            SELECT employee_email, date FROM attendance GROUP BY employee_email, date HAVING count(*) > 1
+        )
+        ORDER BY employee_email, date, id
+    """)).all()
+    if not duplicates:
+        return
+
+    groups = {}
+    for row in duplicates:
+        groups.setdefault((row.employee_email, row.date), []).append(row)
+    for rows in groups.values():
+        keep = rows[0]
+        clocked_in = [r for r in rows if r.minutes_in is not None]
+        clocked_out = [r for r in rows if r.minutes_out is not None]
+        first_in = min(clocked_in, key=lambda r: r.minutes_in, default=None)
+        # Prefer the stored timestamp: minutes_out alone can't tell a shift past midnight from an early one.
+        last_out = max(
+            clocked_out, key=lambda r: (r.clock_out_at is not None, r.clock_out_at or "", r.minutes_out), default=None,
+        )
+        minutes_in = first_in.minutes_in if first_in else None
+        minutes_out = last_out.minutes_out if last_out else None
+        conn.execute(text("""
+            UPDATE attendance SET
+                minutes_in = :minutes_in, clock_in_at = :clock_in_at, clock_in_key = :clock_in_key,
+                minutes_out = :minutes_out, clock_out_at = :clock_out_at, clock_out_key = :clock_out_key,
+                total_hours = :total_hours
+            WHERE id = :id
+        """), {
+            "id": keep.id,
+            "minutes_in": minutes_in,
+            "clock_in_at": first_in.clock_in_at if first_in else None,
+            "clock_in_key": first_in.clock_in_key if first_in else None,
+            "minutes_out": minutes_out,
+            "clock_out_at": last_out.clock_out_at if last_out else None,
+            "clock_out_key": last_out.clock_out_key if last_out else None,
+            "total_hours": worked_hours(minutes_in, minutes_out) if last_out else keep.total_hours,
+        })
+        conn.execute(
+            text("DELETE FROM attendance WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+            {"ids": [r.id for r in rows[1:]]},
+        )
+    print(f"Migrated: merged {len(duplicates) - len(groups)} duplicate attendance rows")
+
+
+def upgrade(bind=engine):
+    """
+    Bring an existing pesa_pay.db (or a tenant's database) up to the
+    current models. Safe to run on every startup.
+    """
+    Base.metadata.create_all(bind=bind)
+
+    with bind.begin() as conn:
+        add_column_if_missing(conn, "attendance", "clock_in_key", "VARCHAR")
+        add_column_if_missing(conn, "attendance", "clock_out_key", "VARCHAR")
+        add_column_if_missing(conn, "attendance", "clock_in_site_id", "INTEGER")
+        add_column_if_missing(conn, "attendance", "clock_out_site_id", "INTEGER")
+        for table in ("calendar_events", "shared_events"):
+            add_column_if_missing(conn, table, "recurrence", "VARCHAR")
+            add_column_if_missing(conn, table, "recurrence_exceptions", "TEXT")
+            add_column_if_missing(conn, table, "recurs_until", "DATE")
+
+        migrate_attendance_minutes(conn)
+        create_employee_search_index(conn)
+        create_sync_tracking(conn)
+        create_sync_moves(conn)
+        create_change_versions(conn)
+        create_outbox(conn, settings.OUTBOX)
+        create_archive_guard(conn)
+        dedupe_public_holidays(conn)
+        dedupe_attendance(conn)
+
+        # create_all() skips indexes on tables that already exist, e.g. the
+        # unique (employee_email, date) index the clock-in upsert relies on.
+        existing = {name for (name,) in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=conn)
+                    print(f"Migrated: created index {index.name}")
+
+
+if __name__ == "__main__":
+    upgrade()
+    print("Database is up to date.")
@@ -1,6 +1,8 @@
 from datetime import datetime
-from sqlalchemy import Boolean, Column, Date, DateTime, Enum, Float, Integer, String, Text
+from sqlalchemy import Boolean, Column, Date, DateTime, Enum, Float, Index, Integer, String, Text, func
+from sqlalchemy.ext.hybrid import hybrid_property
 from database import Base
+from timekeeping import to_hhmm, to_minutes, worked_hours
 
 class Employee(Base):
     __tablename__ = "employees"
@@ -17,16 +19,86 @@ class Employee(Base):
     password = Column(String)
     is_admin = Column(Boolean, default=False)
 
+    # ix_employees_name also serves the (name, id) directory keyset: id is the
+    # rowid, which SQLite appends to every index.
+    __table_args__ = (
+        Index("ix_employees_name_lower", func.lower(name)),
+        Index("ix_employees_email_lower", func.lower(email)),
+        Index("ix_employees_department_name", "department", "name"),
+    )
+
 class Attendance(Base):
     __tablename__ = "attendance"
 
     id = Column(Integer, primary_key=True, index=True)
     employee_email = Column(String, index=True)
     date = Column(Date)
-    time_in = Column(String)
-    time_out = Column(String)
+    minutes_in = Column(Integer)    # minutes since midnight, East Africa Time
+    minutes_out = Column(Integer)
+    clock_in_at = Column(DateTime(timezone=True))    # UTC
+    clock_out_at = Column(DateTime(timezone=True))
     total_hours = Column(Float)
     status = Column(String, default="present")
+    clock_in_key = Column(String, nullable=True)
+    clock_out_key = Column(String, nullable=True)
+    # Work site the clock-in/clock-out was made from (see geofence.py); NULL
+    # when it sent no coordinates or matched no site.
+    clock_in_site_id = Column(Integer, nullable=True)
+    clock_out_site_id = Column(Integer, nullable=True)
+    # Maintained by triggers (see migrations.create_sync_tracking) for GET /sync.
+    sync_seq = Column(Integer)
+    updated_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("uq_attendance_employee_date", "employee_email", "date", unique=True),
+        Index("ix_attendance_employee_sync", "employee_email", "sync_seq"),
+        Index("ix_attendance_sync_seq", "sync_seq"),
+    )
+
+    @hybrid_property
+    def time_in(self):
+        return to_hhmm(self.minutes_in)
+
+    @time_in.setter
+    def time_in(self, value):
+        self.minutes_in = to_minutes(value)
+        self._update_total_hours()
+
+    @time_in.expression
+    def time_in(cls):
+        return cls.minutes_in
+
+    @hybrid_property
+    def time_out(self):
+        return to_hhmm(self.minutes_out)
+
+    @time_out.setter
+    def time_out(self, value):
+        self.minutes_out = to_minutes(value)
+        self._update_total_hours()
+
+    @time_out.expression
+    def time_out(cls):
+        return cls.minutes_out
+
+    def _update_total_hours(self):
+        hours = worked_hours(self.minutes_in, self.minutes_out)
+        if hours is not None:
+            self.total_hours = hours
+
+class WorkSite(Base):
+    """A place clock-ins are accepted from: a circle (radius_m around latitude/longitude) or a polygon."""
+    __tablename__ = "work_sites"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    department = Column(String, nullable=True, index=True)  # NULL: a site for every department
+    latitude = Column(Float, nullable=False)    # centre; for polygons, the mean of the vertices
+    longitude = Column(Float, nullable=False)
+    radius_m = Column(Float, nullable=True)
+    polygon = Column(Text, nullable=True)       # JSON [[lat, lon], ...]
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class PublicHoliday(Base):
     __tablename__ = "public_holidays"
@@ -34,6 +106,13 @@ class PublicHoliday(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     date = Column(Date, nullable=False, index=True)
+    sync_seq = Column(Integer, index=True)
+    updated_at = Column(DateTime)
+
+    __table_args__ = (
+        # Lets holidays.sync_holidays() insert with ON CONFLICT DO NOTHING.
+        Index("uq_public_holidays_date_name", "date", "name", unique=True),
+    )
 
 class CalendarEvent(Base):
     __tablename__ = "calendar_events"
@@ -43,6 +122,12 @@ class CalendarEvent(Base):
     date = Column(Date, nullable=False)
     type = Column(String, nullable=False)
     description = Column(Text, nullable=True)
+    # RRULE-style repeat rule (see recurrence.py); `date` is the first occurrence.
+    recurrence = Column(String, nullable=True)
+    recurrence_exceptions = Column(Text, nullable=True)
+    recurs_until = Column(Date, nullable=True)  # last occurrence; NULL while a series has no end
+    sync_seq = Column(Integer, index=True)
+    updated_at = Column(DateTime)
 
 class SharedEvent(Base):
     __tablename__ = "shared_events"
@@ -57,4 +142,38 @@ class SharedEvent(Base):
     is_active = Column(Boolean, default=True)
     
     
-    target_department = Column(String, nullable=True)
\ No newline at end of file
+    target_department = Column(String, nullable=True)
+    recurrence = Column(String, nullable=True)
+    recurrence_exceptions = Column(Text, nullable=True)
+    recurs_until = Column(Date, nullable=True)
+    sync_seq = Column(Integer, index=True)
+    updated_at = Column(DateTime)
+
+class MonthlyAttendance(Base):
+    """Per-employee monthly totals, refreshed by the scheduler (see jobs.py)."""
+    __tablename__ = "attendance_monthly"
+
+    employee_email = Column(String, primary_key=True)
+    month = Column(String, primary_key=True)    # "YYYY-MM"
+    total_hours = Column(Float, nullable=False, default=0.0)
+    attendance_days = Column(Integer, nullable=False, default=0)
+    late_arrivals = Column(Integer, nullable=False, default=0)
+    overtime_hours = Column(Float, nullable=False, default=0.0)
+    computed_at = Column(DateTime, nullable=False)
+
+
+class ScheduledJob(Base):
+    """Lease and last-run status of a scheduler job, shared by all workers."""
+    __tablename__ = "scheduled_jobs"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=True)         # worker holding the lease
+    lease_until = Column(DateTime, nullable=True)
+    last_due = Column(DateTime, nullable=True)    # occurrence last claimed
+    last_started = Column(DateTime, nullable=True)
+    last_finished = Column(DateTime, nullable=True)
+    last_status = Column(String, nullable=True)
+    last_error = Column(Text, nullable=True)
+    last_duration_ms = Column(Float, nullable=True)
+    last_result = Column(Text, nullable=True)     # JSON
+    runs = Column(Integer, nullable=False, default=0)
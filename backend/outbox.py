@@ -0,0 +1,266 @@
+import os
+import threading
+from typing import Optional
+from database import tenant_engines
+from tenancy import DEFAULT_TENANT, TenantLocal, tenant_names, tenant_path
+import settings
+
+# Segment files are named by the seq of their first record, so names sort
+# in seq order and a consumer can find where it left off from the name.
+SEGMENT_PREFIX = "changes-"
+SEGMENT_SUFFIX = ".ndjson"
+
+
+def _line(seq: int, table: str, row_id: int, op: str, payload: str, created_at: str) -> str:
+    # payload is already JSON (json_object() in the trigger); table, op and
+    # created_at never need escaping.
+    return (
+        f'{{"seq":{seq},"at":"{created_at}","table":"{table}","op":"{op}",'
+        f'"id":{row_id},"data":{payload}}}\n'
+    )
+
+
+class Outbox:
+    """
+    Moves one tenant's change records from the `outbox` table (filled by
+    the triggers migrations.create_outbox adds) into NDJSON segment files.
+
+    One line per change:
+        {"seq": 17, "at": "...Z", "table": "attendance", "op": "insert"|"update"|"delete",
+         "id": 5, "data": {...the row's columns...}}
+    seq increases in commit order. A batch is appended and fsynced while
+    holding the database write lock, and its rows are deleted in the same
+    transaction, so workers never ship the same batch twice and the order
+    in the files is commit order. A crash between the fsync and the commit
+    ships the batch again: delivery is at least once, and consumers skip
+    records with a seq they have already processed.
+    Every segment but the newest is complete; the newest may be appended to.
+
+    Consumers confirm the seq they have processed up to (acknowledge(),
+    kept in outbox_consumers). A segment is deleted only once every
+    registered consumer has confirmed all of it, and then only beyond the
+    newest OUTBOX_KEEP_SEGMENTS. With no consumer registered nothing is
+    deleted; status() reports the unconfirmed backlog either way.
+    """
+
+    def __init__(self, tenant: str, directory: str):
+        self.tenant = tenant
+        self.directory = directory
+        self.relayed = 0
+        self.last_seq = None
+
+    def relay(self) -> int:
+        """Ship everything pending, OUTBOX_BATCH_SIZE records per transaction; returns how many were shipped."""
+        shipped = 0
+        while True:
+            count = self._relay_batch()
+            shipped += count
+            if count < settings.OUTBOX_BATCH_SIZE:
+                return shipped
+
+    def _relay_batch(self) -> int:
+        connection = tenant_engines.engine(self.tenant).raw_connection()
+        try:
+            cursor = connection.cursor()
+            # Don't take the write lock when there is nothing to ship.
+            if cursor.execute("SELECT 1 FROM outbox LIMIT 1").fetchone() is None:
+                return 0
+            cursor.execute("BEGIN IMMEDIATE")
+            rows = cursor.execute(
+                "SELECT seq, table_name, row_id, op, payload, created_at FROM outbox ORDER BY seq LIMIT ?",
+                (settings.OUTBOX_BATCH_SIZE,),
+            ).fetchall()
+            if rows:
+                self._append(rows)
+                cursor.execute("DELETE FROM outbox WHERE seq <= ?", (rows[-1][0],))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+        if rows:
+            self.relayed += len(rows)
+            self.last_seq = rows[-1][0]
+        return len(rows)
+
+    def _append(self, rows: list):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._active_segment(rows[0][0])
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(_line(*row) for row in rows))
+            f.flush()
+            os.fsync(f.fileno())
+        self.rotate()
+
+    def _active_segment(self, first_seq: int) -> str:
+        """The newest segment, or a new one named after first_seq if it is full."""
+        segments = self.segments()
+        if segments:
+            path = os.path.join(self.directory, segments[-1])
+            if _drop_partial_line(path) < settings.OUTBOX_SEGMENT_BYTES:
+                return path
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{first_seq:012d}{SEGMENT_SUFFIX}")
+
+    def segments(self) -> list:
+        """Segment file names, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            entry for entry in os.listdir(self.directory)
+            if entry.startswith(SEGMENT_PREFIX) and entry.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        connection = tenant_engines.engine(self.tenant).raw_connection()
+        try:
+            rows = connection.cursor().execute(sql, params).fetchall()
+            connection.commit()
+            return rows
+        finally:
+            connection.close()
+
+    def acknowledge(self, consumer: str, seq: int) -> dict:
+        """Record that `consumer` has processed every record up to `seq`; confirmations never move back."""
+        self._query(
+            """
+            INSERT INTO outbox_consumers (name, acked_seq, updated_at)
+            VALUES (?, ?, strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            ON CONFLICT (name) DO UPDATE SET
+                acked_seq = max(acked_seq, excluded.acked_seq),
+                updated_at = excluded.updated_at
+            """,
+            (consumer, seq),
+        )
+        removed = self.rotate()
+        return {"consumer": consumer, "low_water_mark": self.low_water_mark(), "removed": removed}
+
+    def remove_consumer(self, consumer: str) -> bool:
+        """Stop waiting for `consumer` before deleting segments."""
+        found = self._query("DELETE FROM outbox_consumers WHERE name = ? RETURNING name", (consumer,))
+        self.rotate()
+        return bool(found)
+
+    def consumers(self) -> list:
+        rows = self._query("SELECT name, acked_seq, updated_at FROM outbox_consumers ORDER BY name")
+        return [{"name": name, "acked_seq": seq, "updated_at": at} for name, seq, at in rows]
+
+    def low_water_mark(self) -> Optional[int]:
+        """The highest seq every consumer has confirmed; None when no consumer is registered."""
+        count, low = self._query("SELECT count(*), min(acked_seq) FROM outbox_consumers")[0]
+        return low if count else None
+
+    def _confirmed(self, segments: list, low: Optional[int]) -> list:
+        """Leading segments every consumer has read to the end (the newest never counts as ended)."""
+        if low is None:
+            return []
+        confirmed = []
+        for name, following in zip(segments, segments[1:]):
+            if _first_seq(following) - 1 > low:
+                break
+            confirmed.append(name)
+        return confirmed
+
+    def rotate(self) -> list:
+        segments = self.segments()
+        confirmed = self._confirmed(segments, self.low_water_mark())
+        removed = confirmed[:max(0, len(segments) - settings.OUTBOX_KEEP_SEGMENTS)]
+        for name in removed:
+            os.remove(os.path.join(self.directory, name))
+        return removed
+
+    def status(self) -> dict:
+        pending, oldest = self._query("SELECT count(*), min(created_at) FROM outbox")[0]
+        low = self.low_water_mark()
+        segments = [
+            {"file": name, "bytes": os.path.getsize(os.path.join(self.directory, name))}
+            for name in self.segments()
+        ]
+        confirmed = len(self._confirmed([s["file"] for s in segments], low))
+        unconfirmed = segments[confirmed:]
+        return {
+            "pending": pending,
+            "oldest_pending_at": oldest,
+            "relayed": self.relayed,
+            "last_seq": self.last_seq,
+            "consumers": self.consumers(),
+            "low_water_mark": low,
+            # Segments kept because some consumer (or, with none registered, anyone) may not have read them.
+            "backlog": {
+                "segments": len(unconfirmed),
+                "bytes": sum(s["bytes"] for s in unconfirmed),
+                "over_retention": len(unconfirmed) > settings.OUTBOX_KEEP_SEGMENTS,
+            },
+            "segments": segments,
+        }
+
+
+def _first_seq(segment: str) -> int:
+    return int(segment[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def _drop_partial_line(path: str) -> int:
+    """
+    Cut off a line left half-written by a crash, so every line in the
+    segment is a whole record; returns the segment's size.
+    """
+    size = os.path.getsize(path)
+    if not size:
+        return size
+    with open(path, "rb+") as f:
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return size
+        f.seek(max(0, size - (1 << 20)))
+        tail = f.read()
+        size = size - len(tail) + tail.rfind(b"\n") + 1
+        f.truncate(size)
+        return size
+
+
+outboxes = TenantLocal(lambda tenant: Outbox(
+    tenant,
+    settings.OUTBOX_DIR if tenant == DEFAULT_TENANT else tenant_path(tenant, "outbox"),
+))
+
+
+class OutboxRelay:
+    """Background thread that ships every tenant's outbox every OUTBOX_INTERVAL_SECONDS."""
+
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ship what is still pending, then stop the relay thread."""
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def relay_all(self) -> dict:
+        shipped = {}
+        for tenant in tenant_names():
+            try:
+                shipped[tenant] = outboxes.for_tenant(tenant).relay()
+            except Exception as e:
+                # Try again next time; the records stay in the table.
+                print(f"Outbox relay failed for {tenant}: {e}")
+        return shipped
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.relay_all()
+        self.relay_all()
+
+
+outbox_relay = OutboxRelay(settings.OUTBOX_INTERVAL_SECONDS)
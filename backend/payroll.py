@@ -0,0 +1,203 @@
+from datetime import date, timedelta
+from typing import Optional
+import numpy as np
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session
+import analytics
+from archive import attendance_archive
+from models import Attendance, Employee
+
+# What calculate_salary uses today: every hour at the same rate, 10% deducted.
+DEFAULT_HOURLY_RATE = 500.0
+DEFAULT_DEDUCTION_RATE = 0.10
+MAX_SCENARIOS = 500
+
+
+def salary_figures(email: str, month: str, total_hours: float, hourly_rate: float = DEFAULT_HOURLY_RATE) -> dict:
+    """One employee's month as /salary/calculate reports it (SalaryResponse fields)."""
+    gross_salary = round(total_hours * hourly_rate, 2)
+    deductions = round(gross_salary * DEFAULT_DEDUCTION_RATE, 2)
+    return {
+        "employee_email": email,
+        "month": month,
+        "total_hours": round(total_hours, 2),
+        "hourly_rate": hourly_rate,
+        "gross_salary": gross_salary,
+        "deductions": deductions,
+        "net_salary": round(gross_salary - deductions, 2),
+        "breakdown": {
+            "base_calculation": f"{total_hours:.2f} hrs × KES {hourly_rate}/hr",
+            "deduction_rate": f"{DEFAULT_DEDUCTION_RATE * 100}%",
+            "deduction_items": ["NHIF", "NSSF", "PAYE (estimated)"],
+        },
+    }
+
+
+class PayrollHours:
+    """
+    A month's payable hours, one entry per employee on the roster (plus
+    anyone off it who clocked in). department[i] indexes departments.
+    """
+
+    __slots__ = ("month", "emails", "names", "departments", "department", "regular", "overtime")
+
+    @property
+    def headcount(self) -> np.ndarray:
+        return np.bincount(self.department, minlength=len(self.departments))
+
+
+def load_payroll_hours(db: Session, month_start: date, month_end: date) -> PayrollHours:
+    """Hours for month_start up to (not including) month_end, in one attendance query."""
+    frame = analytics.load_attendance(db, month_start, month_end - timedelta(days=1))
+    hours = PayrollHours()
+    hours.month = month_start.strftime("%Y-%m")
+    hours.emails = frame.emails
+    hours.names = frame.names
+    departments, department = np.unique(np.array(frame.departments, dtype=object), return_inverse=True)
+    hours.departments = [str(d) for d in departments]
+    hours.department = department.reshape(-1)
+    hours.regular, hours.overtime = analytics.payable_hours(frame)
+    return hours
+
+
+def month_payslips(hours: PayrollHours, department: Optional[str] = None) -> list:
+    """salary_figures plus name and department for everyone in `hours` (or one department)."""
+    payslips = []
+    for i, email in enumerate(hours.emails):
+        employee_department = hours.departments[hours.department[i]]
+        if department is not None and employee_department != department:
+            continue
+        payslip = salary_figures(email, hours.month, float(hours.regular[i] + hours.overtime[i]))
+        payslip["name"] = hours.names[i]
+        payslip["department"] = employee_department
+        payslips.append(payslip)
+    return payslips
+
+
+def department_payslips(db: Session, department: str, month_start: date, month_end: date) -> list:
+    """
+    month_payslips for one department. Its hours are summed in SQL over
+    just its employees rather than loading everyone's month, unless the
+    month is archived (or the department is "Unknown", which also holds
+    people no longer on the roster).
+    """
+    if department == "Unknown" or attendance_archive.years_between(month_start, month_end - timedelta(days=1)):
+        return month_payslips(load_payroll_hours(db, month_start, month_end), department)
+
+    month = month_start.strftime("%Y-%m")
+    rows = db.query(
+        Employee.email, Employee.name, func.coalesce(func.sum(Attendance.total_hours), 0.0),
+    ).outerjoin(Attendance, and_(
+        Attendance.employee_email == Employee.email,
+        Attendance.date >= month_start,
+        Attendance.date < month_end,
+        Attendance.minutes_in != None,
+    )).filter(Employee.department == department).group_by(Employee.id).order_by(Employee.name)
+
+    payslips = []
+    for email, name, total_hours in rows:
+        payslip = salary_figures(email, month, total_hours)
+        payslip["name"] = name
+        payslip["department"] = department
+        payslips.append(payslip)
+    return payslips
+
+
+def _bracket_arrays(scenarios: list) -> tuple:
+    """
+    Each scenario's marginal deduction brackets as (lower, width, rate)
+    arrays of shape (scenarios, most brackets), padded with zero-rate
+    brackets. A scenario without brackets deducts DEFAULT_DEDUCTION_RATE
+    of everything.
+    """
+    brackets = [
+        [(b.up_to, b.rate) for b in s.deduction_brackets] or [(None, DEFAULT_DEDUCTION_RATE)]
+        for s in scenarios
+    ]
+    shape = (len(scenarios), max(len(b) for b in brackets))
+    lower, width, rate = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    for s, scenario_brackets in enumerate(brackets):
+        floor = 0.0
+        for b, (up_to, bracket_rate) in enumerate(scenario_brackets):
+            lower[s, b] = floor
+            width[s, b] = np.inf if up_to is None else up_to - floor
+            rate[s, b] = bracket_rate
+            floor = up_to if up_to is not None else floor
+    return lower, width, rate
+
+
+def simulate(hours: PayrollHours, scenarios: list) -> dict:
+    """
+    Evaluate every scenario against the same hours in one vectorized pass.
+    A scenario has hourly_rate, department_rates (department -> rate,
+    overriding hourly_rate), overtime_multiplier, and deduction_brackets
+    (ascending marginal brackets of up_to / rate on gross monthly pay; the
+    last may have no up_to).
+    Pay arrays are (scenarios, employees); department totals are a matrix
+    product with the employee -> department indicator matrix.
+    """
+    n, d = len(hours.emails), len(hours.departments)
+    position = {name: i for i, name in enumerate(hours.departments)}
+    department_rates = np.empty((len(scenarios), d))
+    multipliers = np.empty(len(scenarios))
+    for s, scenario in enumerate(scenarios):
+        department_rates[s] = scenario.hourly_rate
+        for name, rate in scenario.department_rates.items():
+            if name in position:
+                department_rates[s, position[name]] = rate
+        multipliers[s] = scenario.overtime_multiplier
+
+    rates = department_rates[:, hours.department]
+    regular_pay = rates * hours.regular
+    overtime_pay = rates * hours.overtime * multipliers[:, None]
+    gross = regular_pay + overtime_pay
+    lower, width, bracket_rate = _bracket_arrays(scenarios)
+    deductions = np.zeros_like(gross)
+    for b in range(lower.shape[1]):
+        deductions += bracket_rate[:, b, None] * np.clip(gross - lower[:, b, None], 0.0, width[:, b, None])
+    net = gross - deductions
+
+    members = np.zeros((n, d))
+    members[np.arange(n), hours.department] = 1.0
+    totals = {
+        "gross": gross.sum(axis=1),
+        "overtime_pay": overtime_pay.sum(axis=1),
+        "deductions": deductions.sum(axis=1),
+        "net": net.sum(axis=1),
+    }
+    by_department = {
+        "gross": gross @ members,
+        "overtime_pay": overtime_pay @ members,
+        "deductions": deductions @ members,
+        "net": net @ members,
+    }
+    headcount = hours.headcount
+    regular_hours = np.bincount(hours.department, weights=hours.regular, minlength=d)
+    overtime_hours = np.bincount(hours.department, weights=hours.overtime, minlength=d)
+
+    return {
+        "month": hours.month,
+        "employees": n,
+        "regular_hours": round(float(hours.regular.sum()), 2),
+        "overtime_hours": round(float(hours.overtime.sum()), 2),
+        "departments": [
+            {
+                "department": name,
+                "employees": int(headcount[i]),
+                "regular_hours": round(float(regular_hours[i]), 2),
+                "overtime_hours": round(float(overtime_hours[i]), 2),
+            }
+            for i, name in enumerate(hours.departments)
+        ],
+        "scenarios": [
+            {
+                "name": scenario.name,
+                **{key: round(float(values[s]), 2) for key, values in totals.items()},
+                "departments": {
+                    name: {key: round(float(values[s, i]), 2) for key, values in by_department.items()}
+                    for i, name in enumerate(hours.departments)
+                },
+            }
+            for s, scenario in enumerate(scenarios)
+        ],
+    }
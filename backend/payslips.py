@@ -0,0 +1,232 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from html import escape
+from typing import Iterable, Iterator
+import settings
+
+# Bump when the template changes so every payslip is rendered again.
+TEMPLATE_VERSION = 1
+# Payslips per task sent to a worker; one task each costs more in
+# inter-process overhead than rendering does.
+BATCH_SIZE = 32
+# Cached payslips are kept in one directory per pay month.
+MONTH_DIR = re.compile(r"\d{4}-\d{2}")
+
+TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Payslip {month} - {name}</title>
+<style>
+  @page {{ size: A4; margin: 18mm; }}
+  body {{ font-family: Arial, Helvetica, sans-serif; color: #222; font-size: 11pt; }}
+  h1 {{ font-size: 16pt; margin: 0 0 4mm; }}
+  .meta td {{ padding: 1mm 6mm 1mm 0; }}
+  table.figures {{ width: 100%; border-collapse: collapse; margin-top: 6mm; }}
+  table.figures td {{ border-bottom: 1px solid #ccc; padding: 2mm 0; }}
+  table.figures td.amount {{ text-align: right; }}
+  tr.net td {{ font-weight: bold; border-bottom: 2px solid #222; }}
+  .note {{ color: #666; font-size: 9pt; margin-top: 8mm; }}
+</style>
+</head>
+<body>
+<h1>Pesa Pay &mdash; Payslip</h1>
+<table class="meta">
+  <tr><td>Employee</td><td>{name}</td></tr>
+  <tr><td>Email</td><td>{email}</td></tr>
+  <tr><td>Department</td><td>{department}</td></tr>
+  <tr><td>Pay period</td><td>{month}</td></tr>
+</table>
+<table class="figures">
+  <tr><td>Hours worked ({base_calculation})</td><td class="amount">{total_hours}</td></tr>
+  <tr><td>Gross pay</td><td class="amount">KES {gross_salary}</td></tr>
+  <tr><td>Deductions at {deduction_rate} ({deduction_items})</td><td class="amount">KES {deductions}</td></tr>
+  <tr class="net"><td>Net pay</td><td class="amount">KES {net_salary}</td></tr>
+</table>
+<p class="note">Generated by Pesa Pay. Amounts are computed from clocked attendance for the pay period.</p>
+</body>
+</html>
+"""
+
+
+def render_payslip(payslip: dict) -> bytes:
+    """HTML payslip (print to PDF from the browser) for SalaryResponse fields plus name and department."""
+    breakdown = payslip["breakdown"]
+    return TEMPLATE.format(
+        name=escape(payslip["name"] or payslip["employee_email"]),
+        email=escape(payslip["employee_email"]),
+        department=escape(payslip["department"] or "Unknown"),
+        month=escape(payslip["month"]),
+        base_calculation=escape(breakdown["base_calculation"]),
+        total_hours=f"{payslip['total_hours']:,.2f}",
+        gross_salary=f"{payslip['gross_salary']:,.2f}",
+        deduction_rate=escape(breakdown["deduction_rate"]),
+        deduction_items=escape(", ".join(breakdown["deduction_items"])),
+        deductions=f"{payslip['deductions']:,.2f}",
+        net_salary=f"{payslip['net_salary']:,.2f}",
+    ).encode("utf-8")
+
+
+def _render_to_files(batch: list) -> None:
+    """Runs in a pool worker: render each (path, payslip) and move it into place atomically."""
+    for path, payslip in batch:
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        staging = f"{path}.{os.getpid()}.tmp"
+        with open(staging, "wb") as f:
+            f.write(render_payslip(payslip))
+        os.replace(staging, path)
+
+
+class PayslipRenderer:
+    """
+    Renders payslips in a pool of worker processes, so month-end runs of
+    thousands of payslips don't compete with request threads for the GIL.
+
+    Output goes to a content-addressed cache: a payslip's file name is the
+    SHA-256 of its figures and TEMPLATE_VERSION, so a payslip whose
+    figures haven't changed is served from disk and never rendered again,
+    and a changed one gets a new file. Files sit in a directory per pay
+    month ("YYYY-MM", as month_range normalizes it), which evict() removes
+    once the month is older than PAYSLIP_KEEP_MONTHS.
+    """
+
+    def __init__(self, directory: str, workers: int):
+        self.directory = directory
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.cached = 0
+
+    def path_for(self, payslip: dict) -> str:
+        month = payslip["month"]
+        if not MONTH_DIR.fullmatch(month):
+            raise ValueError(f"payslip month must be YYYY-MM, got {month!r}")
+        canonical = json.dumps(payslip, sort_keys=True, separators=(",", ":"), default=str)
+        key = hashlib.sha256(f"{TEMPLATE_VERSION}:{canonical}".encode()).hexdigest()
+        return os.path.join(self.directory, month, key[:2], key + ".html")
+
+    def evict(self, oldest_kept: str) -> list:
+        """
+        Remove cached months before `oldest_kept` ("YYYY-MM"), and anything
+        else in the directory (e.g. the flat layout of older versions).
+        Returns the names removed.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        removed = []
+        for name in sorted(os.listdir(self.directory)):
+            if MONTH_DIR.fullmatch(name) and name >= oldest_kept:
+                continue
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+            removed.append(name)
+        return removed
+
+    def _submit(self, batch: list) -> Future:
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a process that runs threads (scheduler, clock queue) can deadlock the child.
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            try:
+                return self._pool.submit(_render_to_files, batch)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); start a new pool.
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+                return self._pool.submit(_render_to_files, batch)
+
+    def render(self, payslip: dict) -> str:
+        """Path of the payslip's file, rendering it first if it isn't cached."""
+        path = self.path_for(payslip)
+        if os.path.exists(path):
+            self.cached += 1
+            return path
+        self.rendered += 1
+        self._submit([(path, payslip)]).result()
+        return path
+
+    def render_all(self, payslips: Iterable[dict]) -> Iterator[tuple]:
+        """
+        (payslip, path) for every payslip as soon as it is ready: cached
+        ones first, then the rest in the order workers finish them.
+        Payslips not handed out yet are cancelled if the caller stops early.
+        """
+        ready, missing = [], []
+        for payslip in payslips:
+            path = self.path_for(payslip)
+            (ready if os.path.exists(path) else missing).append((payslip, path))
+        pending = {}
+        for i in range(0, len(missing), BATCH_SIZE):
+            batch = missing[i:i + BATCH_SIZE]
+            pending[self._submit([(path, payslip) for payslip, path in batch])] = batch
+        self.cached += len(ready)
+        self.rendered += len(missing)
+        try:
+            yield from ready
+            for future in as_completed(pending):
+                future.result()
+                yield from pending[future]
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+class _StreamSink:
+    """Write-only, unseekable file for ZipFile; what was written since the last take() is handed to the response."""
+
+    def __init__(self):
+        self._parts = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def stream_zip(entries: Iterable[tuple]) -> Iterator[bytes]:
+    """
+    A ZIP of (name in archive, file path) entries, yielded as each entry
+    is added, so the download starts while later entries are still being
+    produced. ZipFile writes sizes after each entry's data when the output
+    can't seek.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, path in entries:
+            archive.write(path, name)
+            yield sink.take()
+    yield sink.take()
+
+
+payslip_renderer = PayslipRenderer(settings.PAYSLIP_DIR, settings.PAYSLIP_WORKERS)
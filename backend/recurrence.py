@@ -0,0 +1,271 @@
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Iterator, Optional
+from sqlalchemy import and_, or_
+
+# A subset of iCalendar RRULE (RFC 5545):
+#   FREQ=DAILY|WEEKLY|MONTHLY     required
+#   INTERVAL=n                    every n days/weeks/months (default 1)
+#   BYDAY=MO,TH                   WEEKLY: days of the week (default: the start date's)
+#   BYDAY=1MO | -1FR              MONTHLY: the nth (1-4, or -1 for last) weekday
+#                                 (default: the start date's day of the month; months
+#                                 without that day are skipped)
+#   COUNT=n | UNTIL=YYYYMMDD      when the series ends (default: never)
+# The event's own date is the first occurrence. Exceptions (EXDATE) are
+# stored separately as a comma-separated list of ISO dates.
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+MAX_COUNT = 5000
+# Longest window one request may expand, so a daily rule stays cheap.
+MAX_WINDOW_DAYS = 5 * 366
+
+
+class Rule:
+    __slots__ = ("freq", "interval", "weekdays", "ordinal", "count", "until")
+
+    def __init__(self, freq: str, interval: int = 1, weekdays: tuple = (), ordinal: Optional[int] = None,
+                 count: Optional[int] = None, until: Optional[date] = None):
+        self.freq = freq
+        self.interval = interval
+        self.weekdays = weekdays    # sorted weekday numbers, Monday = 0
+        self.ordinal = ordinal      # MONTHLY BYDAY: 1-4 or -1
+        self.count = count
+        self.until = until
+
+    def __str__(self) -> str:
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.weekdays:
+            prefix = "" if self.ordinal is None else str(self.ordinal)
+            parts.append("BYDAY=" + ",".join(prefix + WEEKDAYS[d] for d in self.weekdays))
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        if self.until is not None:
+            parts.append(f"UNTIL={self.until:%Y%m%d}")
+        return ";".join(parts)
+
+
+@lru_cache(maxsize=1024)
+def parse_rule(text: str) -> Rule:
+    """Parse an RRULE string; raises ValueError with a message fit for a 400."""
+    fields = {}
+    for part in text.strip().upper().removeprefix("RRULE:").split(";"):
+        if not part:
+            continue
+        key, sep, value = part.partition("=")
+        if not sep or not value:
+            raise ValueError(f"Malformed rule part '{part}'")
+        fields[key] = value
+
+    freq = fields.pop("FREQ", None)
+    if freq not in FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {list(FREQUENCIES)}")
+    rule = Rule(freq)
+    try:
+        if "INTERVAL" in fields:
+            rule.interval = int(fields.pop("INTERVAL"))
+        if "COUNT" in fields:
+            rule.count = int(fields.pop("COUNT"))
+        if "UNTIL" in fields:
+            value = fields.pop("UNTIL")[:8]
+            rule.until = date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+    except ValueError:
+        raise ValueError("INTERVAL and COUNT must be whole numbers and UNTIL a YYYYMMDD date")
+    if rule.interval < 1:
+        raise ValueError("INTERVAL must be at least 1")
+    if rule.count is not None and not 1 <= rule.count <= MAX_COUNT:
+        raise ValueError(f"COUNT must be between 1 and {MAX_COUNT}")
+    if rule.count is not None and rule.until is not None:
+        raise ValueError("Use COUNT or UNTIL, not both")
+
+    if "BYDAY" in fields:
+        days = fields.pop("BYDAY").split(",")
+        if freq == "WEEKLY":
+            if any(d not in WEEKDAYS for d in days):
+                raise ValueError(f"BYDAY must list days from {list(WEEKDAYS)}")
+            rule.weekdays = tuple(sorted({WEEKDAYS.index(d) for d in days}))
+        elif freq == "MONTHLY":
+            day = days[0]
+            if len(days) != 1 or day[-2:] not in WEEKDAYS or day[:-2] not in ("1", "2", "3", "4", "-1"):
+                raise ValueError("Monthly BYDAY must be one day such as 1MO, 3WE or -1FR")
+            rule.weekdays = (WEEKDAYS.index(day[-2:]),)
+            rule.ordinal = int(day[:-2])
+        else:
+            raise ValueError("BYDAY is not supported with FREQ=DAILY")
+    if fields:
+        raise ValueError(f"Unsupported rule parts: {sorted(fields)}")
+    return rule
+
+
+def _nth_weekday(year: int, month: int, weekday: int, ordinal: int) -> date:
+    if ordinal > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (ordinal - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _month_day(rule: Rule, start: date, months: int) -> Optional[date]:
+    """The occurrence `months` months after the first one, or None if that month has none."""
+    year, month = divmod(start.month - 1 + months, 12)
+    year, month = start.year + year, month + 1
+    if rule.ordinal is not None:
+        return _nth_weekday(year, month, rule.weekdays[0], rule.ordinal)
+    try:
+        return date(year, month, start.day)
+    except ValueError:
+        return None
+
+
+def _indexed(rule: Rule, start: date, first: date) -> Iterator[tuple]:
+    """
+    (index, day) for the occurrences from about `first` on, where index is
+    the occurrence's position in the whole series (for COUNT). Starts
+    at the period containing `first` instead of at `start`, so the cost
+    does not grow with the number of earlier occurrences.
+    """
+    if rule.freq == "DAILY":
+        k = max(0, -(-(first - start).days // rule.interval))
+        while True:
+            yield k, start + timedelta(days=k * rule.interval)
+            k += 1
+
+    elif rule.freq == "WEEKLY":
+        weekdays = rule.weekdays or (start.weekday(),)
+        monday = start - timedelta(days=start.weekday())
+        lead = [d for d in weekdays if d >= start.weekday()]   # first week's days
+        j = max(0, (first - monday).days // 7 // rule.interval)
+        while True:
+            week = monday + timedelta(weeks=j * rule.interval)
+            for pos, d in enumerate(weekdays):
+                if j == 0:
+                    if d < start.weekday():
+                        continue
+                    k = lead.index(d)
+                else:
+                    k = len(lead) + (j - 1) * len(weekdays) + pos
+                yield k, week + timedelta(days=d)
+            j += 1
+
+    else:
+        months = (first.year - start.year) * 12 + first.month - start.month
+        j = max(0, months // rule.interval)
+        if rule.ordinal is None and start.day > 28:
+            # Months without the day are skipped and don't count.
+            k = sum(1 for i in range(j) if _month_day(rule, start, i * rule.interval))
+        else:
+            k = j
+        while True:
+            day = _month_day(rule, start, j * rule.interval)
+            if day is not None:
+                yield k, day
+                k += 1
+            j += 1
+
+
+def _occurrences(rule: Rule, start: date, first: date) -> Iterator[date]:
+    """Occurrences on or after `first`, in order, until the series ends."""
+    for k, day in _indexed(rule, start, max(first, start)):
+        if rule.count is not None and k >= rule.count:
+            return
+        if rule.until is not None and day > rule.until:
+            return
+        if day >= first:
+            yield day
+
+
+def normalize_rule(text: Optional[str], start: date) -> Optional[str]:
+    """
+    The canonical form of `text` for storing, or None for a one-off
+    event. Raises ValueError if the rule is invalid or `start` is not one
+    of its occurrences.
+    """
+    if not text or not text.strip():
+        return None
+    rule = parse_rule(text)
+    if rule.freq == "WEEKLY" and rule.weekdays and start.weekday() not in rule.weekdays:
+        raise ValueError("The event date must fall on one of the BYDAY days")
+    if rule.ordinal is not None and _month_day(rule, start, 0) != start:
+        raise ValueError(f"The event date is not the {rule.ordinal} {WEEKDAYS[rule.weekdays[0]]} of its month")
+    if rule.until is not None and rule.until < start:
+        raise ValueError("UNTIL is before the event date")
+    return str(rule)
+
+
+def normalize_exceptions(days) -> Optional[str]:
+    """Exception dates (dates or ISO strings) as a sorted comma-separated string, or None."""
+    if not days:
+        return None
+    if isinstance(days, str):
+        days = [d for d in days.split(",") if d.strip()]
+    try:
+        parsed = {d if isinstance(d, date) else date.fromisoformat(d.strip()) for d in days}
+    except ValueError:
+        raise ValueError("Exceptions must be dates in YYYY-MM-DD format")
+    return ",".join(d.isoformat() for d in sorted(parsed)) or None
+
+
+def last_occurrence(rule_text: Optional[str], start: date) -> Optional[date]:
+    """The series' last date (None if it never ends); stored so window queries can skip finished series."""
+    if not rule_text:
+        return start
+    rule = parse_rule(rule_text)
+    if rule.until is not None:
+        return rule.until
+    if rule.count is None:
+        return None
+    last = start
+    for last in _occurrences(rule, start, start):
+        pass
+    return last
+
+
+@lru_cache(maxsize=4096)
+def expand(rule_text: Optional[str], start: date, exceptions: Optional[str], window_start: date, window_end: date) -> tuple:
+    """
+    The event's dates within window_start..window_end (inclusive).
+    Memoized per (rule, window): every argument is part of the key, so an
+    edited rule or a new exception is simply a different entry.
+    """
+    if not rule_text:
+        return (start,) if window_start <= start <= window_end else ()
+    skipped = set(exceptions.split(",")) if exceptions else ()
+    days = []
+    for day in _occurrences(parse_rule(rule_text), start, window_start):
+        if day > window_end:
+            break
+        if day.isoformat() not in skipped:
+            days.append(day)
+    return tuple(days)
+
+
+def in_window(model, date_column, window_start: date, window_end: date):
+    """
+    Filter for rows of `model` (one with recurrence/recurs_until columns)
+    that may have an occurrence in the window: one-off events dated in it
+    and series that started by its end and had not ended before its start.
+    """
+    return or_(
+        and_(model.recurrence == None, date_column >= window_start, date_column <= window_end),
+        and_(
+            model.recurrence != None,
+            date_column <= window_end,
+            or_(model.recurs_until == None, model.recurs_until >= window_start),
+        ),
+    )
+
+
+def window_or_year(window_start: Optional[date], window_end: Optional[date], today: date) -> tuple:
+    """
+    Resolve optional start/end query parameters: a missing start is 1
+    January of the end's (or today's) year, a missing end is 31 December
+    of the start's year. Raises ValueError for an empty or too long window.
+    """
+    window_start = window_start or date((window_end or today).year, 1, 1)
+    window_end = window_end or date(window_start.year, 12, 31)
+    if window_end < window_start:
+        raise ValueError("end is before start")
+    if (window_end - window_start).days > MAX_WINDOW_DAYS:
+        raise ValueError(f"The window may span at most {MAX_WINDOW_DAYS} days")
+    return window_start, window_end
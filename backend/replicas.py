@@ -0,0 +1,225 @@
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from http.cookies import SimpleCookie
+from typing import Optional
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from tenancy import DEFAULT_TENANT, TenantLocal, tenant_path
+import settings
+
+# Set on responses to successful writes; both hold the time of the write.
+# Clients echo the header on later requests (the mobile app keeps no
+# cookies); browsers send the cookie back.
+WROTE_HEADER = "X-Pesa-Pay-Wrote"
+WROTE_COOKIE = "pesa_pay_wrote"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReplicaCopyRestarted(Exception):
+    pass
+
+
+def _stepped_copy_progress():
+    """backup() progress callback: pause between steps, give up after BACKUP_MAX_RESTARTS restarts."""
+    pause = settings.BACKUP_STEP_SLEEP_MS / 1000
+    seen = {"remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        if seen["remaining"] is not None and remaining > seen["remaining"]:
+            seen["restarts"] += 1
+            if seen["restarts"] > settings.BACKUP_MAX_RESTARTS:
+                raise ReplicaCopyRestarted()
+        seen["remaining"] = remaining
+        if remaining:
+            time.sleep(pause)
+
+    return progress
+
+
+class SnapshotReplica:
+    """
+    A read-only copy of a tenant's SQLite file, refreshed with the online
+    backup API on a background thread at most every REPLICA_REFRESH_SECONDS
+    and only when something was committed since the last copy
+    (PRAGMA data_version). Readers on the copy never hold the primary's
+    shared lock, so they don't hold up clock-in commits.
+    The copy is taken in steps like a backup (BACKUP_PAGES_PER_STEP pages,
+    BACKUP_STEP_SLEEP_MS apart), so the refresh itself only holds the
+    shared lock briefly. A refresh that commits keep restarting more than
+    BACKUP_MAX_RESTARTS times is given up and tried again later; the
+    replica falls back to the primary once it lags too far.
+    The copy reflects every commit made before `fresh_as_of`.
+    """
+
+    def __init__(self, primary_path: str, path: str):
+        self.primary_path = primary_path
+        self.path = path
+        self.fresh_as_of = 0.0
+        self._sessions = None
+        self._source = None
+        self._data_version = None
+        self._checked = 0.0
+        self._refreshing = threading.Lock()
+
+    def usable(self, now: float) -> bool:
+        return self._sessions is not None and now - self.fresh_as_of <= settings.REPLICA_MAX_LAG_SECONDS
+
+    def sessionmaker(self):
+        return self._sessions
+
+    def maybe_refresh(self, now: float):
+        if now - self._checked < settings.REPLICA_REFRESH_SECONDS or not self._refreshing.acquire(blocking=False):
+            return
+        self._checked = now
+        threading.Thread(target=self._refresh_in_background, name="replica-refresh", daemon=True).start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Replica refresh of {self.primary_path} failed: {e}")
+        finally:
+            self._refreshing.release()
+
+    def refresh(self) -> bool:
+        """Bring the copy up to date; returns whether a new copy was taken."""
+        if self._source is None:
+            self._source = sqlite3.connect(self.primary_path, check_same_thread=False)
+        started = time.time()
+        version = self._source.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version and self._sessions is not None:
+            # Nothing committed since the last copy: it is current as of now.
+            self.fresh_as_of = started
+            return False
+
+        staging = f"{self.path}.{os.getpid()}.tmp"
+        copy = sqlite3.connect(staging)
+        try:
+            self._source.backup(copy, pages=settings.BACKUP_PAGES_PER_STEP, progress=_stepped_copy_progress())
+            complete = True
+        except ReplicaCopyRestarted:
+            complete = False
+        finally:
+            copy.close()
+        if not complete:
+            os.remove(staging)
+            return False
+        os.replace(staging, self.path)
+        self._data_version = version
+        self.fresh_as_of = started
+
+        if self._sessions is None:
+            engine = create_engine(
+                f"sqlite:///file:{self.path}?mode=ro&uri=true",
+                connect_args={"check_same_thread": False},
+            )
+            self._sessions = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        else:
+            # Pooled connections still have the previous file open.
+            self._sessions.kw["bind"].dispose()
+        return True
+
+
+class URLReplica:
+    """
+    A streaming replica of the primary (e.g. PostgreSQL), trusted to lag by
+    no more than REPLICA_MAX_LAG_SECONDS.
+    """
+
+    def __init__(self, url: str):
+        self._sessions = sessionmaker(autocommit=False, autoflush=False, bind=create_engine(url))
+
+    @property
+    def fresh_as_of(self) -> float:
+        return time.time() - settings.REPLICA_MAX_LAG_SECONDS
+
+    def usable(self, now: float) -> bool:
+        return True
+
+    def sessionmaker(self):
+        return self._sessions
+
+    def maybe_refresh(self, now: float):
+        pass
+
+
+class ReplicaSet:
+    """Round-robin over a tenant's replicas, skipping any that may not have the client's last write yet."""
+
+    def __init__(self, replicas: list):
+        self.replicas = replicas
+        self._next = itertools.cycle(range(len(replicas))) if replicas else None
+        self.reads = {"replica": 0, "primary": 0}
+
+    def pick(self, wrote_at: float) -> Optional[sessionmaker]:
+        now = time.time()
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._next)]
+            replica.maybe_refresh(now)
+            if replica.usable(now) and replica.fresh_as_of > wrote_at:
+                self.reads["replica"] += 1
+                return replica.sessionmaker()
+        self.reads["primary"] += 1
+        return None
+
+
+def _replica_set(tenant: str) -> ReplicaSet:
+    if tenant == DEFAULT_TENANT and settings.REPLICA_URLS:
+        return ReplicaSet([URLReplica(url) for url in settings.REPLICA_URLS])
+    return ReplicaSet([SnapshotReplica(tenant_path(tenant, "pesa_pay.db"), tenant_path(tenant, "pesa_pay.replica.db"))])
+
+
+replicas = TenantLocal(_replica_set)
+
+
+def _write_time(value: Optional[str]) -> float:
+    try:
+        return float(value) if value else 0.0
+    except ValueError:
+        return 0.0
+
+
+def last_write(headers) -> float:
+    """
+    When this client last wrote, from the header or cookie
+    ReadYourWritesMiddleware sets (0 if never); the later of the two.
+    """
+    wrote_at = _write_time(headers.get(WROTE_HEADER))
+    cookie = headers.get("cookie")
+    if cookie and WROTE_COOKIE in cookie:
+        morsel = SimpleCookie(cookie).get(WROTE_COOKIE)
+        wrote_at = max(wrote_at, _write_time(morsel.value if morsel else None))
+    return wrote_at
+
+
+class ReadYourWritesMiddleware:
+    """
+    After a successful write, tells the client (by WROTE_HEADER and cookie)
+    when it wrote, so its next reads go to the primary until a replica has
+    caught up with it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.READ_REPLICAS or scope["method"] in SAFE_METHODS:
+            return await self.app(scope, receive, send)
+
+        async def send_with_write_time(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                wrote_at = f"{time.time():.3f}"
+                cookie = (
+                    f"{WROTE_COOKIE}={wrote_at}; Path=/; HttpOnly; SameSite=Lax; "
+                    f"Max-Age={int(settings.REPLICA_MAX_LAG_SECONDS) + 1}"
+                )
+                message["headers"] = list(message.get("headers", [])) + [
+                    (WROTE_HEADER.lower().encode("latin-1"), wrote_at.encode("latin-1")),
+                    (b"set-cookie", cookie.encode("latin-1")),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_write_time)
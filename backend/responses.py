@@ -0,0 +1,22 @@
+import json
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the standard library
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response for large list payloads.
+    Handlers return it directly with plain dicts/lists so FastAPI skips the
+    jsonable_encoder pass; orjson renders dates, datetimes and numpy values
+    natively when it is installed.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
@@ -1,11 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import base64
+import json
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from datetime import datetime, date
-from pydantic import BaseModel, EmailStr, Field
+from datetime import datetime, date, timedelta
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Optional, List
-from database import get_db
-from models import Attendance, Employee, SharedEvent
-from sqlalchemy import and_
+from database import get_db, get_read_db
+from crud import DIRECTORY_FIELDS, get_employee_directory_page, get_employee_rows, search_employees
+from models import Attendance, SharedEvent, WorkSite
+from sqlalchemy import func, select
+from dashboard import department_counters
+from live_feed import broker
+from responses import FastJSONResponse
+from http_cache import cache_policy
+from traffic import traffic_metrics
+from jobs import scheduler
+from backup import backups
+from outbox import outboxes
+from geofence import parse_polygon, site_index
+from archive import attendance_record
+from rows import ATTENDANCE_COLUMNS, AttendanceRow, fetch
+from recurrence import expand, in_window, last_occurrence, normalize_exceptions, normalize_rule, window_or_year
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -16,20 +32,52 @@ class SharedEventCreate(BaseModel):
     event_date: date
     event_type: str = "general"
     target_department: Optional[str] = None
+    # RRULE such as FREQ=WEEKLY;BYDAY=MO (see recurrence.py); event_date is the first occurrence.
+    recurrence: Optional[str] = Field(None, max_length=200)
+    exceptions: List[date] = []
 
 class SharedEventResponse(BaseModel):
     id: int
     title: str
     description: Optional[str]
-    event_date: str
+    event_date: date
     event_type: str
     created_by: str
-    created_at: str
+    created_at: datetime
     is_active: bool
+    recurrence: Optional[str] = None
     
     class Config:
         from_attributes = True
 
+class WorkSiteCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=200)
+    # None: every department may clock in here.
+    department: Optional[str] = None
+    # A circle: latitude, longitude and radius_m. Or a polygon of [latitude, longitude] points.
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+    radius_m: Optional[float] = Field(None, gt=0, le=50000)
+    polygon: Optional[List[List[float]]] = None
+
+class WorkSiteResponse(BaseModel):
+    id: int
+    name: str
+    department: Optional[str]
+    latitude: float
+    longitude: float
+    radius_m: Optional[float]
+    polygon: Optional[List[List[float]]]
+    is_active: bool
+
+    @field_validator("polygon", mode="before")
+    @classmethod
+    def load_polygon(cls, v):
+        return json.loads(v) if isinstance(v, str) else v
+
+    class Config:
+        from_attributes = True
+
 class EmployeeAttendanceSummary(BaseModel):
     email: str
     name: str
@@ -42,29 +90,92 @@ class EmployeeAttendanceSummary(BaseModel):
     month_days: int
 
 
-@router.get("/employees", response_model=List[dict], operation_id="admin_list_employees")
-def list_employees(db: Session = Depends(get_db)):
-
-    employees = db.query(Employee).all()
-    return [
+@router.get("/employees", operation_id="admin_list_employees", response_class=FastJSONResponse)
+def list_employees(db: Session = Depends(get_read_db)):
+    """Full employee list kept for existing clients; prefer /admin/employees/directory."""
+    employees = get_employee_rows(db, order_by_name=True)
+    return FastJSONResponse([
         {
+            "id": e.id,
             "email": e.email,
             "name": e.name,
             "department": e.department,
-            "role": e.role,
-            "is_active": e.is_active if hasattr(e, 'is_active') else True,
+            "phone": e.phone,
+            "salary": e.salary,
+            "bank_name": e.bank_name,
+            "account_number": e.account_number,
+            "role": "admin" if e.is_admin else "employee",
+            "is_active": True,
         }
         for e in employees
-    ]
+    ])
+
+
+def _encode_cursor(name: str, employee_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([name, employee_id]).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        name, employee_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return name, int(employee_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/employees/directory", operation_id="admin_employee_directory", response_class=FastJSONResponse)
+def get_employee_directory(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    department: Optional[str] = None,
+    gender: Optional[str] = None,
+    q: Optional[str] = Query(None, min_length=1, description="Name or email prefix"),
+    fields: str = "id,name,email,department",
+    db: Session = Depends(get_read_db),
+):
+    """
+    Paginated employee directory ordered by name.
+    Pass `next_cursor` from a response as `cursor` to get the following page.
+    `fields` is a comma-separated subset of the employee columns.
+    """
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in DIRECTORY_FIELDS]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=f"fields must be a comma-separated subset of {list(DIRECTORY_FIELDS)}",
+        )
+
+    rows = get_employee_directory_page(
+        db,
+        fields=requested,
+        limit=limit,
+        after=_decode_cursor(cursor) if cursor else None,
+        department=department,
+        gender=gender,
+        prefix=q,
+    )
+    page = rows[:limit]
+
+    return FastJSONResponse({
+        "items": [{f: getattr(e, f) for f in requested} for e in page],
+        "next_cursor": _encode_cursor(page[-1].name, page[-1].id) if len(rows) > limit else None,
+    })
+
+@router.get("/employees/search", operation_id="admin_search_employees")
+def search_employees_endpoint(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_read_db),
+):
+    """Ranked typeahead search over name, email, department and phone."""
+    return [dict(row) for row in search_employees(db, q, limit)]
 
 @router.get("/employees/{email}/attendance", operation_id="admin_get_employee_attendance")
-def get_employee_attendance(email: str, date: Optional[date] = None, db: Session = Depends(get_db)):
+def get_employee_attendance(email: str, date: Optional[date] = None, db: Session = Depends(get_read_db)):
 
     if date:
-        record = db.query(Attendance).filter(
-            Attendance.employee_email == email,
-            Attendance.date == date
-        ).first()
+        record = attendance_record(db, email, date)
         
         if not record:
             return {"date": date.isoformat(), "has_record": False}
@@ -82,13 +193,13 @@ def get_employee_attendance(email: str, date: Optional[date] = None, db: Session
         today = date.today()
         month_start = date(today.year, today.month, 1)
         
-        records = db.query(Attendance).filter(
+        records = db.execute(select(Attendance.minutes_in, Attendance.total_hours).where(
             Attendance.employee_email == email,
             Attendance.date >= month_start
-        ).all()
+        )).all()
         
         total_hours = sum(r.total_hours for r in records if r.total_hours)
-        days_present = len([r for r in records if r.time_in])
+        days_present = len([r for r in records if r.minutes_in is not None])
         
         return {
             "employee_email": email,
@@ -98,24 +209,21 @@ def get_employee_attendance(email: str, date: Optional[date] = None, db: Session
             "records_count": len(records),
         }
 
-@router.get("/attendance/overview", operation_id="admin_attendance_overview")
-def get_attendance_overview(db: Session = Depends(get_db)):
+@router.get("/attendance/overview", operation_id="admin_attendance_overview", response_class=FastJSONResponse)
+def get_attendance_overview(db: Session = Depends(get_read_db)):
 
     today = date.today()
-    employees = db.query(Employee).all()
+    month_start = date(today.year, today.month, 1)
+    employees = get_employee_rows(db)
+    # The whole month in one query instead of two per employee.
+    month_rows = {}
+    for r in fetch(db, AttendanceRow, select(*ATTENDANCE_COLUMNS).where(Attendance.date >= month_start)):
+        month_rows.setdefault(r.employee_email, []).append(r)
     overview = []
     
     for emp in employees:
-        today_record = db.query(Attendance).filter(
-            Attendance.employee_email == emp.email,
-            Attendance.date == today
-        ).first()
-
-        month_start = date(today.year, today.month, 1)
-        month_records = db.query(Attendance).filter(
-            Attendance.employee_email == emp.email,
-            Attendance.date >= month_start
-        ).all()
+        month_records = month_rows.get(emp.email, ())
+        today_record = next((r for r in month_records if r.date == today), None)
         
         month_hours = sum(r.total_hours for r in month_records if r.total_hours)
         month_days = len([r for r in month_records if r.time_in])
@@ -140,12 +248,102 @@ def get_attendance_overview(db: Session = Depends(get_db)):
             "month_days": month_days,
         })
     
-    return {
+    return FastJSONResponse({
         "date": today.isoformat(),
         "total_employees": len(employees),
         "present_count": len([e for e in overview if e['today_status'] in ['present', 'clocked_in']]),
         "employees": overview,
-    }
+    })
+
+
+@router.get("/dashboard/departments", operation_id="admin_department_dashboard")
+def get_department_dashboard(since: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Per-department present/absent/clocked-in counts and month hours.
+    Pass the returned cursor back as `since` to receive only departments
+    that changed in the meantime.
+    """
+    return department_counters.snapshot(db, since)
+
+
+@router.get("/metrics/traffic", operation_id="admin_traffic_metrics")
+def get_traffic_metrics():
+    """Rate-limit rejections, load-shedding counts and current concurrency."""
+    return traffic_metrics.snapshot()
+
+
+@router.get("/jobs", operation_id="admin_list_jobs", response_class=FastJSONResponse)
+def list_jobs(db: Session = Depends(get_db)):
+    """Scheduled background jobs with their next run and last run's status, timing and result."""
+    return FastJSONResponse(scheduler.status(db))
+
+
+@router.post("/jobs/{name}/run", operation_id="admin_run_job", response_class=FastJSONResponse)
+def run_job(name: str):
+    """Run a job now and return its status."""
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return FastJSONResponse(scheduler.run(name))
+
+
+@router.get("/backups", operation_id="admin_list_backups")
+def list_backups():
+    """Kept database snapshots, newest first, with checksums and row counts. Restore with `python backup.py restore <file>`."""
+    return backups.list()
+
+
+@router.get("/outbox", operation_id="admin_outbox_status")
+def get_outbox_status():
+    """Change records waiting in the outbox, the NDJSON segments the relay has written and what consumers have confirmed."""
+    return outboxes.status()
+
+
+class OutboxAck(BaseModel):
+    seq: int = Field(..., ge=0, description="Highest seq the consumer has processed")
+
+
+@router.post("/outbox/consumers/{name}", operation_id="admin_outbox_acknowledge")
+def acknowledge_outbox(name: str, ack: OutboxAck):
+    """
+    Register a consumer of the segment files, or move its confirmed seq
+    forward. Segments are only deleted once every consumer has confirmed them.
+    """
+    return outboxes.acknowledge(name, ack.seq)
+
+
+@router.delete("/outbox/consumers/{name}", operation_id="admin_outbox_remove_consumer")
+def remove_outbox_consumer(name: str):
+    """Stop keeping segments for a consumer that is gone."""
+    if not outboxes.remove_consumer(name):
+        raise HTTPException(status_code=404, detail="Consumer not found")
+    return {"message": "Consumer removed"}
+
+
+@router.get("/attendance/stream", operation_id="admin_attendance_stream")
+async def stream_attendance(
+    department: Optional[str] = None,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[int] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Server-Sent Events feed of clock-in/clock-out and manual attendance events.
+    Reconnecting clients resume from Last-Event-ID (header or query).
+    """
+    resume_from = last_event_id if last_event_id is not None else last_event_id_header
+
+    async def event_stream():
+        async for item in broker.subscribe(department, resume_from):
+            if item is None:
+                yield ": keep-alive\n\n"
+                continue
+            event_id, event = item
+            yield f"id: {event_id}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/events", response_model=SharedEventResponse, operation_id="admin_create_shared_event")
@@ -154,7 +352,11 @@ def create_shared_event(
     admin_email: EmailStr,
     db: Session = Depends(get_db)
 ):
-
+    try:
+        recurrence = normalize_rule(event.recurrence, event.event_date)
+        exceptions = normalize_exceptions(event.exceptions) if recurrence else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     new_event = SharedEvent(
         title=event.title,
@@ -163,6 +365,9 @@ def create_shared_event(
         event_type=event.event_type,
         target_department=event.target_department,
         created_by=admin_email,
+        recurrence=recurrence,
+        recurrence_exceptions=exceptions,
+        recurs_until=last_occurrence(recurrence, event.event_date),
     )
     
     db.add(new_event)
@@ -171,23 +376,32 @@ def create_shared_event(
     
     return new_event
 
-@router.get("/events", response_model=List[SharedEventResponse], operation_id="get_shared_events")
+@router.get(
+    "/events",
+    response_model=List[SharedEventResponse],
+    operation_id="get_shared_events",
+    dependencies=[cache_policy("shared_events", cache_control="private, max-age=30")],
+)
 def get_shared_events(
     month: Optional[str] = None,
     department: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-
+    """
+    Active shared events, newest first. Recurring events are listed once
+    per occurrence in `month` (YYYY-MM), or in the current year when no
+    month is given.
+    """
     query = db.query(SharedEvent).filter(SharedEvent.is_active == True)
 
+    window = None
     if month:
         try:
             year, mo = map(int, month.split('-'))
             month_start = date(year, mo, 1)
             month_end = date(year, mo + 1, 1) if mo < 12 else date(year + 1, 1, 1)
-            query = query.filter(
-                and_(SharedEvent.event_date >= month_start, SharedEvent.event_date < month_end)
-            )
+            window = (month_start, month_end - timedelta(days=1))
+            query = query.filter(in_window(SharedEvent, SharedEvent.event_date, *window))
         except:
             pass
  
@@ -201,7 +415,43 @@ def get_shared_events(
         query = query.filter(SharedEvent.target_department == None)
     
     events = query.order_by(SharedEvent.event_date.desc()).all()
-    return events
+    if not any(e.recurrence for e in events):
+        return events
+
+    window_start, window_end = window or window_or_year(None, None, date.today())
+    occurrences = []
+    for e in events:
+        if e.recurrence is None:
+            occurrences.append(e)
+            continue
+        for day in expand(e.recurrence, e.event_date, e.recurrence_exceptions, window_start, window_end):
+            occurrence = SharedEventResponse.model_validate(e)
+            occurrence.event_date = day
+            occurrences.append(occurrence)
+    occurrences.sort(key=lambda e: e.event_date, reverse=True)
+    return occurrences
+
+@router.post("/events/{event_id}/exceptions", response_model=SharedEventResponse, operation_id="admin_skip_shared_event_occurrence")
+def skip_shared_event_occurrence(
+    event_id: int,
+    day: date,
+    admin_email: EmailStr,
+    db: Session = Depends(get_db)
+):
+    """Skip one occurrence of a recurring shared event."""
+    event = db.query(SharedEvent).filter(SharedEvent.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if event.recurrence is None:
+        raise HTTPException(status_code=400, detail="Event does not repeat")
+    if not expand(event.recurrence, event.event_date, None, day, day):
+        raise HTTPException(status_code=400, detail=f"Event does not occur on {day}")
+
+    current = event.recurrence_exceptions.split(",") if event.recurrence_exceptions else []
+    event.recurrence_exceptions = normalize_exceptions(current + [day.isoformat()])
+    db.commit()
+    db.refresh(event)
+    return event
 
 @router.delete("/events/{event_id}", operation_id="admin_delete_shared_event")
 def delete_shared_event(
@@ -218,4 +468,91 @@ def delete_shared_event(
     event.is_active = False
     db.commit()
     
-    return {"message": "Event deactivated", "event_id": event_id}
\ No newline at end of file
+    return {"message": "Event deactivated", "event_id": event_id}
+
+
+@router.post("/sites", response_model=WorkSiteResponse, status_code=201, operation_id="admin_create_work_site")
+def create_work_site(site: WorkSiteCreate, db: Session = Depends(get_db)):
+    """Add a work site that clock-ins are matched against: a circle or a polygon."""
+    if site.polygon is not None:
+        if site.radius_m is not None:
+            raise HTTPException(status_code=400, detail="Give either radius_m or polygon, not both")
+        try:
+            polygon = parse_polygon(site.polygon)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        latitude = sum(lat for lat, _ in polygon) / len(polygon)
+        longitude = sum(lon for _, lon in polygon) / len(polygon)
+        polygon = json.dumps([list(point) for point in polygon])
+    elif site.latitude is None or site.longitude is None or site.radius_m is None:
+        raise HTTPException(status_code=400, detail="A circular site needs latitude, longitude and radius_m")
+    else:
+        latitude, longitude, polygon = site.latitude, site.longitude, None
+
+    work_site = WorkSite(
+        name=site.name,
+        department=site.department,
+        latitude=latitude,
+        longitude=longitude,
+        radius_m=site.radius_m if polygon is None else None,
+        polygon=polygon,
+    )
+    db.add(work_site)
+    db.commit()
+    db.refresh(work_site)
+    site_index.reload(db)
+    return work_site
+
+
+@router.get("/sites", response_model=List[WorkSiteResponse], operation_id="admin_list_work_sites")
+def list_work_sites(department: Optional[str] = None, db: Session = Depends(get_read_db)):
+    query = db.query(WorkSite).filter(WorkSite.is_active == True)
+    if department:
+        query = query.filter(WorkSite.department == department)
+    return query.order_by(WorkSite.department, WorkSite.name).all()
+
+
+@router.delete("/sites/{site_id}", operation_id="admin_delete_work_site")
+def delete_work_site(site_id: int, db: Session = Depends(get_db)):
+    site = db.query(WorkSite).filter(WorkSite.id == site_id).first()
+    if not site:
+        raise HTTPException(status_code=404, detail="Work site not found")
+    site.is_active = False
+    db.commit()
+    site_index.reload(db)
+    return {"message": "Work site deactivated", "site_id": site_id}
+
+
+@router.get("/sites/report", operation_id="admin_work_site_report", response_class=FastJSONResponse)
+def get_work_site_report(start: date, end: date, db: Session = Depends(get_read_db)):
+    """Clock-ins and clock-outs per work site between start and end (inclusive); site null counts events that matched none."""
+    if end < start:
+        raise HTTPException(status_code=400, detail="end is before start")
+    in_range = (Attendance.date >= start, Attendance.date <= end)
+    clock_ins = {site_id: (count, employees) for site_id, count, employees in db.execute(
+        select(Attendance.clock_in_site_id, func.count(), func.count(func.distinct(Attendance.employee_email)))
+        .where(*in_range, Attendance.minutes_in != None)
+        .group_by(Attendance.clock_in_site_id)
+    )}
+    clock_outs = dict(db.execute(
+        select(Attendance.clock_out_site_id, func.count())
+        .where(*in_range, Attendance.minutes_out != None)
+        .group_by(Attendance.clock_out_site_id)
+    ).all())
+    site_ids = set(clock_ins) | set(clock_outs)
+    sites = {site.id: site for site in db.query(WorkSite).filter(WorkSite.id.in_([s for s in site_ids if s]))}
+
+    report = []
+    for site_id in site_ids:
+        site = sites.get(site_id)
+        count, employees = clock_ins.get(site_id, (0, 0))
+        report.append({
+            "site_id": site_id,
+            "name": site.name if site else None,
+            "department": site.department if site else None,
+            "clock_ins": count,
+            "clock_outs": clock_outs.get(site_id, 0),
+            "employees": employees,
+        })
+    report.sort(key=lambda r: (r["site_id"] is None, -r["clock_ins"]))
+    return FastJSONResponse({"start": start.isoformat(), "end": end.isoformat(), "sites": report})
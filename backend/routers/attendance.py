@@ -1,22 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, timezone
 import pytz
-from pydantic import BaseModel, EmailStr, field_validator
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Optional, List
-from database import SessionLocal
+from database import get_db, get_read_db
 from models import Attendance
+from sqlalchemy import case, func, or_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError
+from uuid import uuid4
+from batching import clock_queue
+from dashboard import department_counters
+from geofence import site_index
+from live_feed import broker
+from responses import FastJSONResponse
+import analytics
+from archive import attendance_record, attendance_records, attendance_totals
+from jobs import rollup_month
+from timekeeping import to_hhmm, to_minutes, worked_hours_sql
+import settings
 
 router = APIRouter(tags=["attendance"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 ea_tz = pytz.timezone("Africa/Nairobi")
 
 
@@ -24,6 +30,10 @@ class AttendanceCreate(BaseModel):
     employee_email: EmailStr
     time_in: Optional[str] = None
     time_out: Optional[str] = None
+    idempotency_key: Optional[str] = Field(None, max_length=64)
+    # Where the device is; checked against the department's work sites (see geofence.py).
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
     @field_validator("time_in", "time_out", mode="before")
     @classmethod
@@ -39,9 +49,82 @@ class AttendanceCreate(BaseModel):
     def validate_action(self):
         if not self.time_in and not self.time_out:
             raise ValueError("Either 'time_in' or 'time_out' must be provided.")
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValueError("Send both 'latitude' and 'longitude', or neither.")
         return self
 
 
+def run_clock_statement(db: Session, stmt):
+    """
+    Execute a clock-in/clock-out statement and return its RETURNING row.
+    When group-commit mode is on, the statement goes through the clock queue
+    and shares a transaction with other taps.
+    """
+    if clock_queue.is_running():
+        return clock_queue.submit(stmt).result(timeout=settings.CLOCK_RESULT_TIMEOUT_SECONDS)
+
+    try:
+        row = db.execute(stmt).first()
+        db.commit()
+        return row
+    except Exception:
+        db.rollback()
+        raise
+
+
+def locate_site(db: Session, data: AttendanceCreate, department: str) -> Optional[int]:
+    """
+    The work site a clock event was made from, or None. With
+    PESA_PAY_GEOFENCE=enforce, events from outside every site of a fenced
+    department are refused.
+    """
+    if settings.GEOFENCE == "off":
+        return None
+    site = None
+    if data.latitude is not None:
+        site = site_index.match(db, department, data.latitude, data.longitude)
+    if site is None and settings.GEOFENCE == "enforce" and site_index.is_fenced(db, department):
+        if data.latitude is None:
+            raise HTTPException(status_code=403, detail="Location is required to clock in or out.")
+        raise HTTPException(status_code=403, detail="You are not at one of your department's work sites.")
+    return site.id if site else None
+
+
+def count_clock_in(email: str, department: str, key: str, at: datetime, row):
+    # A retry gets the stored row back too; only the request whose key and
+    # timestamp were written announces the clock-in.
+    if row is not None and row.clock_in_key == key and row.clock_in_at == at:
+        department_counters.clock_in(email, department, row.date)
+        broker.publish({
+            "type": "clock_in",
+            "employee_email": email,
+            "department": department,
+            "date": row.date.isoformat(),
+            "time_in": to_hhmm(row.minutes_in),
+        })
+
+
+def count_clock_out(email: str, department: str, key: str, at: datetime, row):
+    if row is not None and row.clock_out_key == key and row.clock_out_at == at:
+        department_counters.clock_out(email, department, row.date, row.total_hours)
+        broker.publish({
+            "type": "clock_out",
+            "employee_email": email,
+            "department": department,
+            "date": row.date.isoformat(),
+            "time_out": to_hhmm(row.minutes_out),
+            "total_hours": float(row.total_hours),
+        })
+
+
+def when_flushed(future, callback):
+    """
+    Run callback(row) once a queued clock statement has been committed.
+    Failures are dead-lettered by the queue (the statement was submitted as acknowledged).
+    """
+    future.add_done_callback(lambda f: None if f.exception() else callback(f.result()))
+
+
 class AttendanceRequest(BaseModel):
     employee_email: EmailStr
     date: date
@@ -63,7 +146,7 @@ class AttendanceRequest(BaseModel):
 
 class AttendanceRecordResponse(BaseModel):
     id: int
-    date: str
+    date: date
     time_in: Optional[str]
     time_out: Optional[str]
     total_hours: Optional[float]
@@ -79,88 +162,137 @@ def log_attendance(data: AttendanceCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=str(e))
 
     now_ea = datetime.now(ea_tz)
+    now_utc = now_ea.astimezone(timezone.utc)
+    # How clock_in_at/clock_out_at come back from SQLite.
+    stamp = now_utc.replace(tzinfo=None)
     today: date = now_ea.date()
     current_time = now_ea.strftime("%H:%M")
 
-    record = (
-        db.query(Attendance)
-        .filter(Attendance.employee_email == data.employee_email, Attendance.date == today)
-        .first()
-    )
+    # Retries that carry the same key get the stored state back instead of an error.
+    key = data.idempotency_key or uuid4().hex
+    department = department_counters.department_of(db, data.employee_email)
+    site_id = locate_site(db, data, department)
 
     if data.time_in is not None:
-        if record and record.time_in:
-            raise HTTPException(status_code=400, detail="Already clocked in today.")
-        if not record:
-            record = Attendance(
-                employee_email=data.employee_email,
-                date=today,
-                time_in=data.time_in,
-                status="present",
-            )
-            db.add(record)
-        else:
-            record.time_in = data.time_in
-
-        try:
-            db.commit()
-            db.refresh(record)
+        stmt = sqlite_insert(Attendance).values(
+            employee_email=data.employee_email,
+            date=today,
+            minutes_in=to_minutes(data.time_in),
+            clock_in_at=now_utc,
+            status="present",
+            clock_in_key=key,
+            clock_in_site_id=site_id,
+        )
+        first_clock_in = Attendance.minutes_in.is_(None)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Attendance.employee_email, Attendance.date],
+            set_={
+                "minutes_in": func.coalesce(Attendance.minutes_in, stmt.excluded.minutes_in),
+                "clock_in_at": case((first_clock_in, stmt.excluded.clock_in_at), else_=Attendance.clock_in_at),
+                "clock_in_key": case((first_clock_in, stmt.excluded.clock_in_key), else_=Attendance.clock_in_key),
+                "clock_in_site_id": case(
+                    (first_clock_in, stmt.excluded.clock_in_site_id), else_=Attendance.clock_in_site_id,
+                ),
+            },
+        ).returning(Attendance.date, Attendance.minutes_in, Attendance.clock_in_key, Attendance.clock_in_at)
+
+        if clock_queue.is_running() and settings.CLOCK_DURABILITY == "enqueue":
+            when_flushed(clock_queue.submit(stmt, acknowledged=True), lambda row: count_clock_in(data.employee_email, department, key, stamp, row))
             return {
-                "message": "Clocked in successfully",
-                "time_in": record.time_in,
-                "date": record.date.isoformat(),
+                "message": "Clock-in accepted",
+                "time_in": data.time_in,
+                "date": today.isoformat(),
+                "queued": True,
             }
-        except IntegrityError:
-            db.rollback()
-            raise HTTPException(status_code=500, detail="Failed to log attendance (database error).")
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=500, detail="Internal server error.")
-
-    elif data.time_out is not None:
-        if not record or not record.time_in:
-            raise HTTPException(status_code=400, detail="Must clock in before clocking out.")
-        if record.time_out:
-            raise HTTPException(status_code=400, detail="Already clocked out today.")
-
-        time_in_str = record.time_in
-        time_out_str = data.time_out or current_time
 
         try:
-            time_in_dt = datetime.strptime(time_in_str, "%H:%M")
-            time_out_dt = datetime.strptime(time_out_str, "%H:%M")
-
-            if time_out_dt < time_in_dt:
-                if time_out_dt.hour < 12:
-                    time_out_dt += timedelta(days=1)
-                else:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Time-out cannot be earlier than time-in unless past midnight."
-                    )
+            row = run_clock_statement(db, stmt)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail="Failed to log attendance (database error).")
 
-            total_seconds = (time_out_dt - time_in_dt).seconds
-            hours_worked = round(total_seconds / 3600, 2)
+        if row.clock_in_key != key:
+            raise HTTPException(status_code=400, detail="Already clocked in today.")
+        count_clock_in(data.employee_email, department, key, stamp, row)
 
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid time format or logic: {str(e)}")
+        return {
+            "message": "Clocked in successfully",
+            "time_in": to_hhmm(row.minutes_in),
+            "date": row.date.isoformat(),
+        }
 
-        record.time_out = time_out_str
-        record.total_hours = hours_worked
+    elif data.time_out is not None:
+        time_out_str = data.time_out or current_time
+        out_minutes = to_minutes(time_out_str)
+
+        conditions = [
+            Attendance.employee_email == data.employee_email,
+            Attendance.date == today,
+            Attendance.minutes_in.is_not(None),
+            or_(Attendance.minutes_out.is_(None), Attendance.clock_out_key == key),
+        ]
+        # Only an early-morning time-out may wrap past midnight.
+        if out_minutes >= 12 * 60:
+            conditions.append(Attendance.minutes_in <= out_minutes)
+
+        first_clock_out = Attendance.minutes_out.is_(None)
+        stmt = (
+            update(Attendance)
+            .where(*conditions)
+            .values(
+                minutes_out=func.coalesce(Attendance.minutes_out, out_minutes),
+                clock_out_at=case((first_clock_out, now_utc), else_=Attendance.clock_out_at),
+                total_hours=case(
+                    (first_clock_out, worked_hours_sql(Attendance.minutes_in, out_minutes)),
+                    else_=Attendance.total_hours,
+                ),
+                clock_out_key=func.coalesce(Attendance.clock_out_key, key),
+                clock_out_site_id=case((first_clock_out, site_id), else_=Attendance.clock_out_site_id),
+            )
+            .returning(
+                Attendance.date, Attendance.minutes_out, Attendance.total_hours,
+                Attendance.clock_out_key, Attendance.clock_out_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
 
-        try:
-            db.commit()
-            db.refresh(record)
+        if clock_queue.is_running() and settings.CLOCK_DURABILITY == "enqueue":
+            when_flushed(clock_queue.submit(stmt, acknowledged=True), lambda row: count_clock_out(data.employee_email, department, key, stamp, row))
             return {
-                "message": "Clocked out successfully",
-                "time_out": record.time_out,
-                "total_hours": record.total_hours,
-                "date": record.date.isoformat(),
+                "message": "Clock-out accepted",
+                "time_out": time_out_str,
+                "date": today.isoformat(),
+                "queued": True,
             }
+
+        try:
+            row = run_clock_statement(db, stmt)
         except Exception as e:
-            db.rollback()
             raise HTTPException(status_code=500, detail="Failed to update attendance.")
 
+        if row is None:
+            # Slow path: the update matched nothing, look up why.
+            record = (
+                db.query(Attendance)
+                .filter(Attendance.employee_email == data.employee_email, Attendance.date == today)
+                .first()
+            )
+            if not record or not record.time_in:
+                raise HTTPException(status_code=400, detail="Must clock in before clocking out.")
+            if record.time_out:
+                raise HTTPException(status_code=400, detail="Already clocked out today.")
+            raise HTTPException(
+                status_code=400,
+                detail="Time-out cannot be earlier than time-in unless past midnight."
+            )
+
+        count_clock_out(data.employee_email, department, key, stamp, row)
+        return {
+            "message": "Clocked out successfully",
+            "time_out": to_hhmm(row.minutes_out),
+            "total_hours": float(row.total_hours),
+            "date": row.date.isoformat(),
+        }
+
 
 @router.post("/attendance/manual", operation_id="admin_create_manual_attendance")
 def create_attendance_manual(request: AttendanceRequest, db: Session = Depends(get_db)):
@@ -177,24 +309,37 @@ def create_attendance_manual(request: AttendanceRequest, db: Session = Depends(g
         record = Attendance(
             employee_email=request.employee_email,
             date=request.date,
-            time_in=request.time_in,
-            time_out=request.time_out,
-            total_hours=request.total_hours,
             status=request.status,
         )
         db.add(record)
-    else:
-        if request.time_in is not None:
-            record.time_in = request.time_in
-        if request.time_out is not None:
-            record.time_out = request.time_out
-        if request.total_hours is not None:
-            record.total_hours = request.total_hours
-        record.status = request.status
+
+    if request.time_in is not None:
+        record.time_in = request.time_in
+    if request.time_out is not None:
+        record.time_out = request.time_out
+    # Hours are derived from the times whenever both are known.
+    if request.total_hours is not None and record.minutes_out is None:
+        record.total_hours = request.total_hours
+    record.status = request.status
 
     try:
         db.commit()
         db.refresh(record)
+        # Keep the closed-month rollup that salary history reads in step.
+        rollup_month(db, record.date, record.employee_email)
+        db.commit()
+        department = department_counters.department_of(db, record.employee_email)
+        department_counters.invalidate()
+        broker.publish({
+            "type": "manual",
+            "employee_email": record.employee_email,
+            "department": department,
+            "date": record.date.isoformat(),
+            "time_in": record.time_in,
+            "time_out": record.time_out,
+            "total_hours": record.total_hours,
+            "status": record.status,
+        })
         return {
             "message": "Attendance logged successfully",
             "attendance": {
@@ -215,19 +360,22 @@ def create_attendance_manual(request: AttendanceRequest, db: Session = Depends(g
 
 
 @router.get("/attendance/records/{email}", response_model=List[AttendanceRecordResponse], operation_id="get_attendance_records")
-def get_attendance_records(email: str, db: Session = Depends(get_db)):
-    records = db.query(Attendance).filter(
-        Attendance.employee_email == email
-    ).order_by(Attendance.date.desc()).all()
-    
-    return records
+def get_attendance_records(email: str, db: Session = Depends(get_read_db)):
+    return FastJSONResponse([
+        {
+            "id": r.id,
+            "date": r.date,
+            "time_in": to_hhmm(r.minutes_in),
+            "time_out": to_hhmm(r.minutes_out),
+            "total_hours": r.total_hours,
+        }
+        for r in attendance_records(db, email)
+    ])
 
 
 @router.get("/attendance/summary/{email}", operation_id="get_employee_attendance_summary")
-def get_attendance_summary(email: str, db: Session = Depends(get_db)):
-    records = db.query(Attendance).filter(Attendance.employee_email == email).all()
-    total_hours = sum(r.total_hours for r in records if r.total_hours is not None)
-    days_worked = len([r for r in records if r.time_in])
+def get_attendance_summary(email: str, db: Session = Depends(get_read_db)):
+    total_hours, days_worked = attendance_totals(db, email)
 
     return {
         "employee_email": email,
@@ -237,29 +385,40 @@ def get_attendance_summary(email: str, db: Session = Depends(get_db)):
     }
 
 
-@router.get("/admin/attendance/report", operation_id="get_admin_attendance_report")
-def get_attendance_report(db: Session = Depends(get_db)):
+@router.get("/admin/attendance/report", operation_id="get_admin_attendance_report", response_class=FastJSONResponse)
+def get_attendance_report(start: Optional[date] = None, end: Optional[date] = None, db: Session = Depends(get_read_db)):
+    frame = analytics.load_attendance(db, start, end)
+    summary = analytics.employee_summary(frame)
 
-    employee_emails = db.query(Attendance.employee_email).distinct().all()
-    report = []
+    return FastJSONResponse([
+        {
+            "name": frame.names[i],
+            "email": email,
+            "department": frame.departments[i],
+            "total_hours": round(float(summary["total_hours"][i]), 2),
+            "attendance_days": int(summary["attendance_days"][i]),
+            "attendance_count": int(summary["present_days"][i]),
+            "late_arrivals": int(summary["late_arrivals"][i]),
+            "overtime_hours": round(float(summary["overtime_hours"][i]), 2),
+            "longest_absence_days": int(summary["longest_absence"][i]),
+        }
+        for i, email in enumerate(frame.emails)
+    ])
 
-    for (email,) in employee_emails:
-        records = db.query(Attendance).filter(Attendance.employee_email == email).all()
-        total_hours = sum(r.total_hours for r in records if r.total_hours is not None)
-        name = email.split("@")[0].replace(".", " ").title()
 
-        report.append({
-            "name": name,
-            "email": email,
-            "department": "Unknown",
-            "total_hours": round(total_hours, 2),
-            "attendance_days": len([r for r in records if r.time_in]),
-        })
+@router.get("/admin/attendance/departments", operation_id="get_admin_department_report", response_class=FastJSONResponse)
+def get_department_report(start: Optional[date] = None, end: Optional[date] = None, db: Session = Depends(get_read_db)):
+    frame = analytics.load_attendance(db, start, end)
 
-    return report
+    return FastJSONResponse({
+        "start": date.fromordinal(frame.start).isoformat(),
+        "end": date.fromordinal(frame.end).isoformat(),
+        "departments": analytics.department_summary(frame),
+        "days": analytics.daily_summary(frame),
+    })
 
 @router.get("/attendance/day/{email}/{date_str}", operation_id="get_attendance_day_details")
-def get_attendance_day_details(email: str, date_str: str, db: Session = Depends(get_db)):
+def get_attendance_day_details(email: str, date_str: str, db: Session = Depends(get_read_db)):
     from datetime import datetime
     
     try:
@@ -267,10 +426,7 @@ def get_attendance_day_details(email: str, date_str: str, db: Session = Depends(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
     
-    record = db.query(Attendance).filter(
-        Attendance.employee_email == email,
-        Attendance.date == target_date
-    ).first()
+    record = attendance_record(db, email, target_date)
     
     if not record:
         return {
@@ -279,23 +435,12 @@ def get_attendance_day_details(email: str, date_str: str, db: Session = Depends(
             "message": "No attendance record for this date"
         }
     
-    total_hours = None
-    if record.time_in and record.time_out:
-        try:
-            time_in = datetime.strptime(record.time_in, "%H:%M")
-            time_out = datetime.strptime(record.time_out, "%H:%M")
-            if time_out < time_in:
-                time_out += timedelta(days=1)
-            total_hours = round((time_out - time_in).seconds / 3600, 2)
-        except:
-            total_hours = record.total_hours
-    
     return {
         "date": record.date.isoformat(),
         "has_attendance": True,
         "time_in": record.time_in,
         "time_out": record.time_out,
-        "total_hours": total_hours or record.total_hours,
+        "total_hours": record.total_hours,
         "status": record.status,
         "employee_email": record.employee_email,
     } 
\ No newline at end of file
@@ -1,23 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from database import SessionLocal, Base, engine
+from database import Base, engine, get_db, get_read_db
 from models import Employee, Attendance, PublicHoliday
 from schemas import EmployeeCreate, EmployeeResponse
-from crud import create_employee, get_employee_by_email, get_all_employees
-from datetime import datetime
+from crud import create_employee, get_employee_by_email, get_employee_rows
+from datetime import date, datetime
+from responses import FastJSONResponse
+from http_cache import cache_policy
+from holidays import holiday_calendar
+from archive import attendance_records
 from passlib.context import CryptContext # type: ignore
 
 ph = CryptContext(schemes=["argon2"], deprecated="auto")
 
 router = APIRouter(tags=["auth"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 Base.metadata.create_all(bind=engine)
 
 @router.post("/signup", response_model=EmployeeResponse)
@@ -41,28 +38,34 @@ def register_employee(employee: EmployeeCreate, db: Session = Depends(get_db)):
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    new_employee = create_employee(db=db, employee=employee)
-
-    return EmployeeResponse(
-        id=new_employee.id,
-        name=new_employee.name,
-        email=new_employee.email,
-        phone=new_employee.phone,
-        gender=new_employee.gender,
-        department=new_employee.department,
-        salary=new_employee.salary,
-        bank_name=new_employee.bank_name,
-        account_number=new_employee.account_number,
-        is_admin=new_employee.is_admin
-    )
+    # response_model validates the ORM object directly.
+    return create_employee(db=db, employee=employee)
 
 @router.get("/employees", response_model=list[EmployeeResponse])
-def get_all_employees_endpoint(db: Session = Depends(get_db)):
+def get_all_employees_endpoint(db: Session = Depends(get_read_db)):
     """Get a list of all employees."""
-    return get_all_employees(db)
+    return FastJSONResponse([
+        {
+            "name": e.name,
+            "email": e.email,
+            "phone": e.phone,
+            "gender": e.gender,
+            "department": e.department,
+            "salary": e.salary,
+            "bank_name": e.bank_name,
+            "account_number": e.account_number,
+            "id": e.id,
+            "is_admin": e.is_admin,
+        }
+        for e in get_employee_rows(db)
+    ])
 
 
-@router.get("/employee/{email}", response_model=EmployeeResponse)
+@router.get(
+    "/employee/{email}",
+    response_model=EmployeeResponse,
+    dependencies=[cache_policy("employees")],
+)
 def get_employee_by_email_endpoint(email: str, db: Session = Depends(get_db)):
     """Get a single employee by email."""
     db_user = get_employee_by_email(db, email=email)
@@ -72,7 +75,7 @@ def get_employee_by_email_endpoint(email: str, db: Session = Depends(get_db)):
 
 
 @router.get("/salary/calculate/{email}")
-def calculate_salary(email: str, db: Session = Depends(get_db)):
+def calculate_salary(email: str, db: Session = Depends(get_read_db)):
     """AI-based salary calculation."""
     db_user = get_employee_by_email(db, email=email)
     if not db_user:
@@ -101,12 +104,13 @@ def calculate_salary(email: str, db: Session = Depends(get_db)):
 
 
 @router.get("/activity/calendar/{email}")
-def get_activity_calendar(email: str, db: Session = Depends(get_db)):
+def get_activity_calendar(email: str, db: Session = Depends(get_read_db)):
     """Get personalized calendar."""
     db_user = get_employee_by_email(db, email=email)
     if not db_user:
         raise HTTPException(status_code=404, detail="Employee not found")
 
+    today = date.today()
     return {
         "employee": {
             "name": db_user.name,
@@ -114,7 +118,9 @@ def get_activity_calendar(email: str, db: Session = Depends(get_db)):
         },
         "calendar": {
             "off_weeks": ["2025-04-05", "2025-04-19"],
-            "holidays": ["2025-04-18", "2025-05-01"],
+            "holidays": [
+                day.isoformat() for day, _ in holiday_calendar.between(db, date(today.year, 1, 1), date(today.year, 12, 31))
+            ],
             "events": [
                 {"title": "Official Trip", "date": "2025-04-20", "type": "trip"},
                 {"title": "Funeral", "date": "2025-04-12", "type": "funeral"}
@@ -160,9 +166,9 @@ def login(employee_login: dict, db: Session = Depends(get_db)):
     }
 
 @router.get("/attendance/{email}")
-def get_attendance(email: str, db: Session = Depends(get_db)):
+def get_attendance(email: str, db: Session = Depends(get_read_db)):
     """Get employee attendance summary."""
-    records = db.query(Attendance).filter(Attendance.employee_email == email).all()
+    records = attendance_records(db, email)
     present_days = len([r for r in records if r.status == "present"])
     total_days = len(records)
 
@@ -174,7 +180,10 @@ def get_attendance(email: str, db: Session = Depends(get_db)):
         "summary": f"{present_days}/{total_days} days present"
     }
 
-@router.get("/profile/me")
+@router.get(
+    "/profile/me",
+    dependencies=[cache_policy("employees")],
+)
 def get_profile(email: str, db: Session = Depends(get_db)):
     """
     Get the full profile of an employee by email.
@@ -196,43 +205,14 @@ def get_profile(email: str, db: Session = Depends(get_db)):
         "account_number": db_user.account_number
     }
 
-@router.get("/holidays")
+@router.get(
+    "/holidays",
+    response_class=FastJSONResponse,
+    dependencies=[cache_policy("public_holidays", cache_control="public, max-age=3600")],
+)
 def get_public_holidays(db: Session = Depends(get_db)):
-    holidays = db.query(PublicHoliday).all()
-    return [
-        {"name": h.name, "date": str(h.date)}
-        for h in holidays
-    ]
-
-@router.get("/admin/employees")
-def get_all_employees(db: Session = Depends(get_db)):
-    employees = db.query(Employee).all()
-    return [
-        {
-            "id": emp.id,
-            "name": emp.name,
-            "email": emp.email,
-            "department": emp.department,
-            "phone": emp.phone,
-            "salary": emp.salary,
-            "bank_name": emp.bank_name,
-            "account_number": emp.account_number
-        }
-        for emp in employees
-    ]
-
-@router.get("/admin/attendance/report")
-def get_attendance_report(db: Session = Depends(get_db)):
-    report = []
-    employees = db.query(Employee).all()
-    for emp in employees:
-        attendance = db.query(Attendance).filter(Attendance.employee_email == emp.email).all()
-        total_hours = sum(a.total_hours for a in attendance if a.total_hours)
-        days_worked = len([a for a in attendance if a.status == "present"])
-        report.append({
-            "name": emp.name,
-            "department": emp.department,
-            "total_hours": round(total_hours, 2),
-            "attendance_count": days_worked
-        })
-    return report
\ No newline at end of file
+    holidays = db.query(PublicHoliday.name, PublicHoliday.date).all()
+    return FastJSONResponse([
+        {"name": name, "date": holiday_date}
+        for name, holiday_date in holidays
+    ])
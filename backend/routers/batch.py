@@ -0,0 +1,165 @@
+import asyncio
+import json
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+from fastapi import APIRouter, Request, Response
+from pydantic import BaseModel, Field
+from database import SHARED_SESSION_KEY, tenant_session
+import settings
+
+router = APIRouter(tags=["batch"])
+
+API_PREFIX = "/api/v1"
+MAX_BATCH_ITEMS = 20
+ITEM_TIMEOUT_SECONDS = 10
+
+# Headers that describe the outer exchange and must not leak into sub-requests.
+OUTER_ONLY_HEADERS = {
+    b"content-length", b"content-type", b"accept-encoding",
+    b"origin", b"if-none-match", b"if-modified-since",
+}
+# Sub-response headers worth handing back to the client.
+FORWARDED_RESPONSE_HEADERS = ("etag", "last-modified", "cache-control", "location")
+
+
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    path: str = Field(..., description="API path with optional query string, e.g. /profile/me?email=...")
+    headers: Dict[str, str] = {}
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS)
+
+
+class ItemTimeout(Exception):
+    """
+    A sub-request outlived ITEM_TIMEOUT_SECONDS. Its endpoint may still be
+    running in a threadpool worker with the batch's session, so the batch
+    stops using that session and leaves closing it to `task`.
+    """
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+
+
+async def _dispatch(request: Request, path: str, query: str, extra_headers: Dict[str, str], db):
+    """Run one GET through the app in-process and collect (status, headers, body)."""
+    headers = [(k, v) for k, v in request.scope["headers"] if k not in OUTER_ONLY_HEADERS]
+    # Every item shares the batch's session, so items can't switch tenant.
+    headers += [
+        (k.lower().encode("latin-1"), v.encode("latin-1"))
+        for k, v in extra_headers.items()
+        if k.lower() != settings.TENANT_HEADER.lower()
+    ]
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "scheme": request.scope.get("scheme", "http"),
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "state": dict(request.scope.get("state", {})),
+        "method": "GET",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": headers,
+        SHARED_SESSION_KEY: db,
+    }
+    response = {"status": 500, "headers": {}, "body": []}
+    sent_request = False
+
+    async def receive():
+        nonlocal sent_request
+        if not sent_request:
+            sent_request = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode("latin-1"): v.decode("latin-1") for k, v in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    # Not wait_for(): cancelling the task would not stop a sync endpoint's
+    # worker thread, which must finish before the session is closed.
+    task = asyncio.ensure_future(request.app(scope, receive, send))
+    done, _ = await asyncio.wait({task}, timeout=ITEM_TIMEOUT_SECONDS)
+    if not done:
+        raise ItemTimeout(task)
+    # An exception here means ServerErrorMiddleware has already recorded the 500.
+    task.exception()
+    return response["status"], response["headers"], b"".join(response["body"])
+
+
+def _close_when_done(task: asyncio.Task, db):
+    def close(finished: asyncio.Task):
+        if not finished.cancelled():
+            finished.exception()
+        db.rollback()
+        db.close()
+    task.add_done_callback(close)
+
+
+@router.post("/batch")
+async def batch(payload: BatchRequest, request: Request):
+    """
+    Run several GET requests in one round trip.
+
+    Each item names an API path (with or without the /api/v1 prefix) and
+    optional headers such as If-None-Match. Items run in order through the
+    normal routing, validation and caching stack, sharing one database
+    session, so they also see one consistent snapshot. The response lists
+    every item's status, cache headers and JSON body. An item that times
+    out gets a 504 and the items after it are not run (also 504), since
+    the session is still in use by the timed-out one.
+
+    Example:
+    {"requests": [{"id": "profile", "path": "/profile/me?email=nicole@gmail.com"},
+                  {"id": "holidays", "path": "/holidays"}]}
+    """
+    results = []
+    db = tenant_session()
+    try:
+        for index, item in enumerate(payload.requests):
+            item_id = item.id if item.id is not None else str(index)
+            target = urlsplit(item.path)
+            path = target.path if target.path.startswith(API_PREFIX) else API_PREFIX + target.path
+
+            if db is None:
+                status, headers, body = 504, {}, b'{"detail":"Skipped: an earlier item timed out"}'
+            elif path == request.url.path:
+                status, headers, body = 400, {}, b'{"detail":"Batches cannot be nested"}'
+            else:
+                try:
+                    status, headers, body = await _dispatch(request, path, target.query, item.headers, db)
+                except ItemTimeout as e:
+                    _close_when_done(e.task, db)
+                    db = None
+                    status, headers, body = 504, {}, b'{"detail":"Timed out"}'
+                else:
+                    if status >= 500:
+                        db.rollback()
+
+            meta = {
+                "id": item_id,
+                "status": status,
+                "headers": {k: headers[k] for k in FORWARDED_RESPONSE_HEADERS if k in headers},
+            }
+            if not body:
+                body_json = b"null"
+            elif headers.get("content-type", "application/json").startswith("application/json"):
+                body_json = body
+            else:
+                body_json = json.dumps(body.decode("utf-8", "replace")).encode()
+            # Splice the sub-response body in as-is instead of parsing and re-encoding it.
+            results.append(json.dumps(meta, separators=(",", ":"))[:-1].encode() + b',"body":' + body_json + b"}")
+    finally:
+        if db is not None:
+            db.close()
+
+    return Response(b'{"results":[' + b",".join(results) + b"]}", media_type="application/json")
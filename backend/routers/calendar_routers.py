@@ -1,32 +1,47 @@
 # routes/calendar_routes.py
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from datetime import datetime
-from database import SessionLocal, Base, engine
+from datetime import date as Date, datetime
+from typing import Optional
+from database import Base, engine, get_db
 from models import PublicHoliday, CalendarEvent
+from recurrence import expand, in_window, last_occurrence, normalize_exceptions, normalize_rule, window_or_year
+from responses import FastJSONResponse
+from http_cache import cache_policy
 
 router = APIRouter(prefix="/admin", tags=["Calendar"])
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # GET /api/admin/calendar/events
-@router.get("/calendar/events", operation_id="getCalendarEvents")
-def get_calendar_events(db: Session = Depends(get_db)):
+@router.get(
+    "/calendar/events",
+    operation_id="getCalendarEvents",
+    response_class=FastJSONResponse,
+    dependencies=[cache_policy("public_holidays", "calendar_events", cache_control="private, max-age=60")],
+)
+def get_calendar_events(start: Optional[Date] = None, end: Optional[Date] = None, db: Session = Depends(get_db)):
     """
     Get all calendar events including:
     - Public holidays (from PublicHoliday table)
     - Custom events (funerals, trips, etc. from CalendarEvent table)
+
+    With start and/or end (YYYY-MM-DD, inclusive) only that window is
+    returned; a missing start or end is taken from the other's calendar
+    year. Without either, every holiday and one-off event is returned as
+    before. Recurring events are returned once per occurrence inside the
+    window (the current year if none is given), with the same id.
     """
+    windowed = start is not None or end is not None
+    try:
+        window_start, window_end = window_or_year(start, end, Date.today())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     events = []
 
     # 1. Add public holidays
-    holidays = db.query(PublicHoliday).all()
+    holidays = db.query(PublicHoliday)
+    if windowed:
+        holidays = holidays.filter(PublicHoliday.date >= window_start, PublicHoliday.date <= window_end)
+    holidays = holidays.all()
     for h in holidays:
         events.append({
             "id": h.id,
@@ -38,21 +53,29 @@ def get_calendar_events(db: Session = Depends(get_db)):
         })
 
     # 2. Add custom calendar events (funerals, trips, etc.)
-    custom_events = db.query(CalendarEvent).order_by(CalendarEvent.date).all()
-    for e in custom_events:
-        events.append({
-            "id": e.id,
-            "title": e.title,
-            "date": str(e.date),
-            "type": e.type,
-            "description": e.description,
-            "source": "custom",
-            "editable": True
-        })
+    custom_events = db.query(CalendarEvent)
+    if windowed:
+        custom_events = custom_events.filter(in_window(CalendarEvent, CalendarEvent.date, window_start, window_end))
+    for e in custom_events.order_by(CalendarEvent.date).all():
+        if e.recurrence is None and not windowed:
+            days = (e.date,)
+        else:
+            days = expand(e.recurrence, e.date, e.recurrence_exceptions, window_start, window_end)
+        for day in days:
+            events.append({
+                "id": e.id,
+                "title": e.title,
+                "date": str(day),
+                "type": e.type,
+                "description": e.description,
+                "recurrence": e.recurrence,
+                "source": "custom",
+                "editable": True
+            })
 
     # Sort all events by date
     events.sort(key=lambda x: x["date"])
-    return events
+    return FastJSONResponse(events)
 
 # POST /api/admin/calendar/events
 @router.post("/calendar/events", operation_id="createCalendarEvent", status_code=201)
@@ -61,11 +84,17 @@ def create_calendar_event(
     date: str,
     type: str,
     description: str = None,
+    recurrence: str = None,
+    exceptions: str = None,
     db: Session = Depends(get_db)
 ):
     """
     Add a new event to the calendar (e.g., funeral, trip, official event)
     Admin-only endpoint.
+
+    A repeating event is one row: `recurrence` is an RRULE such as
+    FREQ=MONTHLY;BYDAY=-1FR;UNTIL=20261231 with `date` as its first
+    occurrence, and `exceptions` lists skipped dates (comma-separated).
     """
     # Validate date format
     try:
@@ -84,6 +113,12 @@ def create_calendar_event(
             detail=f"Type must be one of {valid_types}"
         )
 
+    try:
+        recurrence = normalize_rule(recurrence, event_date)
+        exceptions = normalize_exceptions(exceptions) if recurrence else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     # Check for duplicate event (same title, date, type)
     existing = db.query(CalendarEvent).filter(
         CalendarEvent.title == title,
@@ -101,7 +136,10 @@ def create_calendar_event(
         title=title,
         date=event_date,
         type=type,
-        description=description
+        description=description,
+        recurrence=recurrence,
+        recurrence_exceptions=exceptions,
+        recurs_until=last_occurrence(recurrence, event_date),
     )
 
     try:
@@ -115,8 +153,27 @@ def create_calendar_event(
             "date": str(event.date),
             "type": event.type,
             "description": event.description,
+            "recurrence": event.recurrence,
+            "exceptions": event.recurrence_exceptions,
             "message": "✅ Event added to calendar"
         }
     except Exception as e:
         db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to save event: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to save event: {str(e)}")
+
+# POST /api/admin/calendar/events/{event_id}/exceptions
+@router.post("/calendar/events/{event_id}/exceptions", operation_id="skipCalendarEventOccurrence")
+def skip_calendar_event_occurrence(event_id: int, date: Date, db: Session = Depends(get_db)):
+    """Skip one occurrence of a recurring event, e.g. a meeting that falls on a holiday."""
+    event = db.query(CalendarEvent).filter(CalendarEvent.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if event.recurrence is None:
+        raise HTTPException(status_code=400, detail="Event does not repeat")
+    if not expand(event.recurrence, event.date, None, date, date):
+        raise HTTPException(status_code=400, detail=f"Event does not occur on {date}")
+
+    current = event.recurrence_exceptions.split(",") if event.recurrence_exceptions else []
+    event.recurrence_exceptions = normalize_exceptions(current + [date.isoformat()])
+    db.commit()
+    return {"id": event.id, "recurrence": event.recurrence, "exceptions": event.recurrence_exceptions}
\ No newline at end of file
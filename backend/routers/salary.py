@@ -1,12 +1,66 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from datetime import datetime, date
-from pydantic import BaseModel
-from database import get_db
-from models import Attendance, Employee
+from datetime import datetime, date, timedelta
+from pydantic import BaseModel, Field, field_validator
+from typing import Dict, List, Optional
+from database import get_db, get_read_db
+from models import Attendance, Employee, MonthlyAttendance
+from archive import attendance_archive, attendance_records
+from crud import get_employee_by_email
+from dashboard import today_ea
+from payroll import DEFAULT_HOURLY_RATE, MAX_SCENARIOS, department_payslips, load_payroll_hours, salary_figures, simulate
+from payslips import payslip_renderer, stream_zip
+from responses import FastJSONResponse
 
 router = APIRouter(tags=["salary"])
 
+
+def month_hours(db: Session, email: str, month_start: date, month_end: date, clocked_in_only: bool = False) -> float:
+    last_day = month_end - timedelta(days=1)
+    if attendance_archive.years_between(month_start, last_day):
+        return sum(
+            r.total_hours or 0.0
+            for r in attendance_records(db, email, month_start, last_day)
+            if not clocked_in_only or r.minutes_in is not None
+        )
+
+    query = db.query(
+        func.coalesce(func.sum(Attendance.total_hours), 0.0)
+    ).filter(
+        Attendance.employee_email == email,
+        Attendance.date >= month_start,
+        Attendance.date < month_end,
+    )
+    if clocked_in_only:
+        query = query.filter(Attendance.minutes_in != None)
+    return query.scalar()
+
+
+def closed_month_hours(db: Session, email: str, months: list) -> dict:
+    """
+    Hours for months before the current one from the scheduler's
+    attendance_monthly rollup, keyed "YYYY-MM". Months it has no row for
+    are left out.
+    """
+    current = today_ea().strftime("%Y-%m")
+    closed = [m for m in months if m < current]
+    if not closed:
+        return {}
+    return dict(db.query(MonthlyAttendance.month, MonthlyAttendance.total_hours).filter(
+        MonthlyAttendance.employee_email == email,
+        MonthlyAttendance.month.in_(closed),
+    ))
+
+def month_range(month: str) -> tuple:
+    """(first day, first day of the next month) for "YYYY-MM"; 400 if malformed."""
+    try:
+        year, mo = map(int, month.split('-'))
+        return date(year, mo, 1), date(year + 1, 1, 1) if mo == 12 else date(year, mo + 1, 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM")
+
 class SalaryCalculationRequest(BaseModel):
     employee_email: str
     month: str  
@@ -25,87 +79,110 @@ class SalaryResponse(BaseModel):
 @router.post("/salary/calculate", response_model=SalaryResponse, operation_id="calculate_employee_salary")
 def calculate_salary(request: SalaryCalculationRequest, db: Session = Depends(get_db)):
 
-    try:
-        year, month = map(int, request.month.split('-'))
-        month_start = date(year, month, 1)
-        if month == 12:
-            month_end = date(year + 1, 1, 1)
-        else:
-            month_end = date(year, month + 1, 1)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM")
-    
-    records = db.query(Attendance).filter(
-        Attendance.employee_email == request.employee_email,
-        Attendance.date >= month_start,
-        Attendance.date < month_end,
-        Attendance.time_in != None, 
-    ).all()
+    month_start, month_end = month_range(request.month)
+    total_hours = month_hours(db, request.employee_email, month_start, month_end, clocked_in_only=True)
     
-    total_hours = 0.0
-    for record in records:
-        if record.total_hours is not None:
-            total_hours += record.total_hours
-        elif record.time_in and record.time_out:
-            try:
-                from datetime import datetime, timedelta
-                time_in = datetime.strptime(record.time_in, "%H:%M")
-                time_out = datetime.strptime(record.time_out, "%H:%M")
-                if time_out < time_in:
-                    time_out += timedelta(days=1)
-                hours = (time_out - time_in).seconds / 3600
-                total_hours += hours
-            except:
-                pass 
-    
-    hourly_rate = request.hourly_rate
-    gross_salary = round(total_hours * hourly_rate, 2)
-    deduction_rate = 0.10
-    deductions = round(gross_salary * deduction_rate, 2)
-    net_salary = round(gross_salary - deductions, 2)
-    
-    return SalaryResponse(
-        employee_email=request.employee_email,
-        month=request.month,
-        total_hours=round(total_hours, 2),
-        hourly_rate=hourly_rate,
-        gross_salary=gross_salary,
-        deductions=deductions,
-        net_salary=net_salary,
-        breakdown={
-            "base_calculation": f"{total_hours:.2f} hrs × KES {hourly_rate}/hr",
-            "deduction_rate": f"{deduction_rate * 100}%",
-            "deduction_items": ["NHIF", "NSSF", "PAYE (estimated)"],
-        }
+    return SalaryResponse(**salary_figures(request.employee_email, request.month, total_hours, request.hourly_rate))
+
+class DeductionBracket(BaseModel):
+    up_to: Optional[float] = Field(None, gt=0)   # monthly gross pay; None = no upper limit
+    rate: float = Field(..., ge=0, le=1)
+
+class PayrollScenario(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    hourly_rate: float = Field(DEFAULT_HOURLY_RATE, ge=0)
+    department_rates: Dict[str, float] = {}
+    overtime_multiplier: float = Field(1.0, ge=0)
+    # Marginal brackets in ascending order; none means a flat 10% as in /salary/calculate.
+    deduction_brackets: List[DeductionBracket] = []
+
+    @field_validator("deduction_brackets")
+    @classmethod
+    def brackets_ascending(cls, brackets):
+        limits = [b.up_to for b in brackets]
+        if None in limits[:-1]:
+            raise ValueError("Only the last bracket may have no up_to")
+        bounded = [l for l in limits if l is not None]
+        if bounded != sorted(set(bounded)):
+            raise ValueError("Bracket up_to values must be strictly ascending")
+        return brackets
+
+class PayrollSimulationRequest(BaseModel):
+    month: str
+    scenarios: List[PayrollScenario] = Field(..., min_length=1, max_length=MAX_SCENARIOS)
+
+@router.post("/salary/simulate", operation_id="simulate_payroll", response_class=FastJSONResponse)
+def simulate_payroll(request: PayrollSimulationRequest, db: Session = Depends(get_read_db)):
+    """
+    What would the month's payroll cost under each scenario? The month's
+    hours are loaded once and every scenario is evaluated over all
+    employees in one vectorized pass. Returns per-scenario totals and
+    per-department breakdowns.
+    """
+    month_start, month_end = month_range(request.month)
+    hours = load_payroll_hours(db, month_start, month_end)
+    return FastJSONResponse(simulate(hours, request.scenarios))
+
+@router.get("/salary/payslip/{email}", operation_id="get_payslip")
+def get_payslip(email: str, month: str, db: Session = Depends(get_read_db)):
+    """Printable HTML payslip for one employee's month."""
+    employee = get_employee_by_email(db, email)
+    if not employee:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    month_start, month_end = month_range(month)
+    month = month_start.strftime("%Y-%m")  # "2025-3" and "2025-03" are one cached payslip
+
+    payslip = salary_figures(email, month, month_hours(db, email, month_start, month_end, clocked_in_only=True))
+    payslip["name"] = employee.name
+    payslip["department"] = employee.department
+    return FileResponse(payslip_renderer.render(payslip), media_type="text/html; charset=utf-8")
+
+@router.get("/salary/payslips/department/{department}", operation_id="download_department_payslips")
+def download_department_payslips(department: str, month: str, db: Session = Depends(get_read_db)):
+    """
+    ZIP of every payslip in a department for `month`. Payslips are rendered
+    in worker processes (or served from the payslip cache), and the ZIP is
+    streamed as each one is ready, so the download starts before the last
+    payslip is rendered.
+    """
+    month_start, month_end = month_range(month)
+    month = month_start.strftime("%Y-%m")
+    payslips = department_payslips(db, department, month_start, month_end)
+    if not payslips:
+        raise HTTPException(status_code=404, detail="No employees in this department")
+
+    entries = (
+        (f"payslip-{month}-{payslip['employee_email']}.html", path)
+        for payslip, path in payslip_renderer.render_all(payslips)
+    )
+    filename = "".join(c if c.isalnum() else "-" for c in department)
+    return StreamingResponse(
+        stream_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="payslips-{filename}-{month}.zip"'},
     )
 
 @router.get("/salary/history/{email}", operation_id="get_salary_history")
-def get_salary_history(email: str, limit: int = 6, db: Session = Depends(get_db)):
+def get_salary_history(email: str, limit: int = 6, db: Session = Depends(get_read_db)):
     from datetime import timedelta
     
     history = []
-    today = date.today()
-    
+    today = today_ea()
+    months = []
     for i in range(limit):
-        if today.month - i <= 0:
-            calc_year = today.year - 1
-            calc_month = 12 + (today.month - i)
-        else:
-            calc_year = today.year
-            calc_month = today.month - i
-        
-        month_str = f"{calc_year}-{str(calc_month).zfill(2)}"
+        year, month = divmod(today.year * 12 + today.month - 1 - i, 12)
+        months.append(f"{year}-{month + 1:02d}")
+    rolled_up = closed_month_hours(db, email, months)
+    
+    for month_str in months:
+        calc_year, calc_month = map(int, month_str.split("-"))
         
         month_start = date(calc_year, calc_month, 1)
         month_end = date(calc_year, calc_month + 1, 1) if calc_month < 12 else date(calc_year + 1, 1, 1)
         
-        records = db.query(Attendance).filter(
-            Attendance.employee_email == email,
-            Attendance.date >= month_start,
-            Attendance.date < month_end,
-        ).all()
-        
-        total_hours = sum(r.total_hours for r in records if r.total_hours)
+        total_hours = rolled_up.get(month_str)
+        if total_hours is None:
+            total_hours = month_hours(db, email, month_start, month_end)
         hourly_rate = 500.0
         gross = round(total_hours * hourly_rate, 2)
         deductions = round(gross * 0.10, 2)
@@ -0,0 +1,170 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import get_db
+from models import Attendance, CalendarEvent, PublicHoliday, SharedEvent
+from responses import FastJSONResponse
+from timekeeping import to_hhmm
+
+router = APIRouter(tags=["sync"])
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+
+def _attendance(row):
+    return {
+        "id": row.id,
+        "date": row.date,
+        "time_in": to_hhmm(row.minutes_in),
+        "time_out": to_hhmm(row.minutes_out),
+        "total_hours": row.total_hours,
+        "status": row.status,
+    }
+
+
+def _shared_event(row):
+    return {
+        "id": row.id,
+        "title": row.title,
+        "description": row.description,
+        "event_date": row.event_date,
+        "event_type": row.event_type,
+        "target_department": row.target_department,
+        "created_by": row.created_by,
+        "created_at": row.created_at,
+        "recurrence": row.recurrence,
+        "exceptions": row.recurrence_exceptions,
+    }
+
+
+def _calendar_event(row):
+    return {
+        "id": row.id, "title": row.title, "date": row.date, "type": row.type, "description": row.description,
+        "recurrence": row.recurrence, "exceptions": row.recurrence_exceptions,
+    }
+
+
+def _holiday(row):
+    return {"id": row.id, "name": row.name, "date": row.date}
+
+
+@router.get("/sync", operation_id="sync_changes", response_class=FastJSONResponse)
+def sync_changes(
+    since: int = Query(0, ge=0),
+    email: Optional[str] = None,
+    department: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    db: Session = Depends(get_db),
+):
+    """
+    Rows changed since `since`, for offline clients.
+
+    Start with since=0, store the returned `cursor`, and pass it back next
+    time. Keep calling while `has_more` is true. Rows are full current
+    values: upsert them by id. Recurring events come as one row with their
+    `recurrence` rule and `exceptions`; clients expand them locally. `deleted` lists ids to remove, including
+    deactivated shared events and rows that no longer match `email` or
+    `department`; apply it before the rows, since a row that moved from
+    one filtered view to another can be in both. `reset` means the server's history no longer
+    matches the cursor (e.g. after a restore): drop local data and sync
+    from 0.
+
+    - email: only this employee's attendance (all attendance if omitted)
+    - department: shared events for this department plus global ones,
+      as in GET /admin/events (global ones only if omitted)
+    """
+    # Read the high-water mark first: a row committed after this point is
+    # at worst sent again next time, never skipped.
+    latest = db.execute(text("SELECT value FROM sync_sequence")).scalar()
+
+    attendance = db.query(
+        Attendance.sync_seq, Attendance.id, Attendance.date, Attendance.minutes_in,
+        Attendance.minutes_out, Attendance.total_hours, Attendance.status,
+    )
+    if email:
+        attendance = attendance.filter(Attendance.employee_email == email)
+
+    shared_events = db.query(
+        SharedEvent.sync_seq, SharedEvent.id, SharedEvent.title, SharedEvent.description,
+        SharedEvent.event_date, SharedEvent.event_type, SharedEvent.target_department,
+        SharedEvent.created_by, SharedEvent.created_at, SharedEvent.is_active,
+        SharedEvent.recurrence, SharedEvent.recurrence_exceptions,
+    )
+    if department:
+        shared_events = shared_events.filter(
+            (SharedEvent.target_department == None) | (SharedEvent.target_department == department)
+        )
+    else:
+        shared_events = shared_events.filter(SharedEvent.target_department == None)
+
+    sections = {
+        "attendance": attendance.filter(Attendance.sync_seq > since).order_by(Attendance.sync_seq),
+        "shared_events": shared_events.filter(SharedEvent.sync_seq > since).order_by(SharedEvent.sync_seq),
+        "calendar_events": db.query(
+            CalendarEvent.sync_seq, CalendarEvent.id, CalendarEvent.title, CalendarEvent.date,
+            CalendarEvent.type, CalendarEvent.description,
+            CalendarEvent.recurrence, CalendarEvent.recurrence_exceptions,
+        ).filter(CalendarEvent.sync_seq > since).order_by(CalendarEvent.sync_seq),
+        "holidays": db.query(
+            PublicHoliday.sync_seq, PublicHoliday.id, PublicHoliday.name, PublicHoliday.date,
+        ).filter(PublicHoliday.sync_seq > since).order_by(PublicHoliday.sync_seq),
+    }
+
+    # Each section is read up to `limit` rows. If any section has more, the
+    # page ends at the lowest last sequence among the truncated sections and
+    # rows past it wait for the next call.
+    cursor = max(latest, since)
+    has_more = False
+    rows = {}
+    for name, query in sections.items():
+        rows[name] = query.limit(limit + 1).all()
+    # Deletes go to everyone. Scoped tombstones (migrations.create_sync_moves)
+    # go to the clients whose filter the row matched before it moved.
+    rows["tombstones"] = db.execute(
+        text("""
+            SELECT seq AS sync_seq, table_name, row_id FROM sync_tombstones
+            WHERE seq > :since AND (
+                scope IS NULL
+                OR (table_name = 'attendance' AND (:email IS NULL OR scope = :email))
+                OR (table_name = 'shared_events' AND scope IN ('', :department))
+            )
+            ORDER BY seq LIMIT :n
+        """),
+        {"since": since, "email": email or None, "department": department or None, "n": limit + 1},
+    ).all()
+    for name, section in rows.items():
+        if len(section) > limit:
+            has_more = True
+            cursor = min(cursor, section[limit - 1].sync_seq)
+    if has_more:
+        rows = {name: [row for row in section if row.sync_seq <= cursor] for name, section in rows.items()}
+
+    deleted = {"attendance": [], "shared_events": [], "calendar_events": [], "holidays": []}
+    table_sections = {
+        "attendance": "attendance",
+        "shared_events": "shared_events",
+        "calendar_events": "calendar_events",
+        "public_holidays": "holidays",
+    }
+    for row in rows["tombstones"]:
+        deleted[table_sections[row.table_name]].append(row.row_id)
+
+    active_events = []
+    for row in rows["shared_events"]:
+        if row.is_active:
+            active_events.append(_shared_event(row))
+        else:
+            deleted["shared_events"].append(row.id)
+
+    return FastJSONResponse({
+        "cursor": cursor,
+        "has_more": has_more,
+        "reset": since > latest,
+        "attendance": [_attendance(row) for row in rows["attendance"]],
+        "shared_events": active_events,
+        "calendar_events": [_calendar_event(row) for row in rows["calendar_events"]],
+        "holidays": [_holiday(row) for row in rows["holidays"]],
+        "deleted": deleted,
+    })
@@ -0,0 +1,311 @@
+import json
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import Callable, Optional
+import pytz
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import ScheduledJob
+from tenancy import tenant_names, use_tenant
+
+ea_tz = pytz.timezone("Africa/Nairobi")
+IDLE_WAKEUP_SECONDS = 60
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class Daily:
+    """Every day at hour:minute East Africa Time."""
+
+    def __init__(self, hour: int, minute: int = 0):
+        self.hour, self.minute = hour, minute
+
+    def next_run(self, after: datetime) -> datetime:
+        local = after.replace(tzinfo=timezone.utc).astimezone(ea_tz)
+        run = local.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if run <= local:
+            run += timedelta(days=1)
+        return run.astimezone(timezone.utc).replace(tzinfo=None)
+
+    def __str__(self):
+        return f"daily {self.hour:02d}:{self.minute:02d} EAT"
+
+
+class Hourly:
+    """Every hour at `minute` past."""
+
+    def __init__(self, minute: int = 0):
+        self.minute = minute
+
+    def next_run(self, after: datetime) -> datetime:
+        run = after.replace(minute=self.minute, second=0, microsecond=0)
+        if run <= after:
+            run += timedelta(hours=1)
+        return run
+
+    def __str__(self):
+        return f"hourly at :{self.minute:02d}"
+
+
+class Monthly(Daily):
+    """On `day` of every month at hour:minute East Africa Time."""
+
+    def __init__(self, day: int, hour: int, minute: int = 0):
+        super().__init__(hour, minute)
+        self.day = day
+
+    def next_run(self, after: datetime) -> datetime:
+        local = after.replace(tzinfo=timezone.utc).astimezone(ea_tz)
+        year, month = local.year, local.month
+        while True:
+            run = ea_tz.localize(datetime(year, month, self.day, self.hour, self.minute))
+            if run > local:
+                return run.astimezone(timezone.utc).replace(tzinfo=None)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    def __str__(self):
+        return f"monthly day {self.day} {self.hour:02d}:{self.minute:02d} EAT"
+
+
+class Job:
+    """
+    A scheduled function taking a Session. An exclusive job runs on one
+    worker per occurrence; a non-exclusive one (e.g. warming an in-process
+    cache) runs on every worker. The function may return a small
+    JSON-serializable summary that is kept as the job's last result.
+    """
+
+    __slots__ = (
+        "name", "func", "schedule", "exclusive", "lease_seconds", "next_run",
+        "running", "last_started", "last_finished", "last_status", "last_error",
+        "last_duration_ms", "last_result", "runs",
+    )
+
+    def __init__(self, name: str, func: Callable, schedule: Daily, exclusive: bool = True, lease_seconds: int = 900):
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.exclusive = exclusive
+        self.lease_seconds = lease_seconds
+        self.next_run: Optional[datetime] = None
+        self.running = False
+        self.last_started = self.last_finished = None
+        self.last_status = self.last_error = None
+        self.last_duration_ms = None
+        self.last_result = None
+        self.runs = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "schedule": str(self.schedule),
+            "exclusive": self.exclusive,
+            "running": self.running,
+            "next_run": self.next_run,
+            "last_started": self.last_started,
+            "last_finished": self.last_finished,
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+            "last_duration_ms": self.last_duration_ms,
+            "last_result": self.last_result,
+            "runs": self.runs,
+        }
+
+
+class Scheduler:
+    """
+    In-process job scheduler on one background thread.
+    Exclusive jobs first claim their occurrence in the scheduled_jobs table
+    with a conditional upsert, so when several workers share the database
+    only the first one to claim a given due time runs it. The same row keeps
+    the last-run status for every worker to report, and its last_due lets a
+    restarted scheduler run an occurrence that fell while it was down.
+    """
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.jobs = {}
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def add(self, job: Job):
+        self.jobs[job.name] = job
+
+    def is_running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread:
+            return
+        now = utcnow()
+        for job in self.jobs.values():
+            job.next_run = self._missed(job, now) or job.schedule.next_run(now)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+    def _missed(self, job: Job, now: datetime) -> Optional[datetime]:
+        """
+        The latest occurrence of an exclusive job that came due after the
+        oldest last_due any tenant has stored, if it is already past.
+        Only that one is caught up: jobs work from the current state, so
+        running every missed occurrence would repeat the same work.
+        """
+        if not job.exclusive:
+            return None
+        last_due = []
+        for tenant in tenant_names():
+            with use_tenant(tenant):
+                db = self.session_factory()
+                try:
+                    row = db.query(ScheduledJob.last_due).filter(ScheduledJob.name == job.name).first()
+                except Exception as e:
+                    print(f"Job {job.name}: could not read its last run for {tenant}: {e}")
+                    row = None
+                finally:
+                    db.close()
+            if row is not None and row.last_due is not None:
+                last_due.append(row.last_due)
+        if not last_due:
+            return None
+        missed = job.schedule.next_run(min(last_due))
+        if missed > now:
+            return None
+        while (following := job.schedule.next_run(missed)) <= now:
+            missed = following
+        return missed
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            now = utcnow()
+            for job in self.jobs.values():
+                if job.next_run <= now:
+                    due, job.next_run = job.next_run, job.schedule.next_run(now)
+                    # Each tenant's database has its own scheduled_jobs claims.
+                    for tenant in tenant_names():
+                        with use_tenant(tenant):
+                            try:
+                                self.run(job.name, due)
+                            except Exception as e:
+                                # e.g. "database is locked" while claiming; the
+                                # thread must survive to run the next occurrence.
+                                print(f"Job {job.name} could not run for {tenant}: {e}")
+            next_due = min((job.next_run for job in self.jobs.values()), default=None)
+            timeout = IDLE_WAKEUP_SECONDS
+            if next_due is not None:
+                timeout = min(timeout, max((next_due - utcnow()).total_seconds(), 0))
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def _claim(self, db, job: Job, due: datetime) -> bool:
+        now = utcnow()
+        table = ScheduledJob.__table__
+        stmt = sqlite_insert(ScheduledJob).values(
+            name=job.name,
+            owner=self.owner,
+            lease_until=now + timedelta(seconds=job.lease_seconds),
+            last_due=due,
+            runs=0,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ScheduledJob.name],
+            set_={
+                "owner": stmt.excluded.owner,
+                "lease_until": stmt.excluded.lease_until,
+                "last_due": stmt.excluded.last_due,
+            },
+            where=(
+                or_(table.c.lease_until == None, table.c.lease_until < now)
+                & or_(table.c.last_due == None, table.c.last_due < stmt.excluded.last_due)
+            ),
+        ).returning(ScheduledJob.name)
+        claimed = db.execute(stmt).first() is not None
+        db.commit()
+        return claimed
+
+    def _record(self, db, job: Job):
+        db.query(ScheduledJob).filter(ScheduledJob.name == job.name).update({
+            "lease_until": None,
+            "last_started": job.last_started,
+            "last_finished": job.last_finished,
+            "last_status": job.last_status,
+            "last_error": job.last_error,
+            "last_duration_ms": job.last_duration_ms,
+            "last_result": json.dumps(job.last_result, default=str),
+            "runs": ScheduledJob.runs + 1,
+        })
+        db.commit()
+
+    def run(self, name: str, due: Optional[datetime] = None) -> dict:
+        """
+        Run a job now (on the calling thread) unless another worker already
+        holds this occurrence. Returns the job's status afterwards.
+        """
+        job = self.jobs[name]
+        due = due or utcnow()
+        db = self.session_factory()
+        try:
+            if job.exclusive and not self._claim(db, job, due):
+                job.last_status = "skipped: claimed by another worker"
+                return job.as_dict()
+
+            job.running = True
+            job.last_started = utcnow()
+            started = perf_counter()
+            try:
+                job.last_result = job.func(db)
+                db.commit()
+                job.last_status, job.last_error = "ok", None
+            except Exception as e:
+                db.rollback()
+                job.last_status, job.last_error = "error", repr(e)
+            finally:
+                job.running = False
+                job.last_finished = utcnow()
+                job.last_duration_ms = round((perf_counter() - started) * 1000, 2)
+                job.runs += 1
+                print(f"Job {job.name}: {job.last_status} in {job.last_duration_ms} ms")
+
+            if job.exclusive:
+                self._record(db, job)
+            return job.as_dict()
+        finally:
+            db.close()
+
+    def status(self, db) -> list:
+        """Every job's schedule and last run; exclusive jobs report the run of whichever worker did it."""
+        shared = {row.name: row for row in db.query(ScheduledJob)}
+        jobs = []
+        for job in self.jobs.values():
+            info = job.as_dict()
+            row = shared.get(job.name)
+            if job.exclusive and row is not None and row.last_started:
+                info.update({
+                    "running": row.lease_until is not None and row.lease_until > utcnow(),
+                    "last_started": row.last_started,
+                    "last_finished": row.last_finished,
+                    "last_status": row.last_status,
+                    "last_error": row.last_error,
+                    "last_duration_ms": row.last_duration_ms,
+                    "last_result": json.loads(row.last_result) if row.last_result else None,
+                    "runs": row.runs,
+                    "last_owner": row.owner,
+                })
+            jobs.append(info)
+        return jobs
@@ -1,34 +1,15 @@
-from sqlalchemy.orm import Session
+import sys
 from datetime import date
-from database import SessionLocal, engine, Base
-from models import PublicHoliday
+from database import SessionLocal
+from holidays import sync_holidays
+import migrations
 
-KENYA_HOLIDAYS = [
-    {"name": "New Year's Day",           "date": date(2025, 1, 1)},
-    {"name": "Good Friday",              "date": date(2025, 4, 18)},
-    {"name": "Easter Monday",            "date": date(2025, 4, 21)},
-    {"name": "Labour Day",               "date": date(2025, 5, 1)},
-    {"name": "Madaraka Day",             "date": date(2025, 6, 1)},
-    {"name": "Huduma Day",               "date": date(2025, 10, 10)},
-    {"name": "Mashujaa Day",             "date": date(2025, 10, 20)},
-    {"name": "Independence Day",         "date": date(2025, 12, 12)},
-    {"name": "Christmas Day",            "date": date(2025, 12, 25)},
-    {"name": "Boxing Day",               "date": date(2025, 12, 26)},
-]
 
-def seed_holidays():
+def seed_holidays(first_year: int, last_year: int):
     db = SessionLocal()
     try:
-        for holiday_data in KENYA_HOLIDAYS:
-            existing = db.query(PublicHoliday).filter(PublicHoliday.date == holiday_data["date"]).first()
-            if not existing:
-                holiday = PublicHoliday(**holiday_data)
-                db.add(holiday)
-                print(f"Added: {holiday_data['name']} on {holiday_data['date']}")
-            else:
-                print(f"Already exists: {holiday_data['name']} on {holiday_data['date']}")
-        db.commit()
-        print("\nAll holidays seeded successfully!")
+        added = sync_holidays(db, first_year, last_year)
+        print(f"Added {added} holidays for {first_year}-{last_year}.")
     except Exception as e:
         print(f"Error: {e}")
         db.rollback()
@@ -36,5 +17,9 @@ def seed_holidays():
         db.close()
 
 if __name__ == "__main__":
-    Base.metadata.create_all(bind=engine)
-    seed_holidays()
\ No newline at end of file
+    # python seed_holidays.py [first_year [last_year]]
+    this_year = date.today().year
+    first_year = int(sys.argv[1]) if len(sys.argv) > 1 else this_year
+    last_year = int(sys.argv[2]) if len(sys.argv) > 2 else first_year + 1
+    migrations.upgrade()
+    seed_holidays(first_year, last_year)
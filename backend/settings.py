@@ -0,0 +1,130 @@
+import os
+
+
+def _flag(name: str, default: str = "off") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "on", "yes")
+
+
+# Group-commit mode for POST /attendance/log.
+# "commit": the request waits until its batch is committed (same answers as direct mode).
+# "enqueue": the request is acknowledged as soon as the event is queued.
+CLOCK_BATCHING = _flag("PESA_PAY_CLOCK_BATCHING")
+CLOCK_BATCH_SIZE = int(os.getenv("PESA_PAY_CLOCK_BATCH_SIZE", "200"))
+CLOCK_FLUSH_INTERVAL_MS = int(os.getenv("PESA_PAY_CLOCK_FLUSH_INTERVAL_MS", "5"))
+CLOCK_DURABILITY = os.getenv("PESA_PAY_CLOCK_DURABILITY", "commit")
+# How long a "commit" request waits for its batch before answering 500.
+CLOCK_RESULT_TIMEOUT_SECONDS = float(os.getenv("PESA_PAY_CLOCK_RESULT_TIMEOUT_SECONDS", "10"))
+# "enqueue" events that fail after being acknowledged are appended here.
+CLOCK_DEAD_LETTER = os.getenv("PESA_PAY_CLOCK_DEAD_LETTER", "./clock_dead_letter.ndjson")
+
+# Responses larger than GZIP_MINIMUM_SIZE bytes are gzip-compressed for
+# clients that accept it.
+GZIP_MINIMUM_SIZE = int(os.getenv("PESA_PAY_GZIP_MINIMUM_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("PESA_PAY_GZIP_LEVEL", "6"))
+# Use FastJSONResponse for every route. Off by default: recent FastAPI already
+# serializes response_model routes straight to JSON bytes, which a custom
+# default response class disables.
+FAST_JSON = _flag("PESA_PAY_FAST_JSON")
+# ETags come from the change_versions table (http_cache.py); each worker
+# re-reads it at most this often, and at once after its own writes.
+CHANGE_VERSION_CACHE_SECONDS = float(os.getenv("PESA_PAY_CHANGE_VERSION_CACHE_SECONDS", "1"))
+
+# Token-bucket rate limits. Every request is charged to its client IP, and
+# requests acting on one employee (clock-in, login, /{email} paths) to that
+# employee as well. Costs per route are in traffic.ROUTE_COSTS. A whole
+# office clocking in behind one NAT address shares the IP bucket: raise
+# RATE_IP_CAPACITY to about 2 x its head count if the morning rush hits 429s.
+RATE_LIMIT = _flag("PESA_PAY_RATE_LIMIT", "on")
+RATE_IP_CAPACITY = float(os.getenv("PESA_PAY_RATE_IP_CAPACITY", "300"))
+RATE_IP_REFILL_PER_SECOND = float(os.getenv("PESA_PAY_RATE_IP_REFILL_PER_SECOND", "5"))
+RATE_EMPLOYEE_CAPACITY = float(os.getenv("PESA_PAY_RATE_EMPLOYEE_CAPACITY", "30"))
+RATE_EMPLOYEE_REFILL_PER_SECOND = float(os.getenv("PESA_PAY_RATE_EMPLOYEE_REFILL_PER_SECOND", "0.5"))
+# Load shedding: at most MAX_CONCURRENT_REQUESTS run at once (40 matches the
+# threadpool sync endpoints run in) and up to
+# MAX_QUEUED_REQUESTS wait (for QUEUE_TIMEOUT_SECONDS at most); beyond that
+# requests get 503 with Retry-After.
+MAX_CONCURRENT_REQUESTS = int(os.getenv("PESA_PAY_MAX_CONCURRENT_REQUESTS", "40"))
+MAX_QUEUED_REQUESTS = int(os.getenv("PESA_PAY_MAX_QUEUED_REQUESTS", "128"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("PESA_PAY_QUEUE_TIMEOUT_SECONDS", "5"))
+
+# Background jobs (see jobs.py). Open clock-ins from earlier days are closed
+# at AUTO_CLOSE_AT East Africa Time.
+SCHEDULER = _flag("PESA_PAY_SCHEDULER", "on")
+AUTO_CLOSE_AT = os.getenv("PESA_PAY_AUTO_CLOSE_AT", "17:00")
+
+# Closed years of attendance are moved out of the attendance table into
+# per-year column segments under ARCHIVE_DIR (see archive.py), once
+# ARCHIVE_GRACE_DAYS of the following year have passed.
+ARCHIVE_DIR = os.getenv("PESA_PAY_ARCHIVE_DIR", "./attendance_archive")
+ARCHIVE_GRACE_DAYS = int(os.getenv("PESA_PAY_ARCHIVE_GRACE_DAYS", "31"))
+
+# Multi-tenant mode: each county/organisation in TENANTS gets its own
+# database file (and attendance archive) under TENANT_DIR/<tenant>/, chosen
+# per request by the X-Tenant header. Requests without one use the
+# original ./pesa_pay.db. At most MAX_OPEN_TENANTS engines stay open.
+MULTI_TENANT = _flag("PESA_PAY_MULTI_TENANT")
+TENANTS = [t.strip().lower() for t in os.getenv("PESA_PAY_TENANTS", "").split(",") if t.strip()]
+TENANT_HEADER = os.getenv("PESA_PAY_TENANT_HEADER", "X-Tenant")
+TENANT_DIR = os.getenv("PESA_PAY_TENANT_DIR", "./tenants")
+MAX_OPEN_TENANTS = int(os.getenv("PESA_PAY_MAX_OPEN_TENANTS", "32"))
+
+# Read replicas for read-only endpoints (database.get_read_db). By default a
+# replica is a local snapshot of pesa_pay.db refreshed every
+# REPLICA_REFRESH_SECONDS; REPLICA_URLS (comma-separated) use streaming
+# replicas instead. A replica more than REPLICA_MAX_LAG_SECONDS behind is
+# skipped, and a client that just wrote reads from the primary until a
+# replica has caught up with its write.
+READ_REPLICAS = _flag("PESA_PAY_READ_REPLICAS")
+REPLICA_URLS = [u.strip() for u in os.getenv("PESA_PAY_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_REFRESH_SECONDS = float(os.getenv("PESA_PAY_REPLICA_REFRESH_SECONDS", "2"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("PESA_PAY_REPLICA_MAX_LAG_SECONDS", "10"))
+
+# Online backups (see backup.py): an hourly gzip snapshot of each tenant's
+# database into BACKUP_DIR, keeping the newest BACKUP_KEEP. The copy runs
+# BACKUP_PAGES_PER_STEP pages at a time with BACKUP_STEP_SLEEP_MS pauses so
+# requests keep their latency.
+BACKUPS = _flag("PESA_PAY_BACKUPS", "on")
+BACKUP_DIR = os.getenv("PESA_PAY_BACKUP_DIR", "./backups")
+BACKUP_KEEP = int(os.getenv("PESA_PAY_BACKUP_KEEP", "48"))
+BACKUP_PAGES_PER_STEP = int(os.getenv("PESA_PAY_BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_MS = float(os.getenv("PESA_PAY_BACKUP_STEP_SLEEP_MS", "10"))
+BACKUP_MAX_RESTARTS = int(os.getenv("PESA_PAY_BACKUP_MAX_RESTARTS", "3"))
+BACKUP_COMPRESSLEVEL = int(os.getenv("PESA_PAY_BACKUP_COMPRESSLEVEL", "1"))
+
+# Payslips (see payslips.py) are rendered by PAYSLIP_WORKERS processes into a
+# content-addressed cache under PAYSLIP_DIR. The default leaves one core for
+# the API. The month-end job drops cached months more than
+# PAYSLIP_KEEP_MONTHS pay months old.
+PAYSLIP_DIR = os.getenv("PESA_PAY_PAYSLIP_DIR", "./payslips")
+PAYSLIP_WORKERS = int(os.getenv("PESA_PAY_PAYSLIP_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+PAYSLIP_KEEP_MONTHS = int(os.getenv("PESA_PAY_PAYSLIP_KEEP_MONTHS", "3"))
+
+# Change capture (see outbox.py): triggers record every insert, update and
+# delete on attendance, employees, calendar_events and shared_events in an
+# outbox table, in the writing transaction. A relay thread moves them every
+# OUTBOX_INTERVAL_SECONDS into NDJSON segment files under OUTBOX_DIR,
+# starting a new segment once one passes OUTBOX_SEGMENT_BYTES. Segments
+# every registered consumer has confirmed are deleted beyond the newest
+# OUTBOX_KEEP_SEGMENTS; unconfirmed ones are never deleted.
+OUTBOX = _flag("PESA_PAY_OUTBOX", "on")
+OUTBOX_DIR = os.getenv("PESA_PAY_OUTBOX_DIR", "./outbox")
+OUTBOX_INTERVAL_SECONDS = float(os.getenv("PESA_PAY_OUTBOX_INTERVAL_SECONDS", "1"))
+OUTBOX_BATCH_SIZE = int(os.getenv("PESA_PAY_OUTBOX_BATCH_SIZE", "1000"))
+OUTBOX_SEGMENT_BYTES = int(os.getenv("PESA_PAY_OUTBOX_SEGMENT_BYTES", str(16 << 20)))
+OUTBOX_KEEP_SEGMENTS = int(os.getenv("PESA_PAY_OUTBOX_KEEP_SEGMENTS", "64"))
+
+# Geofenced clock-ins (see geofence.py). Clock events may carry latitude and
+# longitude, which are matched against the work sites of the employee's
+# department; the matched site is stored on the attendance row.
+# "off": coordinates are ignored.
+# "record": the site is recorded; events from elsewhere (or without
+# coordinates) are still accepted.
+# "enforce": employees of departments with a work site must clock in from one.
+GEOFENCE = os.getenv("PESA_PAY_GEOFENCE", "record")
+GEOFENCE_CELL_DEGREES = float(os.getenv("PESA_PAY_GEOFENCE_CELL_DEGREES", "0.01"))
+GEOFENCE_REFRESH_SECONDS = float(os.getenv("PESA_PAY_GEOFENCE_REFRESH_SECONDS", "60"))
+
+# Clock-ins look the employee's department up by email and keep it this long
+# per worker (see dashboard.py), for at most DEPARTMENT_CACHE_SIZE employees.
+DEPARTMENT_CACHE_SECONDS = float(os.getenv("PESA_PAY_DEPARTMENT_CACHE_SECONDS", "60"))
+DEPARTMENT_CACHE_SIZE = int(os.getenv("PESA_PAY_DEPARTMENT_CACHE_SIZE", "4096"))
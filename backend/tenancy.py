@@ -0,0 +1,124 @@
+import contextvars
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+from urllib.parse import parse_qs
+import settings
+
+# The tenant every request uses when multi-tenant mode is off or none is
+# named: the original ./pesa_pay.db.
+DEFAULT_TENANT = "default"
+TENANT_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+
+_current = contextvars.ContextVar("pesa_pay_tenant", default=DEFAULT_TENANT)
+
+
+def current_tenant() -> str:
+    return _current.get()
+
+
+@contextmanager
+def use_tenant(tenant: str):
+    """Run a block (a job, a queued write) against `tenant`'s database."""
+    token = _current.set(tenant)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def tenant_names() -> list:
+    if not settings.MULTI_TENANT:
+        return [DEFAULT_TENANT]
+    return [DEFAULT_TENANT] + [t for t in settings.TENANTS if t != DEFAULT_TENANT]
+
+
+def is_known_tenant(tenant: str) -> bool:
+    return tenant in tenant_names()
+
+
+def tenant_path(tenant: str, name: str) -> str:
+    """Where `tenant` keeps file `name`; the default tenant keeps the original layout."""
+    if tenant == DEFAULT_TENANT:
+        return os.path.join(".", name)
+    return os.path.join(settings.TENANT_DIR, tenant, name)
+
+
+class TenantLocal:
+    """
+    A per-database object (counters, caches, the live feed) kept once per
+    tenant and created on first use by factory(tenant). Attribute access is
+    forwarded to the current tenant's instance, so call sites keep using
+    the module-level name as before.
+    """
+
+    def __init__(self, factory: Callable[[str], object]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instances", {})
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def for_tenant(self, tenant: str):
+        instance = self._instances.get(tenant)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(tenant)
+                if instance is None:
+                    instance = self._instances[tenant] = self._factory(tenant)
+        return instance
+
+    def __getattr__(self, name: str):
+        return getattr(self.for_tenant(_current.get()), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self.for_tenant(_current.get()), name, value)
+
+
+def _tenant_from_scope(scope, header: bytes) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == header:
+            return value.decode("latin-1").strip().lower()
+    # EventSource can't set headers, so the live feed passes ?tenant=.
+    if scope.get("query_string"):
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        if "tenant" in query:
+            return query["tenant"][0].strip().lower()
+    return None
+
+
+class TenantMiddleware:
+    """
+    Picks the tenant for a request from the X-Tenant header (or ?tenant=)
+    and makes it current for everything the request does. Requests that
+    name no tenant keep the current one: the default tenant, or the outer
+    request's tenant for POST /batch sub-requests.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.header = settings.TENANT_HEADER.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or not settings.MULTI_TENANT:
+            return await self.app(scope, receive, send)
+
+        tenant = _tenant_from_scope(scope, self.header)
+        if tenant is None:
+            return await self.app(scope, receive, send)
+        if not TENANT_NAME.match(tenant) or not is_known_tenant(tenant):
+            body = json.dumps({"detail": "Unknown tenant"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 404,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        with use_tenant(tenant):
+            await self.app(scope, receive, send)
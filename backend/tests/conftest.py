@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The backend modules import each other top-level (as uvicorn runs them from backend/).
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+# database.engine resolves ./pesa_pay.db to an absolute path on import, so
+# import it from a scratch directory and never touch the real database.
+# main.py mounts ./static on import, so the rest is imported from backend/.
+DATA_DIR = tempfile.mkdtemp(prefix="pesa_pay_tests_")
+DATABASE = os.path.join(DATA_DIR, "pesa_pay.db")
+os.chdir(DATA_DIR)
+import database  # noqa: E402,F401
+os.chdir(BACKEND)
+import main  # noqa: E402,F401
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    An empty database at DATABASE, and an empty working directory for
+    every other ./ path the app uses (archive, outbox, payslips...).
+    """
+    from database import engine
+    engine.dispose()
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        if os.path.exists(DATABASE + suffix):
+            os.remove(DATABASE + suffix)
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    engine.dispose()
+
+
+@pytest.fixture
+def database_path(workdir):
+    return DATABASE
+
+
+@pytest.fixture
+def client(workdir, monkeypatch):
+    """
+    A TestClient on a freshly migrated database (no lifespan: no scheduler
+    or background threads), without rate limits.
+    """
+    from fastapi.testclient import TestClient
+    import migrations
+    import settings
+    monkeypatch.setattr(settings, "RATE_LIMIT", False)
+    from archive import attendance_archive
+    from dashboard import department_counters
+    from holidays import holiday_calendar
+    from http_cache import change_versions
+    migrations.upgrade()
+    department_counters._instances.clear()
+    change_versions._instances.clear()
+    holiday_calendar._instances.clear()
+    attendance_archive._instances.clear()
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def employee(client):
+    response = client.post("/api/v1/signup", json={
+        "name": "Amina Otieno",
+        "email": "amina@example.com",
+        "phone": "0712345678",
+        "gender": "Female",
+        "department": "ICT",
+        "salary": 85000,
+        "bank_name": "Equity Bank",
+        "account_number": "1234567890",
+        "password": "secret",
+    })
+    assert response.status_code == 200, response.text
+    return response.json()["email"]
@@ -0,0 +1,79 @@
+from datetime import date
+import pytest
+from sqlalchemy import text
+from archive import archive_year, attendance_records, attendance_totals
+from database import SessionLocal, engine
+
+EMAIL = "amina@example.com"
+
+
+def _execute(sql, **params):
+    with engine.begin() as conn:
+        return conn.execute(text(sql), params)
+
+
+def _add_day(day, minutes_in=480, minutes_out=960, hours=8.0):
+    _execute(
+        "INSERT INTO attendance (employee_email, date, minutes_in, minutes_out, total_hours, status) "
+        "VALUES (:email, :date, :minutes_in, :minutes_out, :hours, 'present')",
+        email=EMAIL, date=day, minutes_in=minutes_in, minutes_out=minutes_out, hours=hours,
+    )
+
+
+def _count(sql):
+    return _execute(sql).scalar()
+
+
+def _triggers():
+    return {name for (name,) in _execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+        "AND name IN ('attendance_sync_delete', 'attendance_outbox_delete')"
+    )}
+
+
+@pytest.fixture
+def db(client):
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def test_archived_year_reads_back_with_live_rows(db):
+    for day in ("2023-03-01", "2023-03-02", "2023-12-29"):
+        _add_day(day)
+    _add_day("2024-01-02", minutes_out=1020, hours=9.0)
+    tombstones, outbox = _count("SELECT count(*) FROM sync_tombstones"), _count("SELECT count(*) FROM outbox")
+
+    result = archive_year(db, 2023)
+    # A correction re-added to the table after archiving wins over the archived row.
+    _add_day("2023-03-02", minutes_out=720, hours=4.0)
+
+    assert result["archived"] == 3
+    assert _count("SELECT count(*) FROM attendance WHERE date < '2024-01-01'") == 1
+    assert _count("SELECT count(*) FROM sync_tombstones") == tombstones
+    assert _count("SELECT count(*) FROM outbox WHERE op = 'delete'") == 0
+    assert _count("SELECT count(*) FROM outbox") == outbox + 1
+    records = attendance_records(db, EMAIL, date(2023, 1, 1), date(2024, 12, 31))
+    assert [(r.date.isoformat(), r.minutes_out, r.total_hours) for r in records] == [
+        ("2024-01-02", 1020, 9.0),
+        ("2023-12-29", 960, 8.0),
+        ("2023-03-02", 720, 4.0),
+        ("2023-03-01", 960, 8.0),
+    ]
+    assert attendance_totals(db, EMAIL) == (29.0, 4)
+
+
+def test_failed_archive_keeps_the_delete_triggers(db):
+    _add_day("2023-03-01")
+    _execute("CREATE TRIGGER refuse_delete BEFORE DELETE ON attendance BEGIN SELECT RAISE(ABORT, 'refused'); END")
+
+    with pytest.raises(Exception, match="refused"):
+        archive_year(db, 2023)
+
+    _execute("DROP TRIGGER refuse_delete")
+    assert _triggers() == {"attendance_sync_delete", "attendance_outbox_delete"}
+    assert _count("SELECT count(*) FROM archive_guard") == 0
+    tombstones = _count("SELECT count(*) FROM sync_tombstones")
+    _execute("DELETE FROM attendance")
+    assert _count("SELECT count(*) FROM sync_tombstones") == tombstones + 1
+    assert _count("SELECT count(*) FROM outbox WHERE op = 'delete'") == 1
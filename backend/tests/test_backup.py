@@ -0,0 +1,40 @@
+import os
+import sqlite3
+import time
+from types import SimpleNamespace
+import pytest
+import backup
+import settings
+from backup import BackupError, Backups
+
+
+@pytest.fixture
+def backups(client, database_path, workdir):
+    return Backups(database_path, str(workdir / "backups"))
+
+
+def test_snapshots_in_the_same_second_are_all_kept(backups):
+    names = [backups.snapshot()["name"] for _ in range(3)]
+
+    assert len(set(names)) == 3
+    assert [manifest["name"] for manifest in backups.list()] == names[::-1]
+    assert all(backups.verify(name)["ok"] for name in names)
+
+
+def test_copy_gives_up_after_too_many_restarts(backups, database_path, monkeypatch):
+    monkeypatch.setattr(settings, "BACKUP_PAGES_PER_STEP", 1)
+    monkeypatch.setattr(settings, "BACKUP_MAX_RESTARTS", 2)
+    writer = sqlite3.connect(database_path, check_same_thread=False)
+
+    def write_between_steps(seconds):
+        # Another connection commits, which restarts the online backup.
+        writer.execute("INSERT INTO employees (name, email) VALUES ('Writer', NULL)")
+        writer.commit()
+
+    monkeypatch.setattr(backup, "time", SimpleNamespace(sleep=write_between_steps, perf_counter=time.perf_counter))
+    try:
+        with pytest.raises(BackupError, match="restarted 3 times"):
+            backups.snapshot()
+    finally:
+        writer.close()
+    assert not os.path.isdir(backups.directory) or os.listdir(backups.directory) == []
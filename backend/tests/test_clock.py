@@ -0,0 +1,127 @@
+import threading
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from database import engine
+from live_feed import broker
+import main
+
+CLOCK = "/api/v1/attendance/log"
+
+
+def _attendance_rows(email):
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT minutes_in, minutes_out, total_hours FROM attendance WHERE employee_email = :email"),
+            {"email": email},
+        ).all()
+
+
+def _concurrently(count, request):
+    """Send `count` requests at once, each from its own thread and client; returns the responses."""
+    barrier = threading.Barrier(count)
+    responses = [None] * count
+
+    def run(i):
+        own_client = TestClient(main.app)
+        barrier.wait()
+        responses[i] = request(own_client, i)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+def test_concurrent_clock_ins_create_one_row(client, employee):
+    responses = _concurrently(16, lambda c, i: c.post(CLOCK, json={
+        "employee_email": employee, "time_in": f"08:{i:02d}", "idempotency_key": f"tap-{i}",
+    }))
+
+    codes = sorted(r.status_code for r in responses)
+    assert codes == [200] + [400] * 15
+    winner = next(r.json() for r in responses if r.status_code == 200)
+    assert all(r.json()["detail"] == "Already clocked in today." for r in responses if r.status_code == 400)
+    rows = _attendance_rows(employee)
+    assert len(rows) == 1
+    assert f"{rows[0].minutes_in // 60:02d}:{rows[0].minutes_in % 60:02d}" == winner["time_in"]
+
+
+def test_concurrent_retries_with_one_key_all_succeed(client, employee):
+    responses = _concurrently(8, lambda c, i: c.post(CLOCK, json={
+        "employee_email": employee, "time_in": "08:00", "idempotency_key": "same-tap",
+    }))
+
+    assert [r.status_code for r in responses] == [200] * 8
+    assert {r.json()["time_in"] for r in responses} == {"08:00"}
+    assert len(_attendance_rows(employee)) == 1
+
+
+def test_clock_in_retry_returns_stored_state(client, employee):
+    first = client.post(CLOCK, json={"employee_email": employee, "time_in": "08:00", "idempotency_key": "k1"})
+    retry = client.post(CLOCK, json={"employee_email": employee, "time_in": "08:30", "idempotency_key": "k1"})
+    other = client.post(CLOCK, json={"employee_email": employee, "time_in": "08:30", "idempotency_key": "k2"})
+
+    assert first.status_code == 200 and retry.status_code == 200
+    assert retry.json()["time_in"] == "08:00"
+    assert other.status_code == 400
+
+
+def test_clock_out_retry_returns_stored_state(client, employee):
+    client.post(CLOCK, json={"employee_email": employee, "time_in": "08:00"})
+    first = client.post(CLOCK, json={"employee_email": employee, "time_out": "17:00", "idempotency_key": "out"})
+    retry = client.post(CLOCK, json={"employee_email": employee, "time_out": "18:00", "idempotency_key": "out"})
+    other = client.post(CLOCK, json={"employee_email": employee, "time_out": "18:00", "idempotency_key": "other"})
+
+    assert first.status_code == 200 and retry.status_code == 200
+    assert retry.json()["time_out"] == "17:00"
+    assert retry.json()["total_hours"] == 9.0
+    assert other.status_code == 400
+    assert other.json()["detail"] == "Already clocked out today."
+    assert _attendance_rows(employee) == [(480, 1020, 9.0)]
+
+
+def test_concurrent_clock_outs_close_once(client, employee):
+    client.post(CLOCK, json={"employee_email": employee, "time_in": "08:00"})
+    responses = _concurrently(8, lambda c, i: c.post(CLOCK, json={
+        "employee_email": employee, "time_out": f"17:{i:02d}", "idempotency_key": f"out-{i}",
+    }))
+
+    assert sorted(r.status_code for r in responses) == [200] + [400] * 7
+    assert len(_attendance_rows(employee)) == 1
+
+
+def test_clock_out_before_clock_in_is_refused(client, employee):
+    response = client.post(CLOCK, json={"employee_email": employee, "time_out": "17:00"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Must clock in before clocking out."
+
+
+def test_retries_publish_each_clock_event_once(client, employee, monkeypatch):
+    published = []
+    monkeypatch.setattr(broker, "publish", published.append)
+
+    for _ in range(2):
+        client.post(CLOCK, json={"employee_email": employee, "time_in": "08:00", "idempotency_key": "in"})
+    for _ in range(2):
+        client.post(CLOCK, json={"employee_email": employee, "time_out": "17:00", "idempotency_key": "out"})
+
+    assert [event["type"] for event in published] == ["clock_in", "clock_out"]
+    assert published[1]["total_hours"] == 9.0
+
+
+def test_employee_added_by_another_worker_clocks_in_under_their_department(client, employee, monkeypatch):
+    published = []
+    monkeypatch.setattr(broker, "publish", published.append)
+    client.get("/api/v1/admin/dashboard/departments")
+    # Written straight to the database, as another worker process would.
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO employees (name, email, department) VALUES ('Baraka', 'baraka@example.com', 'Finance')"))
+
+    response = client.post(CLOCK, json={"employee_email": "baraka@example.com", "time_in": "08:00"})
+
+    assert response.status_code == 200
+    assert published[0]["department"] == "Finance"
+    finance = next(d for d in client.get("/api/v1/admin/dashboard/departments").json()["departments"] if d["department"] == "Finance")
+    assert finance["clocked_in"] == 1
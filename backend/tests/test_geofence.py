@@ -0,0 +1,82 @@
+import json
+import math
+import random
+import pytest
+from database import SessionLocal
+from geofence import SiteIndex
+from models import WorkSite
+
+EARTH_RADIUS_M = 6_371_008.8
+# The index uses ellipsoid metres per degree near the equator; a sphere is
+# up to ~0.6% off from them, so points this close to a decision are skipped.
+TOLERANCE = 0.006
+NAIROBI = (-1.2921, 36.8219)
+DEPARTMENTS = ("ICT", "Finance", "HR")
+
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+@pytest.fixture
+def db(client):
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def _add_sites(db, rng):
+    sites = []
+    for i in range(300):
+        sites.append(WorkSite(
+            name=f"Site {i}",
+            department=rng.choice(DEPARTMENTS + (None,)),
+            latitude=NAIROBI[0] + rng.uniform(-0.2, 0.2),
+            longitude=NAIROBI[1] + rng.uniform(-0.2, 0.2),
+            radius_m=rng.uniform(50, 2000),
+        ))
+    # Wider than MAX_CELLS_PER_SITE cells: checked for every point.
+    sites.append(WorkSite(name="Field work", department="HR", latitude=NAIROBI[0], longitude=NAIROBI[1], radius_m=40_000))
+    square = [[-1.30, 36.80], [-1.30, 36.84], [-1.27, 36.84], [-1.27, 36.80]]
+    sites.append(WorkSite(name="Campus", department="ICT", latitude=-1.285, longitude=36.82, polygon=json.dumps(square)))
+    sites.append(WorkSite(name="Closed", department=None, latitude=NAIROBI[0], longitude=NAIROBI[1], radius_m=500, is_active=False))
+    db.add_all(sites)
+    db.commit()
+    return db.query(WorkSite).filter(WorkSite.is_active == True).all()
+
+
+def test_grid_match_agrees_with_brute_force_haversine(db):
+    rng = random.Random(20251019)
+    rows = _add_sites(db, rng)
+    index = SiteIndex("default", 0.01)
+    checked = 0
+    for _ in range(3000):
+        lat = NAIROBI[0] + rng.uniform(-0.25, 0.25)
+        lon = NAIROBI[1] + rng.uniform(-0.25, 0.25)
+        department = rng.choice(DEPARTMENTS)
+
+        candidates = []
+        for row in rows:
+            if row.department not in (None, department):
+                continue
+            distance = _haversine_m(lat, lon, row.latitude, row.longitude)
+            if row.polygon:
+                inside = -1.30 <= lat <= -1.27 and 36.80 <= lon <= 36.84
+            else:
+                if abs(distance - row.radius_m) < TOLERANCE * row.radius_m + 1.0:
+                    break
+                inside = distance <= row.radius_m
+            if inside:
+                candidates.append(((row.department is None, distance), row.id))
+        else:
+            candidates.sort()
+            if len(candidates) > 1 and candidates[1][0][0] == candidates[0][0][0] \
+                    and candidates[1][0][1] - candidates[0][0][1] < TOLERANCE * candidates[1][0][1] + 1.0:
+                continue
+            site = index.match(db, department, lat, lon)
+            assert (site.id if site else None) == (candidates[0][1] if candidates else None), (lat, lon, department)
+            checked += 1
+    assert checked > 2500
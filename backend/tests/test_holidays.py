@@ -0,0 +1,49 @@
+from datetime import date
+from sqlalchemy import text
+from database import SessionLocal, engine
+from holidays import easter_sunday, holiday_calendar, rule_holidays
+
+KNOWN_EASTERS = [
+    date(1818, 3, 22), date(1943, 4, 25), date(2000, 4, 23), date(2008, 3, 23), date(2011, 4, 24),
+    date(2019, 4, 21), date(2023, 4, 9), date(2024, 3, 31), date(2025, 4, 20), date(2038, 4, 25),
+]
+
+
+def test_easter_sunday_known_dates():
+    assert [easter_sunday(day.year) for day in KNOWN_EASTERS] == KNOWN_EASTERS
+
+
+def test_easter_sunday_is_a_sunday_between_march_22_and_april_25():
+    for year in range(1583, 4100):
+        easter = easter_sunday(year)
+        assert easter.weekday() == 6, year
+        assert date(year, 3, 22) <= easter <= date(year, 4, 25), year
+
+
+def test_holiday_on_a_sunday_is_observed_on_monday():
+    days = dict(rule_holidays(2023))
+
+    # New Year's Day 2023 was a Sunday.
+    assert days[date(2023, 1, 2)] == "New Year's Day (observed)"
+    assert days[date(2023, 4, 7)] == "Good Friday"
+    assert days[date(2023, 4, 10)] == "Easter Monday"
+
+
+def test_observed_day_skips_other_holidays():
+    days = dict(rule_holidays(2022))
+
+    # Christmas 2022 was a Sunday and the Monday is Boxing Day.
+    assert days[date(2022, 12, 26)] == "Boxing Day"
+    assert days[date(2022, 12, 27)] == "Christmas Day (observed)"
+
+
+def test_calendar_includes_gazetted_days(client):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO public_holidays (name, date) VALUES ('Eid al-Fitr', '2025-03-31')"))
+    db = SessionLocal()
+    try:
+        assert holiday_calendar.name(db, date(2025, 3, 31)) == "Eid al-Fitr"
+        assert holiday_calendar.is_holiday(db, date(2025, 6, 2))     # Madaraka Day, observed
+        assert not holiday_calendar.is_holiday(db, date(2025, 6, 3))
+    finally:
+        db.close()
@@ -0,0 +1,35 @@
+import sqlite3
+import settings
+
+HOLIDAYS = "/api/v1/holidays"
+
+
+def test_etag_changes_when_another_process_writes(client, database_path, monkeypatch):
+    # Other workers' writes show once this worker's copy of the versions expires.
+    monkeypatch.setattr(settings, "CHANGE_VERSION_CACHE_SECONDS", 0)
+    etag = client.get(HOLIDAYS).headers["etag"]
+    assert client.get(HOLIDAYS, headers={"If-None-Match": etag}).status_code == 304
+
+    # A write that never went through this process, e.g. another worker or seed_holidays.py.
+    db = sqlite3.connect(database_path)
+    db.execute("INSERT INTO public_holidays (date, name) VALUES ('2025-12-26', 'Boxing Day')")
+    db.commit()
+    db.close()
+
+    response = client.get(HOLIDAYS, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_etag_changes_at_once_after_a_write_in_this_process(client, employee, monkeypatch):
+    monkeypatch.setattr(settings, "CHANGE_VERSION_CACHE_SECONDS", 3600)
+    path = f"/api/v1/employee/{employee}"
+    etag = client.get(path).headers["etag"]
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/api/v1/signup", json={
+        "name": "Baraka Mwangi", "email": "baraka@example.com", "phone": "0722000000", "gender": "Male",
+        "department": "Finance", "salary": 60000, "bank_name": "KCB", "account_number": "42", "password": "secret",
+    })
+
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 200
@@ -0,0 +1,105 @@
+import sqlite3
+import pytest
+from sqlalchemy import text
+from database import engine
+import migrations
+
+# attendance as it was before times were stored as minutes (and before the
+# unique (employee_email, date) index).
+BASELINE_ATTENDANCE = """
+    CREATE TABLE attendance (
+        id INTEGER PRIMARY KEY,
+        employee_email VARCHAR,
+        date DATE,
+        time_in VARCHAR,
+        time_out VARCHAR,
+        total_hours FLOAT,
+        status VARCHAR
+    )
+"""
+
+
+def _baseline_db(path, rows):
+    db = sqlite3.connect(path)
+    db.execute(BASELINE_ATTENDANCE)
+    db.executemany(
+        "INSERT INTO attendance (id, employee_email, date, time_in, time_out, total_hours, status) "
+        "VALUES (?, ?, ?, ?, ?, ?, 'present')",
+        rows,
+    )
+    db.commit()
+    db.close()
+
+
+def _attendance():
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT id, employee_email, date, minutes_in, minutes_out, total_hours FROM attendance ORDER BY id"
+        )).all()
+
+
+def _indexes():
+    with engine.connect() as conn:
+        return {name for (name,) in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+
+
+def test_upgrade_merges_duplicate_attendance_before_unique_index(database_path):
+    _baseline_db(database_path, [
+        (1, "a@example.com", "2025-03-03", "08:10", None, None),
+        (2, "a@example.com", "2025-03-03", "08:00", None, None),
+        (3, "a@example.com", "2025-03-03", None, "17:30", None),
+        (4, "a@example.com", "2025-03-04", "08:00", "17:00", 9.0),
+        (5, "b@example.com", "2025-03-03", "09:00", "16:00", 7.0),
+        (6, "b@example.com", "2025-03-03", "09:05", "15:00", 5.92),
+    ])
+
+    migrations.upgrade()
+
+    assert _attendance() == [
+        (1, "a@example.com", "2025-03-03", 480, 1050, 9.5),
+        (4, "a@example.com", "2025-03-04", 480, 1020, 9.0),
+        (5, "b@example.com", "2025-03-03", 540, 960, 7.0),
+    ]
+    assert "uq_attendance_employee_date" in _indexes()
+
+
+def test_upgrade_is_idempotent(database_path):
+    _baseline_db(database_path, [(1, "a@example.com", "2025-03-03", "08:00", "17:00", 9.0)])
+    migrations.upgrade()
+    migrations.upgrade()
+    assert _attendance() == [(1, "a@example.com", "2025-03-03", 480, 1020, 9.0)]
+
+
+def test_upgrade_converts_unpadded_times(database_path):
+    _baseline_db(database_path, [
+        (1, "a@example.com", "2025-03-03", "8:30", "17:05", None),
+        (2, "b@example.com", "2025-03-03", " 07:45 ", "9:15:00", None),
+        (3, "c@example.com", "2025-03-03", "", None, None),
+    ])
+
+    migrations.upgrade()
+
+    assert _attendance() == [
+        (1, "a@example.com", "2025-03-03", 510, 1025, 8.58),
+        (2, "b@example.com", "2025-03-03", 465, 555, 1.5),
+        (3, "c@example.com", "2025-03-03", None, None, None),
+    ]
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT id, time_in, time_out FROM attendance_time_strings ORDER BY id")).all() == [
+            (1, "8:30", "17:05"), (2, " 07:45 ", "9:15:00"), (3, "", None),
+        ]
+
+
+def test_upgrade_keeps_time_strings_when_conversion_fails(database_path):
+    _baseline_db(database_path, [
+        (1, "a@example.com", "2025-03-03", "08:00", "17:00", 9.0),
+        (2, "b@example.com", "2025-03-03", "8h30", None, None),
+    ])
+
+    with pytest.raises(RuntimeError, match=r"ids \[2\]"):
+        migrations.upgrade()
+
+    db = sqlite3.connect(database_path)
+    columns = {row[1] for row in db.execute("PRAGMA table_info(attendance)")}
+    db.close()
+    assert {"time_in", "time_out"} <= columns
@@ -0,0 +1,68 @@
+import json
+import os
+import pytest
+from sqlalchemy import text
+import settings
+from database import engine
+from outbox import outboxes
+
+CONSUMERS = "/api/v1/admin/outbox/consumers"
+
+
+@pytest.fixture
+def segments(client, monkeypatch):
+    """Three one-batch segments of employee inserts; returns (file name, last seq) of each."""
+    monkeypatch.setattr(settings, "OUTBOX_SEGMENT_BYTES", 1)
+    monkeypatch.setattr(settings, "OUTBOX_KEEP_SEGMENTS", 0)
+    outboxes._instances.clear()
+    outboxes.relay()
+    written = []
+    for batch in range(3):
+        with engine.begin() as conn:
+            for i in range(2):
+                conn.execute(text("INSERT INTO employees (name, email) VALUES ('E', :email)"), {"email": f"e{batch}{i}@example.com"})
+        outboxes.relay()
+        name = outboxes.segments()[-1]
+        with open(os.path.join(outboxes.directory, name)) as f:
+            written.append((name, json.loads(f.readlines()[-1])["seq"]))
+    yield written
+    outboxes._instances.clear()
+
+
+def test_nothing_is_deleted_without_consumers(segments):
+    assert outboxes.rotate() == []
+    assert outboxes.status()["backlog"]["segments"] == len(outboxes.segments())
+
+
+def test_segments_are_deleted_only_after_every_consumer_confirms(client, segments):
+    (first, first_end), (second, second_end), (newest, newest_end) = segments
+    client.post(f"{CONSUMERS}/search", json={"seq": 0})
+    client.post(f"{CONSUMERS}/payroll", json={"seq": 0})
+
+    # One consumer at the end is not enough.
+    assert client.post(f"{CONSUMERS}/search", json={"seq": newest_end}).json()["removed"] == []
+    assert first in outboxes.segments()
+
+    # Part way into the second segment: only the first one is fully read.
+    response = client.post(f"{CONSUMERS}/payroll", json={"seq": first_end + 1}).json()
+    assert response["removed"] == [first]
+    assert response["low_water_mark"] == first_end + 1
+
+    # Confirmations never move back.
+    client.post(f"{CONSUMERS}/payroll", json={"seq": 0})
+    assert outboxes.low_water_mark() == first_end + 1
+
+    # Everything read: all but the newest, which may still be appended to.
+    assert client.post(f"{CONSUMERS}/payroll", json={"seq": newest_end}).json()["removed"] == [second]
+    assert outboxes.segments()[-1] == newest
+
+
+def test_removing_a_lagging_consumer_releases_its_segments(client, segments):
+    (first, _), (second, _), (newest, newest_end) = segments
+    client.post(f"{CONSUMERS}/search", json={"seq": newest_end})
+    client.post(f"{CONSUMERS}/gone", json={"seq": 0})
+    assert outboxes.rotate() == []
+
+    assert client.delete(f"{CONSUMERS}/gone").status_code == 200
+    assert client.delete(f"{CONSUMERS}/gone").status_code == 404
+    assert first not in outboxes.segments() and second not in outboxes.segments()
@@ -0,0 +1,94 @@
+import random
+from datetime import date, timedelta
+from recurrence import WEEKDAYS, expand, last_occurrence, parse_rule
+
+
+def _matches(rule, start, day):
+    """Whether `day` fits the rule's pattern, by definition and ignoring COUNT/UNTIL."""
+    if day < start:
+        return False
+    if rule.freq == "DAILY":
+        return (day - start).days % rule.interval == 0
+    if rule.freq == "WEEKLY":
+        weeks = ((day - timedelta(days=day.weekday())) - (start - timedelta(days=start.weekday()))).days // 7
+        return weeks % rule.interval == 0 and day.weekday() in (rule.weekdays or (start.weekday(),))
+    months = (day.year - start.year) * 12 + day.month - start.month
+    if months % rule.interval:
+        return False
+    if rule.ordinal is None:
+        return day.day == start.day
+    same_weekday = [d for d in range(1, 32) if _valid(day.year, day.month, d)
+                    and date(day.year, day.month, d).weekday() == rule.weekdays[0]]
+    return day.weekday() == rule.weekdays[0] and day.day == same_weekday[rule.ordinal - 1 if rule.ordinal > 0 else -1]
+
+
+def _valid(year, month, day):
+    try:
+        date(year, month, day)
+        return True
+    except ValueError:
+        return False
+
+
+def _oracle(rule_text, start, exceptions, window_start, window_end):
+    rule = parse_rule(rule_text)
+    series = []
+    day = start
+    while day <= window_end:
+        if _matches(rule, start, day):
+            series.append(day)
+        day += timedelta(days=1)
+    if rule.count is not None:
+        series = series[:rule.count]
+    if rule.until is not None:
+        series = [d for d in series if d <= rule.until]
+    skipped = set(exceptions.split(",")) if exceptions else set()
+    return tuple(d for d in series if window_start <= d <= window_end and d.isoformat() not in skipped)
+
+
+def test_monthly_on_the_31st_skips_short_months():
+    assert expand("FREQ=MONTHLY;COUNT=4", date(2025, 1, 31), None, date(2025, 1, 1), date(2025, 12, 31)) == (
+        date(2025, 1, 31), date(2025, 3, 31), date(2025, 5, 31), date(2025, 7, 31),
+    )
+    assert last_occurrence("FREQ=MONTHLY;COUNT=4", date(2025, 1, 31)) == date(2025, 7, 31)
+
+
+def test_exceptions_still_count_towards_count():
+    assert expand("FREQ=WEEKLY;COUNT=3", date(2025, 1, 6), "2025-01-13", date(2025, 1, 1), date(2025, 2, 28)) == (
+        date(2025, 1, 6), date(2025, 1, 20),
+    )
+
+
+def test_expand_matches_brute_force():
+    rng = random.Random(20251019)
+    for _ in range(400):
+        start = date(2024, 1, 1) + timedelta(days=rng.randrange(730))
+        freq = rng.choice(("DAILY", "WEEKLY", "MONTHLY"))
+        parts = [f"FREQ={freq}", f"INTERVAL={rng.choice((1, 1, 2, 3))}"]
+        if freq == "WEEKLY" and rng.random() < 0.5:
+            days = {start.weekday()} | set(rng.sample(range(7), rng.randrange(3)))
+            parts.append("BYDAY=" + ",".join(WEEKDAYS[d] for d in sorted(days)))
+        if freq == "MONTHLY":
+            if rng.random() < 0.3:
+                start = date(start.year, rng.choice((1, 3, 5, 7, 8, 10, 12)), rng.choice((29, 30, 31)))
+            elif rng.random() < 0.4:
+                ordinal = rng.choice((1, 2, 3, 4, -1))
+                first = date(start.year, start.month, 1)
+                nth = [first + timedelta(days=d) for d in range(31)
+                       if (first + timedelta(days=d)).month == first.month
+                       and (first + timedelta(days=d)).weekday() == start.weekday()]
+                start = nth[ordinal - 1 if ordinal > 0 else -1]
+                parts.append(f"BYDAY={ordinal}{WEEKDAYS[start.weekday()]}")
+        end = rng.random()
+        if end < 0.3:
+            parts.append(f"COUNT={rng.randrange(1, 40)}")
+        elif end < 0.6:
+            parts.append(f"UNTIL={start + timedelta(days=rng.randrange(400)):%Y%m%d}")
+        rule_text = ";".join(parts)
+        window_start = start + timedelta(days=rng.randrange(-30, 500))
+        window_end = window_start + timedelta(days=rng.randrange(0, 400))
+        candidates = _oracle(rule_text, start, None, start, window_end)
+        exceptions = ",".join(d.isoformat() for d in rng.sample(candidates, min(len(candidates), rng.randrange(4)))) or None
+
+        assert expand(rule_text, start, exceptions, window_start, window_end) == \
+            _oracle(rule_text, start, exceptions, window_start, window_end), (rule_text, start, window_start, window_end)
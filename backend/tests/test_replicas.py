@@ -0,0 +1,21 @@
+from starlette.datastructures import Headers
+import settings
+from replicas import WROTE_COOKIE, WROTE_HEADER, last_write
+
+
+def test_write_responses_carry_the_write_time(client, monkeypatch):
+    monkeypatch.setattr(settings, "READ_REPLICAS", True)
+    response = client.post("/api/v1/attendance/log", json={"employee_email": "amina@example.com", "time_in": "08:00"})
+
+    assert response.status_code == 200
+    wrote_at = float(response.headers[WROTE_HEADER])
+    assert f"{WROTE_COOKIE}={response.headers[WROTE_HEADER]}" in response.headers["set-cookie"]
+    assert WROTE_HEADER not in client.get("/api/v1/holidays").headers
+    assert last_write(Headers({WROTE_HEADER: str(wrote_at)})) == wrote_at
+
+
+def test_last_write_takes_the_later_of_header_and_cookie():
+    assert last_write(Headers({})) == 0.0
+    assert last_write(Headers({WROTE_HEADER: "not-a-time"})) == 0.0
+    assert last_write(Headers({WROTE_HEADER: "100.5", "cookie": f"{WROTE_COOKIE}=90"})) == 100.5
+    assert last_write(Headers({WROTE_HEADER: "80", "cookie": f"theme=dark; {WROTE_COOKIE}=90"})) == 90.0
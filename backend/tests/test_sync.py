@@ -0,0 +1,98 @@
+from sqlalchemy import text
+from database import engine
+
+SYNC = "/api/v1/sync"
+
+
+def _execute(sql, **params):
+    with engine.begin() as conn:
+        return conn.execute(text(sql), params)
+
+
+def _add_attendance(email, days):
+    for day in days:
+        _execute(
+            "INSERT INTO attendance (employee_email, date, minutes_in, status) VALUES (:email, :date, 480, 'present')",
+            email=email, date=f"2025-03-{day:02d}",
+        )
+
+
+def _add_shared_event(title, department):
+    return _execute(
+        "INSERT INTO shared_events (title, event_date, event_type, created_by, is_active, target_department) "
+        "VALUES (:title, '2025-04-01', 'general', 'admin@example.com', 1, :department)",
+        title=title, department=department,
+    ).lastrowid
+
+
+def _sync_all(client, since=0, **params):
+    """Follow has_more to the end; returns the pages and the final cursor."""
+    pages = []
+    while True:
+        page = client.get(SYNC, params={"since": since, **params}).json()
+        assert page["cursor"] >= since
+        pages.append(page)
+        since = page["cursor"]
+        if not page["has_more"]:
+            return pages, since
+
+
+def test_pages_deliver_every_change_once(client):
+    _add_attendance("amina@example.com", range(1, 8))
+    for day in range(1, 6):
+        _execute("INSERT INTO public_holidays (name, date) VALUES (:name, :date)", name=f"Day {day}", date=f"2025-05-{day:02d}")
+
+    pages, cursor = _sync_all(client, limit=2)
+
+    attendance = [row["id"] for page in pages for row in page["attendance"]]
+    holidays = [row["id"] for page in pages for row in page["holidays"]]
+    assert len(pages) > 3
+    assert sorted(attendance) == list(range(1, 8))
+    assert sorted(holidays) == list(range(1, 6))
+    assert _sync_all(client, cursor)[0][0]["attendance"] == []
+
+
+def test_deletes_arrive_as_tombstones(client):
+    _add_attendance("amina@example.com", [1, 2])
+    event = _add_shared_event("Town hall", None)
+    _, cursor = _sync_all(client)
+
+    _execute("DELETE FROM attendance WHERE id = 1")
+    _execute("UPDATE shared_events SET is_active = 0 WHERE id = :id", id=event)
+    page = client.get(SYNC, params={"since": cursor}).json()
+
+    assert page["deleted"]["attendance"] == [1]
+    assert page["deleted"]["shared_events"] == [event]
+    assert page["shared_events"] == []
+
+
+def test_attendance_moved_to_another_employee_leaves_the_old_filter(client):
+    _add_attendance("amina@example.com", [1])
+    _, amina_cursor = _sync_all(client, email="amina@example.com")
+    _, baraka_cursor = _sync_all(client, email="baraka@example.com")
+
+    _execute("UPDATE attendance SET employee_email = 'baraka@example.com' WHERE id = 1")
+
+    amina = client.get(SYNC, params={"since": amina_cursor, "email": "amina@example.com"}).json()
+    baraka = client.get(SYNC, params={"since": baraka_cursor, "email": "baraka@example.com"}).json()
+    assert amina["deleted"]["attendance"] == [1] and amina["attendance"] == []
+    assert baraka["deleted"]["attendance"] == [] and [row["id"] for row in baraka["attendance"]] == [1]
+
+
+def test_shared_event_moved_between_departments(client):
+    global_event = _add_shared_event("Town hall", None)
+    ict_event = _add_shared_event("Server upgrade", "ICT")
+    cursors = {department: _sync_all(client, department=department)[1] for department in ("ICT", "Finance")}
+
+    _execute("UPDATE shared_events SET target_department = 'Finance' WHERE id = :id", id=ict_event)
+    _execute("UPDATE shared_events SET target_department = 'ICT' WHERE id = :id", id=global_event)
+    ict, finance = (
+        client.get(SYNC, params={"since": cursors[department], "department": department}).json()
+        for department in ("ICT", "Finance")
+    )
+
+    # A client applies deletes, then upserts.
+    assert sorted(ict["deleted"]["shared_events"]) == [global_event, ict_event]
+    assert [row["id"] for row in ict["shared_events"]] == [global_event]
+    assert finance["deleted"]["shared_events"] == [global_event]
+    assert [row["id"] for row in finance["shared_events"]] == [ict_event]
@@ -0,0 +1,46 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.responses import JSONResponse
+import settings
+from traffic import RateLimitMiddleware
+
+
+async def _ok(scope, receive, send):
+    await JSONResponse({})(scope, receive, send)
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT", True)
+    return RateLimitMiddleware(_ok)
+
+
+def test_rotating_login_emails_from_one_ip_are_throttled(limiter):
+    client = TestClient(limiter, client=("10.0.0.1", 50000))
+    codes = [
+        client.post("/api/v1/login", json={"email": f"guess{i}@example.com", "password": "x"}).status_code
+        for i in range(60)
+    ]
+
+    assert codes[0] == 200
+    assert 429 in codes
+
+
+def test_one_account_is_throttled_across_ips(limiter):
+    codes = [
+        TestClient(limiter, client=(f"10.0.1.{i}", 50000))
+        .post("/api/v1/login", json={"email": "amina@example.com", "password": "x"}).status_code
+        for i in range(10)
+    ]
+
+    # RATE_EMPLOYEE_CAPACITY covers three logins at cost 10.
+    assert codes[:3] == [200] * 3
+    assert codes[3:] == [429] * 7
+
+
+def test_query_parameters_do_not_pick_the_employee_bucket(limiter):
+    client = TestClient(limiter, client=("10.0.2.1", 50000))
+    client.get("/api/v1/profile/me", params={"email": "amina@example.com"})
+
+    assert len(limiter.employee_buckets) == 0
+    assert len(limiter.ip_buckets) == 1
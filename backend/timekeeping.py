@@ -0,0 +1,41 @@
+from typing import Optional
+from sqlalchemy import case, func
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def to_minutes(hhmm: Optional[str]) -> Optional[int]:
+    """Convert "HH:MM" to minutes since midnight."""
+    if hhmm is None:
+        return None
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def to_hhmm(minutes: Optional[int]) -> Optional[str]:
+    """Render minutes since midnight as "HH:MM"."""
+    if minutes is None:
+        return None
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def worked_minutes(minutes_in: int, minutes_out: int) -> int:
+    """Minutes between clock-in and clock-out; a shift that ends before it starts ran past midnight."""
+    if minutes_out < minutes_in:
+        minutes_out += MINUTES_PER_DAY
+    return minutes_out - minutes_in
+
+
+def worked_hours(minutes_in: Optional[int], minutes_out: Optional[int]) -> Optional[float]:
+    if minutes_in is None or minutes_out is None:
+        return None
+    return round(worked_minutes(minutes_in, minutes_out) / 60, 2)
+
+
+def worked_hours_sql(minutes_in, minutes_out):
+    """SQL version of worked_hours() for use inside UPDATE/SELECT statements."""
+    minutes = case(
+        (minutes_out < minutes_in, minutes_out + MINUTES_PER_DAY - minutes_in),
+        else_=minutes_out - minutes_in,
+    )
+    return func.round(minutes / 60.0, 2)
@@ -0,0 +1,272 @@
+import asyncio
+import json
+import math
+import re
+import time
+from collections import Counter
+from typing import Optional
+from database import SHARED_SESSION_KEY
+import settings
+
+API_PREFIX = "/api/v1"
+DEFAULT_COST = 1
+MAX_PEEK_BYTES = 16 * 1024
+# Long-lived responses that must not hold a concurrency slot.
+UNLIMITED_PATHS = {"/api/v1/admin/attendance/stream"}
+
+
+class RouteCost:
+    __slots__ = ("method", "pattern", "cost", "body_field", "label")
+
+    def __init__(self, method: str, path: str, cost: float, body_field: Optional[str] = None):
+        self.method = method
+        self.pattern = re.compile(f"^{API_PREFIX}{path}$")
+        self.cost = cost
+        self.body_field = body_field  # JSON body field naming the employee the request acts on
+        self.label = f"{method} {path}"
+
+
+ROUTE_COSTS = [
+    RouteCost("POST", "/login", 10, body_field="email"),
+    RouteCost("POST", "/signup", 10),
+    RouteCost("POST", "/attendance/log", 2, body_field="employee_email"),
+    RouteCost("GET", "/admin/attendance/(report|departments|overview)", 20),
+    RouteCost("GET", "/admin/employees", 10),
+    RouteCost("POST", "/batch", 5),
+]
+
+
+def route_cost(method: str, path: str) -> Optional[RouteCost]:
+    for rule in ROUTE_COSTS:
+        if rule.method == method and rule.pattern.match(path):
+            return rule
+    return None
+
+
+class TokenBuckets:
+    """
+    One token bucket per key. A bucket holds up to `capacity` tokens and
+    refills at `refill_per_second`; a request costing more tokens than the
+    bucket holds is refused. Only used from the event loop, so no locking.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float, max_keys: int = 100_000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _tokens(self, key: str, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.capacity
+        tokens, last = bucket
+        return min(self.capacity, tokens + (now - last) * self.refill_per_second)
+
+    def wait_time(self, key: str, cost: float, now: float) -> float:
+        """Seconds until `key` can afford `cost` (0 if it can now)."""
+        cost = min(cost, self.capacity)
+        missing = cost - self._tokens(key, now)
+        return missing / self.refill_per_second if missing > 0 else 0.0
+
+    def charge(self, key: str, cost: float, now: float):
+        self._buckets[key] = (self._tokens(key, now) - min(cost, self.capacity), now)
+        if len(self._buckets) > self.max_keys:
+            self._prune(now)
+
+    def _prune(self, now: float):
+        # A full bucket is the same as no bucket.
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if self._tokens(key, now) < self.capacity
+        }
+        if len(self._buckets) > self.max_keys:
+            self._buckets.clear()
+
+
+class TrafficMetrics:
+    def __init__(self):
+        self.rate_limited = Counter()   # by route label
+        self.shed = Counter()           # by reason
+        self.admitted = 0
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_in_flight = 0
+        self.peak_queued = 0
+        self.avg_latency = 0.0          # seconds, exponentially weighted
+
+    def record_latency(self, seconds: float):
+        self.avg_latency += 0.05 * (seconds - self.avg_latency)
+
+    def snapshot(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "peak_in_flight": self.peak_in_flight,
+            "peak_queued": self.peak_queued,
+            "avg_latency_ms": round(self.avg_latency * 1000, 2),
+            "rate_limited": dict(self.rate_limited),
+            "rate_limited_total": sum(self.rate_limited.values()),
+            "shed": dict(self.shed),
+            "shed_total": sum(self.shed.values()),
+        }
+
+
+traffic_metrics = TrafficMetrics()
+
+
+async def _reject(send, status: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _peek_json_field(receive, field: str):
+    """
+    Read a small JSON body to find `field`, then hand back a receive()
+    that replays the body to the app.
+    """
+    messages = []
+    size = 0
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        size += len(message.get("body", b""))
+        if not message.get("more_body") or size > MAX_PEEK_BYTES:
+            break
+
+    value = None
+    last = messages[-1]
+    if last["type"] == "http.request" and not last.get("more_body"):
+        try:
+            value = json.loads(b"".join(m.get("body", b"") for m in messages)).get(field)
+        except (ValueError, AttributeError):
+            pass
+
+    async def replay():
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    return replay, value if isinstance(value, str) else None
+
+
+def _employee_from_path(scope) -> Optional[str]:
+    for segment in scope["path"].split("/"):
+        if "@" in segment:
+            return segment
+    return None
+
+
+class RateLimitMiddleware:
+    """
+    Token-bucket rate limiting for /api/v1.
+    Every request is charged to its client IP, so rotating the emails in
+    login attempts doesn't dodge the limit. A request that acts on one
+    employee (named in the path, or the JSON body of login and clock-in)
+    is also charged to that employee, so one account can't be hammered
+    from many IPs either. Query parameters and other body fields don't
+    count: they don't say whose account the request acts on. Behind a
+    reverse proxy run uvicorn with --proxy-headers so the client IP is the
+    real one.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.ip_buckets = TokenBuckets(settings.RATE_IP_CAPACITY, settings.RATE_IP_REFILL_PER_SECOND)
+        self.employee_buckets = TokenBuckets(settings.RATE_EMPLOYEE_CAPACITY, settings.RATE_EMPLOYEE_REFILL_PER_SECOND)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT or not scope["path"].startswith(API_PREFIX):
+            return await self.app(scope, receive, send)
+
+        rule = route_cost(scope["method"], scope["path"])
+        cost = rule.cost if rule else DEFAULT_COST
+        employee = _employee_from_path(scope)
+        if employee is None and rule and rule.body_field:
+            receive, employee = await _peek_json_field(receive, rule.body_field)
+
+        now = time.monotonic()
+        client = scope.get("client")
+        charges = [(self.ip_buckets, client[0] if client else "unknown")]
+        if employee:
+            charges.append((self.employee_buckets, employee.lower()))
+        wait = max(buckets.wait_time(key, cost, now) for buckets, key in charges)
+        if wait > 0:
+            traffic_metrics.rate_limited[rule.label if rule else "other"] += 1
+            return await _reject(send, 429, "Too many requests, slow down", wait)
+
+        for buckets, key in charges:
+            buckets.charge(key, cost, now)
+        await self.app(scope, receive, send)
+
+
+class LoadShedMiddleware:
+    """
+    Global concurrency limit for /api/v1.
+    Up to MAX_CONCURRENT_REQUESTS run at once; the next MAX_QUEUED_REQUESTS
+    wait up to QUEUE_TIMEOUT_SECONDS for a slot. Anything beyond that is
+    answered 503 straight away, with a Retry-After based on recent latency,
+    instead of piling up behind a backlog it would time out in anyway.
+    POST /batch sub-requests run inside the batch's slot.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.max_concurrent = settings.MAX_CONCURRENT_REQUESTS
+        self.max_queued = settings.MAX_QUEUED_REQUESTS
+        self.queue_timeout = settings.QUEUE_TIMEOUT_SECONDS
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+
+    def _retry_after(self) -> float:
+        return (traffic_metrics.queued + 1) * traffic_metrics.avg_latency / self.max_concurrent
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http" or not path.startswith(API_PREFIX) or path in UNLIMITED_PATHS
+            or SHARED_SESSION_KEY in scope
+        ):
+            return await self.app(scope, receive, send)
+
+        metrics = traffic_metrics
+        if self._slots.locked():
+            if metrics.queued >= self.max_queued:
+                metrics.shed["queue_full"] += 1
+                return await _reject(send, 503, "Server busy, retry shortly", self._retry_after())
+            metrics.queued += 1
+            metrics.peak_queued = max(metrics.peak_queued, metrics.queued)
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                metrics.shed["queue_timeout"] += 1
+                return await _reject(send, 503, "Server busy, retry shortly", self._retry_after())
+            finally:
+                metrics.queued -= 1
+        else:
+            await self._slots.acquire()
+
+        metrics.admitted += 1
+        metrics.in_flight += 1
+        metrics.peak_in_flight = max(metrics.peak_in_flight, metrics.in_flight)
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            metrics.in_flight -= 1
+            metrics.record_latency(time.monotonic() - started)
+            self._slots.release()
@@ -1,12 +1,37 @@
-// ignore_for_file: library_prefixes, no_leading_underscores_for_library_prefixes
 import 'dart:async';
 import 'dart:convert';
 import 'dart:io';
 import 'package:http/http.dart' as http;
 import 'package:flutter/foundation.dart' show kIsWeb;
-import 'package:http/http.dart' as _httpClient;
 import 'package:intl/intl.dart';
 
+/// Sends back the write time the server returns after every write
+/// (X-Pesa-Pay-Wrote) on later requests, so reads right after a write are
+/// served from the primary database rather than a replica that has not
+/// caught up with it yet.
+class _ReadYourWritesClient extends http.BaseClient {
+  static const String wroteHeader = 'X-Pesa-Pay-Wrote';
+
+  final http.Client _inner = http.Client();
+  String? _wroteAt;
+
+  @override
+  Future<http.StreamedResponse> send(http.BaseRequest request) async {
+    final wroteAt = _wroteAt;
+    if (wroteAt != null) {
+      request.headers[wroteHeader] = wroteAt;
+    }
+    final response = await _inner.send(request);
+    final written = response.headers[wroteHeader.toLowerCase()];
+    if (written != null &&
+        (double.tryParse(written) ?? 0) >
+            (double.tryParse(_wroteAt ?? '') ?? 0)) {
+      _wroteAt = written;
+    }
+    return response;
+  }
+}
+
 class APIService {
   static String get baseURL {
     if (kIsWeb) {
@@ -21,6 +46,7 @@ class APIService {
   factory APIService() => _instance;
 
   static const Duration _timeout = Duration(seconds: 10);
+  final http.Client _client = _ReadYourWritesClient();
   Map<String, String> get headers => {'Content-Type': 'application/json'};
 
   Future<T> _makeRequest<T>(
@@ -68,7 +94,7 @@ class APIService {
   Future<void> registerUser(Map<String, dynamic> userData) async {
     final uri = Uri.parse('$baseURL/signup');
     await _makeRequest<void>(
-      http.post(uri, headers: headers, body: jsonEncode(userData)),
+      _client.post(uri, headers: headers, body: jsonEncode(userData)),
       (_) {},
     );
   }
@@ -76,7 +102,7 @@ class APIService {
   Future<Map<String, dynamic>> login(String email, String password) async {
     final uri = Uri.parse('$baseURL/login');
     return _makeRequest<Map<String, dynamic>>(
-      http.post(
+      _client.post(
         uri,
         headers: headers,
         body: jsonEncode({'email': email, 'password': password}),
@@ -88,7 +114,7 @@ class APIService {
   Future<Map<String, dynamic>> getEmployeeByEmail(String email) async {
     final uri = Uri.parse('$baseURL/employee/$email');
     return _makeRequest<Map<String, dynamic>>(
-      http.get(uri, headers: headers),
+      _client.get(uri, headers: headers),
       (body) => body,
     );
   }
@@ -104,7 +130,7 @@ class APIService {
   }) async {
     final uri = Uri.parse('$baseURL/attendance/log');
     return _makeRequest<Map<String, dynamic>>(
-      http.post(
+      _client.post(
         uri,
         headers: headers,
         body: jsonEncode({
@@ -120,7 +146,7 @@ class APIService {
   Future<Map<String, dynamic>> getAttendance(String email) async {
     final uri = Uri.parse('$baseURL/attendance/$email');
     return _makeRequest<Map<String, dynamic>>(
-      http.get(uri, headers: headers),
+      _client.get(uri, headers: headers),
       (body) => body,
     );
   }
@@ -128,7 +154,7 @@ class APIService {
   Future<Map<String, dynamic>> getAttendanceSummary(String email) async {
     final uri = Uri.parse('$baseURL/attendance/summary/$email');
     return _makeRequest<Map<String, dynamic>>(
-      http.get(uri, headers: headers),
+      _client.get(uri, headers: headers),
       (body) => body,
       onError: (error) {
         if (error.toString().contains('404')) {
@@ -147,7 +173,7 @@ class APIService {
   Future<List<Map<String, dynamic>>> getAllEmployees() async {
     final uri = Uri.parse('$baseURL/admin/employees');
     return _makeRequest<List<Map<String, dynamic>>>(
-      http.get(uri, headers: headers),
+      _client.get(uri, headers: headers),
       (body) => (body as List).map((e) => e as Map<String, dynamic>).toList(),
     );
   }
@@ -155,7 +181,7 @@ class APIService {
   Future<List<Map<String, dynamic>>> getAttendanceReport() async {
     final uri = Uri.parse('$baseURL/admin/attendance/report');
     return _makeRequest<List<Map<String, dynamic>>>(
-      http.get(uri, headers: headers),
+      _client.get(uri, headers: headers),
       (body) => (body as List).map((e) => e as Map<String, dynamic>).toList(),
     );
   }
@@ -163,7 +189,7 @@ class APIService {
   Future<List<Map<String, dynamic>>> getCalendarEvents() async {
     final uri = Uri.parse('$baseURL/admin/calendar/events');
     return _makeRequest<List<Map<String, dynamic>>>(
-      http.get(uri, headers: headers),
+      _client.get(uri, headers: headers),
       (body) => (body as List).map((e) => e as Map<String, dynamic>).toList(),
     );
   }
@@ -176,7 +202,7 @@ class APIService {
   }) async {
     final uri = Uri.parse('$baseURL/admin/calendar/events');
     return _makeRequest<Map<String, dynamic>>(
-      http.post(
+      _client.post(
         uri,
         headers: headers,
         body: jsonEncode({
@@ -191,7 +217,7 @@ class APIService {
   }
 
   Future<List<dynamic>> getAttendanceRecords(String email) async {
-    final response = await _httpClient.get(
+    final response = await _client.get(
       Uri.parse('/attendance/records/$email'),
     );
     if (response.statusCode == 200) {
@@ -203,13 +229,13 @@ class APIService {
   Future<Map<String, dynamic>> disburseSalaries() async {
     final uri = Uri.parse('$baseURL/payments/disburse');
     return _makeRequest<Map<String, dynamic>>(
-      http.post(uri, headers: headers),
+      _client.post(uri, headers: headers),
       (body) => body,
     );
   }
 
   Future<List<dynamic>> getPublicHolidays() async {
-    final response = await http.get(Uri.parse('$baseURL/holidays'));
+    final response = await _client.get(Uri.parse('$baseURL/holidays'));
     if (response.statusCode == 200) {
       return json.decode(response.body);
     } else {
@@ -222,7 +248,7 @@ class APIService {
     String dateStr,
   ) async {
     try {
-      final response = await _httpClient.get(
+      final response = await _client.get(
         Uri.parse('$baseURL/attendance/day/$email/$dateStr'),
       );
 
@@ -241,7 +267,7 @@ class APIService {
     required String month,
     required double hourlyRate,
   }) async {
-    final response = await _httpClient.post(
+    final response = await _client.post(
       Uri.parse('$baseURL/salary/calculate'),
       headers: {'Content-Type': 'application/json'},
       body: jsonEncode({
@@ -258,7 +284,7 @@ class APIService {
   }
 
   Future<Map<String, dynamic>> getSalaryHistory(String email) async {
-    final response = await _httpClient.get(
+    final response = await _client.get(
       Uri.parse('$baseURL/salary/history/$email'),
     );
 
@@ -269,7 +295,7 @@ class APIService {
   }
 
   Future<List<dynamic>> getAdminEmployees() async {
-    final response = await _httpClient.get(
+    final response = await _client.get(
       Uri.parse('$baseURL/admin/employees'),
     );
 
@@ -280,7 +306,7 @@ class APIService {
   }
 
   Future<Map<String, dynamic>> getAdminAttendanceOverview() async {
-    final response = await _httpClient.get(
+    final response = await _client.get(
       Uri.parse('$baseURL/admin/attendance/overview'),
     );
 
@@ -298,7 +324,7 @@ class APIService {
         ? Uri.parse('$baseURL/admin/employees/$email/attendance?date=$date')
         : Uri.parse('$baseURL/admin/employees/$email/attendance');
 
-    final response = await _httpClient.get(uri);
+    final response = await _client.get(uri);
 
     if (response.statusCode == 200) {
       return jsonDecode(response.body) as Map<String, dynamic>;
@@ -317,7 +343,7 @@ class APIService {
     final uri = Uri.parse(
       '$baseURL/admin/events',
     ).replace(queryParameters: params);
-    final response = await _httpClient.get(uri);
+    final response = await _client.get(uri);
 
     if (response.statusCode == 200) {
       return jsonDecode(response.body) as List<dynamic>;
@@ -333,7 +359,7 @@ class APIService {
     required String eventType,
     String? targetDepartment,
   }) async {
-    final response = await _httpClient.post(
+    final response = await _client.post(
       Uri.parse('$baseURL/admin/events?admin_email=$adminEmail'),
       headers: {'Content-Type': 'application/json'},
       body: jsonEncode({
@@ -355,7 +381,7 @@ class APIService {
     int eventId,
     String adminEmail,
   ) async {
-    final response = await _httpClient.delete(
+    final response = await _client.delete(
       Uri.parse('$baseURL/admin/events/$eventId?admin_email=$adminEmail'),
     );
 